@@ -0,0 +1,288 @@
+"""Local on-disk caches used to avoid paying for the same search or LLM call twice."""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# the number of inserts after which the entries are counted again, to include the entries added by other processes
+_RECOUNT_INTERVAL = 1000
+
+
+class SQLiteCache:
+    """
+    A JSON key-value store in a local SQLite file with a time-to-live and size-bounded LRU eviction.
+
+    The connection is shared between threads (search queries run in worker threads), so every
+    statement runs under a lock. WAL mode lets several processes, such as parallel evaluation
+    runs, read and write the same file. The number of entries is tracked in memory rather than
+    counted on every insert, and recounted every few inserts to include other processes' writes.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=10000):
+        """
+        Args:
+            path: The path of the SQLite file. Missing parent directories are created
+            ttl: The number of seconds an entry stays valid. Entries never expire if not provided
+            max_entries: The maximum number of entries to keep before evicting the least recently used ones
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self._size = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self._inserts = 0
+
+    def get(self, key):
+        """
+        Obtain the value stored for the key, or None if it is missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                if row is not None:
+                    self._size -= self._connection.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Store a JSON-serializable value for the key, evicting the least recently used entries if the cache is full
+        """
+        now = time.time()
+        with self._lock:
+            exists = self._connection.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone() is not None
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._size += not exists
+            self._inserts += 1
+            if self._inserts % _RECOUNT_INTERVAL == 0:
+                self._size = self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if self._size > self.max_entries:
+                self._size -= self._connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                    (self._size - self.max_entries,),
+                ).rowcount
+
+    def clear(self):
+        """
+        Remove every entry and reset the hit and miss counters
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM cache")
+            self._size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    @property
+    def stats(self):
+        """
+        The number of cache hits and misses since the cache was opened
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SummaryCache:
+    """
+    A two-tier cache for LLM summaries: a bounded in-memory LRU tier in front of an optional SQLite tier.
+
+    Keys are content hashes (see summary_cache_key), so entries never go stale and need no time-to-live.
+    Async code uses aget and aset, which read and write the persistent tier in a worker thread.
+    """
+
+    def __init__(self, max_size=1024, persistent=None):
+        """
+        Args:
+            max_size: The maximum number of summaries kept in memory
+            persistent: The SQLiteCache used as the persistent tier. If not provided, summaries are only kept in memory
+        """
+        self.max_size = max_size
+        self.persistent = persistent
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Obtain the summary stored for the key, or None if neither tier has it
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            return value
+        return self._persistent_get(key)
+
+    async def aget(self, key):
+        """
+        Obtain the summary stored for the key without blocking the event loop on the persistent tier
+        """
+        value = self._memory_get(key)
+        if value is not None or self.persistent is None:
+            return value if value is not None else self._persistent_get(key)
+        return await asyncio.to_thread(self._persistent_get, key)
+
+    def _memory_get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+        return None
+
+    def _persistent_get(self, key):
+        value = self.persistent.get(key) if self.persistent is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        Store the summary in memory and in the persistent tier
+        """
+        with self._lock:
+            self._remember(key, value)
+        if self.persistent is not None:
+            self.persistent.set(key, value)
+
+    async def aset(self, key, value):
+        """
+        Store the summary in memory and in the persistent tier without blocking the event loop
+        """
+        with self._lock:
+            self._remember(key, value)
+        if self.persistent is not None:
+            await asyncio.to_thread(self.persistent.set, key, value)
+
+    def _remember(self, key, value):
+        """
+        Add the entry to the memory tier, evicting the least recently used entry if it is full. Must be called with the lock held.
+        """
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    @property
+    def stats(self):
+        """
+        The number of hits in each tier and the number of misses since the cache was created
+        """
+        return {"memory_hits": self.memory_hits, "persistent_hits": self.persistent_hits, "misses": self.misses}
+
+
+def summary_cache_key(model, prompt, content):
+    """
+    Computes the content hash that identifies a summary
+
+    Args:
+        model: The name of the model that writes the summary
+        prompt: The prompt template used for the summary, so editing the prompt invalidates old summaries
+        content: The content being summarized
+
+    Return:
+        A hex digest of the model, prompt template, and content
+    """
+    digest = hashlib.sha256()
+    for part in (model, prompt, content):
+        part = part.encode()
+        # prefix each part with its length so different splits of the same text cannot collide
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+_caches = {}
+_summary_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(path, ttl=None, max_entries=10000):
+    """
+    Obtain the process-wide cache stored at the given path, opening it on first use
+
+    Args:
+        path: The path of the SQLite file
+        ttl: The number of seconds an entry stays valid
+        max_entries: The maximum number of entries to keep
+
+    Return:
+        The cache for the path, updated with the given ttl and size limit
+    """
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = SQLiteCache(path, ttl=ttl, max_entries=max_entries)
+        cache.ttl = ttl
+        cache.max_entries = max_entries
+    return cache
+
+
+def get_summary_cache(max_size=1024, path=None, max_entries=100000):
+    """
+    Obtain the process-wide summary cache, with a persistent tier at the given path if provided
+
+    Args:
+        max_size: The maximum number of summaries kept in memory
+        path: The path of the SQLite file for the persistent tier
+        max_entries: The maximum number of summaries kept in the persistent tier
+
+    Return:
+        The summary cache for the path
+    """
+    persistent = get_cache(path, max_entries=max_entries) if path else None
+    with _caches_lock:
+        cache = _summary_caches.get(persistent.path if persistent else None)
+        if cache is None:
+            cache = SummaryCache(max_size, persistent)
+            _summary_caches[persistent.path if persistent else None] = cache
+        cache.max_size = max_size
+    return cache
+
+
+def close_caches():
+    """
+    Close every cache opened with get_cache or get_summary_cache and forget them
+    """
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.close()
+        _caches.clear()
+        _summary_caches.clear()
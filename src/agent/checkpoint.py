@@ -0,0 +1,331 @@
+"""Durable local checkpoints, so a thread that stops to ask for clarification can be resumed after a restart.
+
+SQLiteSaver stores the checkpoints of the graph in a local SQLite file in WAL mode. Compared with the
+in-memory saver it keeps the stored state small:
+
+- channel values are stored once per version, so a checkpoint only writes the channels that changed
+- transient channels (the search results and the sources sent to the summarizers) are not stored in the
+  checkpoints. They are only read within the run that wrote them, and are empty when an interrupted run is
+  resumed. The pending writes of a task keep them, since LangGraph does not run a task with stored writes again
+- threads that were not updated for longer than the time-to-live are deleted
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+TRANSIENT_CHANNELS = ("search_results", "source", "sources")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT, "
+    "type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+    "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))",
+    "CREATE TABLE IF NOT EXISTS blobs ("
+    "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, channel TEXT NOT NULL, version TEXT NOT NULL, "
+    "type TEXT NOT NULL, value BLOB, "
+    "PRIMARY KEY (thread_id, checkpoint_ns, channel, version))",
+    "CREATE TABLE IF NOT EXISTS writes ("
+    "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+    "idx INTEGER NOT NULL, channel TEXT NOT NULL, type TEXT, value BLOB, task_path TEXT NOT NULL DEFAULT '', "
+    "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))",
+    "CREATE TABLE IF NOT EXISTS threads (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at)",
+)
+
+
+class SQLiteSaver(BaseCheckpointSaver[str]):
+    """
+    A LangGraph checkpoint saver backed by a local SQLite file.
+
+    Like SQLiteCache, the connection is shared between threads and every statement runs under a lock.
+    The async methods run the sync ones in a worker thread, so they do not block the event loop while
+    another run holds the lock.
+    """
+
+    def __init__(self, path, ttl=None, transient_channels=TRANSIENT_CHANNELS, sweep_interval=60.0, serde=None):
+        """
+        Args:
+            path: The path of the SQLite file. Missing parent directories are created
+            ttl: The number of seconds after the last checkpoint of a thread before the thread is deleted. Threads are kept if not provided
+            transient_channels: The state channels whose values are not stored in the checkpoints
+            sweep_interval: The minimum number of seconds between two sweeps for expired threads
+            serde: The serializer of the checkpoints. Defaults to the LangGraph serializer
+        """
+        super().__init__(serde=serde)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.transient_channels = frozenset(transient_channels)
+        self.sweep_interval = sweep_interval
+        # shared with the copies LangGraph makes when it compiles a graph, so they count the same writes
+        self.counters = {"checkpoints": 0, "bytes_written": 0, "write_time": 0.0}
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+        self.delete_expired()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            start = time.perf_counter()
+            self._connection.execute("BEGIN")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            self.counters["write_time"] += time.perf_counter() - start
+
+    def _dump(self, value):
+        kind, data = self.serde.dumps_typed(value)
+        self.counters["bytes_written"] += len(data)
+        return kind, data
+
+    def get_tuple(self, config):
+        """
+        Obtain the checkpoint with the checkpoint_id of the config, or the latest checkpoint of the thread if it has none
+
+        Return:
+            The checkpoint tuple, or None if the thread has no such checkpoint
+        """
+        return next(self.list(config, limit=1), None)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """
+        List checkpoints, latest first
+
+        Args:
+            config: The config with the thread_id, and optionally the checkpoint_ns and checkpoint_id, of the checkpoints. Every thread if None
+            filter: Metadata values the checkpoints must have
+            before: Only list checkpoints created before the checkpoint of this config
+            limit: The maximum number of checkpoints
+
+        Return:
+            An iterator of checkpoint tuples
+        """
+        clauses, params = [], []
+        configurable = (config or {}).get("configurable", {})
+        for column, value in (
+            ("thread_id", configurable.get("thread_id")),
+            ("checkpoint_ns", configurable.get("checkpoint_ns")),
+            ("checkpoint_id", get_checkpoint_id(config) if config else None),
+        ):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # checkpoint ids are time-ordered, and metadata filters are applied after loading, so only unfiltered listings can be limited in SQL
+        order = "ORDER BY checkpoint_id DESC" + (f" LIMIT {int(limit)}" if limit is not None and not filter else "")
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                f"FROM checkpoints {where} {order}", params,
+            ).fetchall()
+
+        for thread_id, checkpoint_ns, checkpoint_id, parent_id, kind, data, metadata_kind, metadata_data in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((metadata_kind, metadata_data))
+            if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            yield self._load_tuple(thread_id, checkpoint_ns, checkpoint_id, parent_id, (kind, data), metadata)
+
+    def _load_tuple(self, thread_id, checkpoint_ns, checkpoint_id, parent_id, data, metadata):
+        checkpoint = self.serde.loads_typed(data)
+        versions = checkpoint["channel_versions"]
+        with self._lock:
+            blobs = self._connection.execute(
+                "SELECT channel, type, value FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+                f"AND (channel, version) IN (VALUES {','.join(['(?, ?)'] * len(versions))})",
+                (thread_id, checkpoint_ns, *(str(part) for item in versions.items() for part in item)),
+            ).fetchall() if versions else []
+            writes = self._connection.execute(
+                "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+                "ORDER BY task_path, task_id, idx",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+
+        values = {
+            channel: self.serde.loads_typed((kind, value))
+            for channel, kind, value in blobs
+            if kind != "empty"
+        }
+        parent_config = None
+        if parent_id:
+            parent_config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=metadata,
+            parent_config=parent_config,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((kind, value))) for task_id, channel, kind, value in writes],
+        )
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        """
+        Store a checkpoint with the channel values that changed since its parent
+
+        Return:
+            The config of the stored checkpoint
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        checkpoint = dict(checkpoint)
+        values = checkpoint.pop("channel_values")
+
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self._dump(values[channel]) if channel in values and channel not in self.transient_channels else ("empty", None)))
+            for channel, version in new_versions.items()
+        ]
+        row = (
+            thread_id, checkpoint_ns, checkpoint["id"], parent_id,
+            *self._dump(checkpoint), *self._dump(get_checkpoint_metadata(config, metadata)),
+        )
+        with self._transaction() as connection:
+            connection.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            connection.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            connection.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+        self.counters["checkpoints"] += 1
+
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            self.delete_expired()
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        """
+        Store the writes of a task, so a run that stops in the middle of a step does not run the task again
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for i, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, i)
+            # special writes (errors, interrupts) replace earlier ones, regular writes are only stored once
+            rows.append((idx < 0, (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *self._dump(value), task_path)))
+        with self._transaction() as connection:
+            for replace, row in rows:
+                connection.execute(
+                    f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row
+                )
+
+    def delete_thread(self, thread_id):
+        """
+        Delete every checkpoint and write of a thread
+        """
+        with self._transaction() as connection:
+            for table in ("checkpoints", "blobs", "writes", "threads"):
+                connection.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def delete_expired(self):
+        """
+        Delete the threads whose last checkpoint is older than the time-to-live, with their checkpoints and writes
+
+        Return:
+            The number of deleted threads
+        """
+        self._last_sweep = time.monotonic()
+        if self.ttl is None:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._transaction() as connection:
+            expired = "SELECT thread_id FROM threads WHERE updated_at < ?"
+            for table in ("checkpoints", "blobs", "writes"):
+                connection.execute(f"DELETE FROM {table} WHERE thread_id IN ({expired})", (cutoff,))
+            return connection.execute("DELETE FROM threads WHERE updated_at < ?", (cutoff,)).rowcount
+
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current, channel):
+        """
+        Versions are zero-padded counters with a random suffix, so they sort as strings, as in the in-memory saver
+        """
+        number = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{number + 1:032}.{random.random():016}"
+
+    @property
+    def stats(self):
+        """
+        The number of stored checkpoints, serialized bytes and seconds spent writing since the file was opened
+        """
+        return dict(self.counters)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_checkpointers = {}
+_checkpointers_lock = threading.Lock()
+
+
+def get_checkpointer(path, ttl=None):
+    """
+    Obtain the process-wide checkpoint saver stored at the given path, opening it on first use
+
+    Args:
+        path: The path of the SQLite file
+        ttl: The number of seconds an idle thread is kept
+
+    Return:
+        The checkpoint saver for the path, updated with the given ttl
+    """
+    path = os.path.abspath(path)
+    with _checkpointers_lock:
+        saver = _checkpointers.get(path)
+        if saver is None:
+            saver = _checkpointers[path] = SQLiteSaver(path, ttl=ttl)
+        saver.ttl = ttl
+    return saver
+
+
+def close_checkpointers():
+    """
+    Close every checkpoint saver opened with get_checkpointer and forget them
+    """
+    with _checkpointers_lock:
+        for saver in _checkpointers.values():
+            saver.close()
+        _checkpointers.clear()
@@ -0,0 +1,175 @@
+"""Token-aware splitting of long search result content for the summarize node.
+
+Token counts use the model's tiktoken encoding when it is available. When the encoding cannot be
+loaded (for example offline, since tiktoken downloads encodings on first use), sizes are estimated
+from the number of characters instead.
+"""
+
+import threading
+from collections import OrderedDict
+from functools import cache
+
+import numpy as np
+
+from agent.ranking import bm25_scores
+
+_CHARS_PER_TOKEN = 4 # rough size of a token in English text, used when no tokenizer is available
+_MAX_TOKEN_COUNTS = 1024 # number of token counts kept, least recently used first out
+
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+@cache
+def get_encoding(model):
+    """
+    Obtain the tiktoken encoding for the model, or None if it cannot be loaded
+
+    Args:
+        model: The name of the OpenAI GPT model
+
+    Return:
+        The tiktoken encoding, falling back to o200k_base for unknown models
+    """
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text, model):
+    """
+    Counts the tokens in the text for the model. Results are cached by the hash and length of the text,
+    so repeated sources are only tokenized once without the cache keeping the texts themselves in memory
+
+    Args:
+        text: The text to measure
+        model: The name of the OpenAI GPT model
+
+    Return:
+        The number of tokens, or an estimate based on the number of characters if no tokenizer is available
+    """
+    key = (model, hash(text), len(text))
+    with _token_counts_lock:
+        if key in _token_counts:
+            _token_counts.move_to_end(key)
+            return _token_counts[key]
+    count = _count_tokens(text, model)
+    with _token_counts_lock:
+        _token_counts[key] = count
+        if len(_token_counts) > _MAX_TOKEN_COUNTS:
+            _token_counts.popitem(last=False)
+    return count
+
+
+def clear_token_counts():
+    """
+    Forget the cached token counts
+    """
+    with _token_counts_lock:
+        _token_counts.clear()
+
+
+def _count_tokens(text, model):
+    """
+    Counts the tokens in the text without caching, used for the many short lines of a source
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // _CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _split_long_paragraph(paragraph, max_tokens, model):
+    """
+    Splits a line that exceeds the budget on its own into windows of at most max_tokens tokens
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        size = max_tokens * _CHARS_PER_TOKEN
+        return [paragraph[i:i + size] for i in range(0, len(paragraph), size)]
+    tokens = encoding.encode(paragraph, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+
+
+def split_into_chunks(text, max_tokens, model):
+    """
+    Splits text into chunks of at most max_tokens tokens, keeping lines together where possible
+
+    Args:
+        text: The content of a search result
+        max_tokens: The maximum number of tokens in each chunk
+        model: The name of the OpenAI GPT model
+
+    Return:
+        The list of chunks in their original order
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for paragraph in text.splitlines():
+        if not paragraph.strip():
+            continue
+        tokens = _count_tokens(paragraph, model)
+        if tokens > max_tokens:
+            pieces = _split_long_paragraph(paragraph, max_tokens, model)
+        else:
+            pieces = [paragraph]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else _count_tokens(piece, model)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def trim_lines(text, max_tokens, model):
+    """
+    Fits text in a token budget by dropping whole lines, so every line that is kept stays intact
+
+    Args:
+        text: The text, such as a digest with one point and its source per line
+        max_tokens: The maximum number of tokens of the result
+        model: The name of the OpenAI GPT model
+
+    Return:
+        The lines that fit in the budget, in their original order. Lines are kept from the start, and a line that does not fit is skipped in favor of shorter later lines
+    """
+    kept = []
+    total = 0
+    for line in text.splitlines():
+        # count the line break as well, so the joined lines stay within the budget
+        tokens = _count_tokens(line + "\n", model)
+        if total + tokens <= max_tokens:
+            kept.append(line)
+            total += tokens
+    return "\n".join(kept)
+
+
+def select_relevant_chunks(chunks, query, max_chunks):
+    """
+    Keeps the chunks that are most relevant to the query according to BM25
+
+    Args:
+        chunks: The chunks of a search result
+        query: The research topic or search query the chunks should be relevant to
+        max_chunks: The maximum number of chunks to keep
+
+    Return:
+        The most relevant chunks in their original order
+    """
+    if len(chunks) <= max_chunks:
+        return chunks
+    scores = bm25_scores(chunks, query)
+    ranked = np.argsort(-scores, kind="stable")[:max_chunks]
+    return [chunks[i] for i in sorted(ranked)]
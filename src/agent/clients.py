@@ -0,0 +1,181 @@
+"""Process-wide registry of reusable LLM and search API clients.
+
+Creating a `ChatOpenAI` or `TavilyClient` for every call pays for object setup and, without a shared
+HTTP client, for new connections and TLS handshakes. The clients here are created once per
+model name / API key / structured-output schema and share one connection pool per event loop.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+
+import httpx
+from langchain_openai import ChatOpenAI
+from requests.adapters import HTTPAdapter
+from tavily import TavilyClient
+
+_lock = threading.Lock()
+
+# connection pool limits shared by all clients, overridable with configure_clients()
+_pool_limits = {
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", 100)),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)),
+}
+
+_http_client = None # shared httpx.Client for sync calls
+_async_http_clients = weakref.WeakKeyDictionary() # event loop -> shared httpx.AsyncClient
+_llms = {} # (model, api key, base url, structure) -> chat model for sync calls
+_async_llms = weakref.WeakKeyDictionary() # event loop -> {(model, api key, base url, structure) -> chat model}
+_search_clients = {} # api key -> TavilyClient
+
+
+def configure_clients(max_connections=None, max_keepalive_connections=None):
+    """
+    Sets the connection pool limits used by the shared HTTP clients. Existing clients are closed so the new limits apply to the next call.
+
+    Args:
+        max_connections: The maximum number of concurrent connections per pool
+        max_keepalive_connections: The maximum number of idle connections kept open per pool
+    """
+    close_clients()
+    with _lock:
+        if max_connections is not None:
+            _pool_limits["max_connections"] = max_connections
+        if max_keepalive_connections is not None:
+            _pool_limits["max_keepalive_connections"] = max_keepalive_connections
+
+
+def _get_http_client():
+    """
+    Obtain the shared httpx client for sync calls, creating it on first use. Must be called with the lock held.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.Client(limits=httpx.Limits(**_pool_limits), timeout=None)
+    return _http_client
+
+
+def _get_async_http_client(loop):
+    """
+    Obtain the shared httpx client for async calls on the given event loop. Must be called with the lock held.
+
+    Async connections are bound to the event loop that opened them, so each loop gets its own pool.
+    """
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(limits=httpx.Limits(**_pool_limits), timeout=None)
+        _async_http_clients[loop] = client
+    return client
+
+
+def get_llm(model, structure=None):
+    """
+    Obtain a reusable chat model for the given model name and structured output schema
+
+    Args:
+        model: The name of the OpenAI GPT model to use
+        structure: The class that defines the fields of the structured output. If not provided, the model returns unstructured text
+
+    Return:
+        The chat model. If a structured output schema is provided, the model returns a dictionary with the "raw" message and the "parsed" object
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    base_url = os.getenv("OPENAI_BASE_URL")
+    key = (model, api_key, base_url, structure)
+
+    with _lock:
+        llms = _llms if loop is None else _async_llms.setdefault(loop, {})
+        if key in llms:
+            return llms[key]
+
+        # reuse the plain chat model when only the structured output schema differs
+        base_key = key[:-1] + (None,)
+        llm = llms.get(base_key)
+        if llm is None:
+            llm = ChatOpenAI(
+                model=model,
+                api_key=api_key,
+                base_url=base_url,
+                stream_usage=True,
+                http_client=_get_http_client(),
+                http_async_client=_get_async_http_client(loop) if loop else None,
+            )
+            llms[base_key] = llm
+
+        if structure:
+            # keep the raw message so its token usage can be recorded
+            llm = llm.with_structured_output(structure, include_raw=True)
+            llms[key] = llm
+
+    return llm
+
+
+def get_search_client(api_key=None):
+    """
+    Obtain a reusable Tavily search client whose HTTP session keeps connections open between queries
+
+    Args:
+        api_key: The Tavily API key. Defaults to the TAVILY_API_KEY environment variable
+
+    Return:
+        The Tavily client
+    """
+    api_key = api_key or os.getenv("TAVILY_API_KEY")
+
+    with _lock:
+        client = _search_clients.get(api_key)
+        if client is None:
+            client = TavilyClient(api_key)
+            session = getattr(client, "session", None)
+            if session is not None:
+                adapter = HTTPAdapter(
+                    pool_connections=_pool_limits["max_keepalive_connections"],
+                    pool_maxsize=_pool_limits["max_connections"],
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+            _search_clients[api_key] = client
+
+    return client
+
+
+def close_clients():
+    """
+    Close the shared sync HTTP clients and forget every cached client. Registered to run at interpreter exit.
+
+    Async HTTP clients are dropped without awaiting their shutdown; use aclose_clients() from a running event loop to close them cleanly.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        for client in _search_clients.values():
+            if hasattr(client, "close"):
+                client.close()
+        _search_clients.clear()
+        _async_http_clients.clear()
+        _async_llms.clear()
+        _llms.clear()
+
+
+async def aclose_clients():
+    """
+    Close the async HTTP client of the running event loop, then every other shared client
+    """
+    with _lock:
+        client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+        _async_llms.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    close_clients()
+
+
+atexit.register(close_clients)
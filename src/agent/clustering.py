@@ -0,0 +1,76 @@
+"""Grouping of research notes by subtopic, used to compress the notes before the final report.
+
+Notes are compared by the cosine similarity of their TF-IDF vectors and grouped with spherical
+k-means. The initial centers are picked farthest-first, so the result is deterministic.
+"""
+
+import numpy as np
+
+from agent.ranking import tokenize
+
+
+def tfidf_vectors(texts):
+    """
+    Converts texts into L2-normalized TF-IDF vectors
+
+    Args:
+        texts: The list of texts
+
+    Return:
+        A numpy array with one row per text
+    """
+    documents = [tokenize(text) for text in texts]
+    vocabulary = {term: i for i, term in enumerate(sorted({t for d in documents for t in d}))}
+    tf = np.zeros((len(texts), max(1, len(vocabulary))))
+    for row, document in enumerate(documents):
+        for term in document:
+            tf[row, vocabulary[term]] += 1
+
+    df = (tf > 0).sum(axis=0)
+    vectors = np.log1p(tf) * np.log((1 + len(texts)) / (1 + df))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def cluster_notes(notes, max_clusters, iterations=20):
+    """
+    Groups notes about the same subtopic together
+
+    Args:
+        notes: The list of notes, each with a title and text
+        max_clusters: The maximum number of groups
+        iterations: The maximum number of k-means iterations
+
+    Return:
+        The list of groups, each a list of note indices in their original order. Groups are ordered by their first note
+    """
+    k = min(max_clusters, len(notes))
+    if k <= 1:
+        return [list(range(len(notes)))] if notes else []
+
+    vectors = tfidf_vectors([note.title + '\n' + note.text for note in notes])
+
+    # farthest-first initialization: each new center is the note least similar to the centers picked so far
+    centers = [0]
+    similarity = vectors @ vectors[0]
+    for _ in range(1, k):
+        centers.append(int(np.argmin(similarity)))
+        similarity = np.maximum(similarity, vectors @ vectors[centers[-1]])
+    centroids = vectors[centers]
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(vectors @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = vectors[labels == c]
+            if len(members):
+                mean = members.sum(axis=0)
+                centroids[c] = mean / max(np.linalg.norm(mean), 1e-12)
+
+    groups = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(int(label), []).append(i)
+    return sorted(groups.values(), key=lambda group: group[0])
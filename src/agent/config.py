@@ -1,11 +1,13 @@
 import os
-from enum import Enum
 from dataclasses import dataclass, fields
-from typing import Any, Optional, Dict, Literal
+from enum import Enum
+from functools import cache, lru_cache
+from typing import Any, Dict, Literal, Optional, get_args, get_origin
 
 from langchain_core.runnables import RunnableConfig
 
-@dataclass(kw_only=True)
+
+@dataclass(kw_only=True, frozen=True)
 class Configuration:
     
     model: str = 'gpt-4.1-nano' # The OpenAI model to use
@@ -13,18 +15,143 @@ class Configuration:
     num_queries: int = 3 # Number of queries to generate
     num_results_per_query: int = 2 # Maximum number of results to fetch per query
     max_followup_retries: int = 0 # Maximum number of times to followup
+    adaptive_depth: bool = False # Choose the breadth of each round from the topic complexity rated during query generation, with num_queries and num_results_per_query as the maximum, and stop following up once new notes add little novel content
+    min_novelty: float = 0.2 # With adaptive_depth, minimum fraction of new content in the notes of a follow-up round to keep following up
+    max_run_tokens: int = 0 # Maximum number of LLM tokens for a run. No follow-up round starts that is expected to exceed it. Unlimited if 0
+    deadline: float = 0.0 # Maximum number of seconds from the start of a run to the end of the final report. Stages that would run past it are cut short. Unlimited if 0
+    deadline_report_share: float = 0.3 # Fraction of the deadline kept for writing the final report
+    speculative_queries: bool = False # Generate the search queries while the clarification check runs, and discard them if clarification is needed
+    speculative_search: bool = False # With speculative_queries, also run the first search round while the clarification check runs
+    search_concurrency: int = 5 # Maximum number of search queries to run at the same time
+    search_timeout: float = 30.0 # Maximum number of seconds to wait for the results of a single search query
+    search_backend: Literal['tavily', 'local'] = 'tavily' # Search the web with the Tavily API, or a full-text index of local documents
+    local_documents_path: str = '' # Directory of text, Markdown and HTML documents searched by the local backend. The index is built or rebuilt from it when they change
+    local_index_path: str = '.cache/index' # Directory of the local search index
+    search_cache: bool = False # Reuse search results stored in a local SQLite cache
+    search_cache_refresh: bool = False # Ignore cached search results and store fresh ones
+    search_cache_path: str = '.cache/search.sqlite' # Path of the search cache file
+    search_cache_ttl: float = 86400.0 # Number of seconds a cached search result stays valid
+    search_cache_max_entries: int = 10000 # Maximum number of cached queries before the least recently used ones are evicted
+    summary_cache: bool = True # Reuse summaries of content that was already summarized with the same model and prompt
+    summary_cache_size: int = 1024 # Maximum number of summaries kept in memory
+    summary_cache_path: str = '' # Path of a SQLite file to keep summaries across runs. Summaries are only kept in memory if not set
+    summary_cache_max_entries: int = 100000 # Maximum number of summaries kept in the SQLite file
+    near_duplicate_threshold: float = 0.9 # Estimated content similarity at which a search result is dropped as a near-duplicate. Values above 1 disable it
+    max_source_tokens: int = 8000 # Maximum number of tokens of search result content sent in a single summarize call
+    max_source_chunks: int = 4 # Maximum number of chunks summarized for a search result that exceeds max_source_tokens. The most relevant chunks are kept
+    chunk_strategy: Literal['map_reduce', 'truncate'] = 'map_reduce' # Summarize the chunks of a long search result in parallel and merge them, or only keep its most relevant parts
+    summarize_mode: Literal['per_source', 'batch'] = 'per_source' # Summarize each search result in its own LLM call, or pack short search results into multi-source calls, for fewer requests in bulk jobs where latency matters less
+    batch_max_sources: int = 8 # Maximum number of search results packed into one batch summarize call. Together they stay within max_source_tokens
+    max_sources: int = 0 # Maximum number of search results to summarize per round, keeping the most relevant ones. All results are summarized if 0
+    relevance_threshold: float = 0.0 # Minimum relevance score relative to the best search result, between 0 and 1, for a result to be summarized
+    relevant_passages: int = 0 # Number of most relevant passages to keep from each search result. The whole content is kept if 0
+    report_notes_budget: int = 0 # Maximum number of tokens of research notes sent to the final report. Notes over the budget are grouped by subtopic and merged into section digests. Unlimited if 0
+    max_note_sections: int = 8 # Maximum number of subtopic section digests the notes are merged into when they exceed report_notes_budget
+    max_concurrent_llm_calls: int = 16 # Maximum number of LLM calls running at the same time in this process. Unlimited if 0
+    requests_per_minute: int = 0 # Maximum number of LLM calls started per minute. Unlimited if 0
+    tokens_per_minute: int = 0 # Maximum number of prompt tokens sent to the LLM per minute. Unlimited if 0
+    coalesce_requests: bool = True # Share search and summarize calls with identical calls already in flight in this process, such as concurrent runs on overlapping topics
+    max_rate_limit_retries: int = 5 # Maximum number of times an LLM call is retried after a rate limit error
+    metrics_path: str = '' # JSON lines file that receives the latency, token and cost metrics of every node. Metrics are only logged if empty
+    checkpoint_path: str = '' # SQLite file that stores the state of each thread, so a run waiting for clarification survives a restart. Graphs from make_graph are compiled without a checkpointer if empty
+    checkpoint_ttl: float = 604800.0 # Number of seconds a thread is kept after its last checkpoint
+
+    def __post_init__(self) -> None:
+        """Convert every value to the type of its field, and reject values that cannot be converted."""
+        for f in fields(self):
+            object.__setattr__(self, f.name, _coerce(f.name, f.type, getattr(self, f.name)))
+        if self.deadline_report_share >= 1:
+            raise ValueError(f"Invalid value for deadline_report_share: {self.deadline_report_share!r} (must be below 1)")
+        for name in _FRACTIONS:
+            if getattr(self, name) > 1:
+                raise ValueError(f"Invalid value for {name}: {getattr(self, name)!r} (must be between 0 and 1)")
+        if not self.model.strip():
+            raise ValueError(f"Invalid value for model: {self.model!r} (must not be empty)")
 
     @classmethod
     def from_runnable_config(
         cls, config: Optional[RunnableConfig] = None
     ) -> "Configuration":
-        """Create a Configuration instance from a RunnableConfig."""
+        """Create a Configuration instance from a RunnableConfig.
+
+        Environment variables named after the upper-case field override the configurable values.
+        Instances are cached per distinct configurable values, so the nodes of a run (including every
+        summarize call of the fan-out) share one resolved configuration. The environment is read once
+        per process; call clear_configuration_cache() after changing it.
+        """
         configurable = (
             config["configurable"] if config and "configurable" in config else {}
         )
-        values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
-            for f in fields(cls)
-            if f.init
-        }
-        return cls(**{k: v for k, v in values.items() if v})
+        values = tuple(
+            (name, configurable[name]) for name in _field_names(cls)
+            if configurable.get(name) is not None
+        )
+        try:
+            return _resolve(cls, values)
+        except TypeError: # unhashable configurable values cannot be cached
+            return _resolve.__wrapped__(cls, values)
+
+
+_FRACTIONS = ("min_novelty", "relevance_threshold")
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+def _coerce(name: str, annotation: Any, value: Any) -> Any:
+    """Convert a configuration value, such as a string from an environment variable, to the type of its field."""
+    try:
+        if get_origin(annotation) is Literal:
+            if value not in get_args(annotation):
+                raise ValueError
+            return value
+        if annotation is bool:
+            if isinstance(value, str) and value.strip().lower() in _TRUE + _FALSE:
+                return value.strip().lower() in _TRUE
+            if value not in (True, False):
+                raise ValueError
+            return bool(value)
+        if annotation is int:
+            if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            value = int(value)
+        elif annotation is float:
+            if isinstance(value, bool):
+                raise ValueError
+            value = float(value)
+        elif annotation is str:
+            if not isinstance(value, str):
+                raise ValueError
+            return value
+        else:
+            return value
+    except (TypeError, ValueError):
+        expected = getattr(annotation, "__name__", None) or " or ".join(repr(a) for a in get_args(annotation))
+        raise ValueError(f"Invalid value for {name}: {value!r} (expected {expected})") from None
+    if value < 0:
+        raise ValueError(f"Invalid value for {name}: {value!r} (must not be negative)")
+    return value
+
+
+@cache
+def _field_names(cls: type) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(cls) if f.init)
+
+
+@cache
+def _environment(cls: type) -> Dict[str, str]:
+    """Read the environment variables that override configuration fields."""
+    return {
+        name: os.environ[name.upper()] for name in _field_names(cls)
+        if os.environ.get(name.upper())
+    }
+
+
+@lru_cache(maxsize=256)
+def _resolve(cls: type, values: tuple) -> Configuration:
+    return cls(**{**dict(values), **_environment(cls)})
+
+
+def clear_configuration_cache() -> None:
+    """Forget the cached configurations and read the environment again on the next resolution."""
+    _resolve.cache_clear()
+    _environment.cache_clear()
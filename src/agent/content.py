@@ -0,0 +1,192 @@
+"""Side store for the raw page content of search results, so it stays out of the graph state.
+
+The search nodes put each page's content in the process-wide ContentStore and keep only a
+'content_ref' handle (the SHA-256 hash of the content) in the search results. The state, the
+Send payloads of the summarize nodes, and therefore every checkpoint and state snapshot only carry
+the handles. A page is held once however many results reference it, and it is removed when the last
+reference is released: when it was summarized, or when its result was dropped before that.
+
+A run that stops before summarizing its pages, such as a cancelled request or a thread waiting at an
+interrupt that is never resumed, would hold them forever, so texts that were not referenced again for
+CONTENT_TTL seconds are evicted as well. Nodes that fail while holding pages release them.
+
+The store only lives as long as the process, so handles restored from a checkpoint written by an earlier
+process, or replayed from an earlier step, may no longer be stored. The nodes leave those results out.
+"""
+
+import hashlib
+import threading
+import time
+
+CONTENT_TTL = 3600.0 # Number of seconds a text is kept after its last reference was added
+
+
+class ContentStore:
+    """
+    An in-memory, reference-counted store of texts keyed by their hash, whose texts expire after a time-to-live
+    """
+
+    def __init__(self, ttl=None, sweep_interval=60.0):
+        """
+        Args:
+            ttl: The number of seconds a text is kept after its last reference was added, even if it is still referenced. Texts are kept until released if not provided
+            sweep_interval: The minimum number of seconds between two sweeps for expired texts
+        """
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._texts = {}
+        self._references = {}
+        self._stored_at = {}
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    def put(self, text):
+        """
+        Store a text, or add a reference to it if it is already stored
+
+        Return:
+            The handle of the text
+        """
+        ref = hashlib.sha256(text.encode()).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            self._texts[ref] = text
+            self._references[ref] = self._references.get(ref, 0) + 1
+            self._stored_at[ref] = now
+            if self.ttl is not None and now - self._last_sweep > self.sweep_interval:
+                self._evict(now - self.ttl)
+        return ref
+
+    def _evict(self, cutoff):
+        """
+        Remove the texts stored before the cutoff with every reference to them. Must be called with the lock held.
+        """
+        self._last_sweep = time.monotonic()
+        for ref in [ref for ref, stored_at in self._stored_at.items() if stored_at < cutoff]:
+            del self._texts[ref], self._references[ref], self._stored_at[ref]
+
+    def get(self, ref):
+        """
+        Obtain the text of a handle. Raises KeyError if every reference to it was released
+        """
+        with self._lock:
+            if ref not in self._texts:
+                raise KeyError(f"Content {ref} is no longer stored")
+            return self._texts[ref]
+
+    def release(self, ref):
+        """
+        Remove a reference to a text, and the text itself once nothing references it
+        """
+        with self._lock:
+            count = self._references.get(ref, 0) - 1
+            if count > 0:
+                self._references[ref] = count
+            else:
+                self._references.pop(ref, None)
+                self._texts.pop(ref, None)
+                self._stored_at.pop(ref, None)
+
+    def __contains__(self, ref):
+        with self._lock:
+            return ref in self._texts
+
+    def clear(self):
+        with self._lock:
+            self._texts.clear()
+            self._references.clear()
+            self._stored_at.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._texts)
+
+    @property
+    def size(self):
+        """
+        The number of characters stored
+        """
+        with self._lock:
+            return sum(len(text) for text in self._texts.values())
+
+
+_store = ContentStore(ttl=CONTENT_TTL)
+
+
+def get_content_store():
+    """
+    Obtain the process-wide content store
+    """
+    return _store
+
+
+def store_contents(sources):
+    """
+    Move the content of search results into the content store
+
+    Args:
+        sources: The list of search results, containing the raw content
+
+    Return:
+        The search results with a 'content_ref' handle in place of the content
+    """
+    return [
+        {**{k: v for k, v in s.items() if k != 'content'}, 'content_ref': _store.put(s['content'])}
+        for s in sources
+    ]
+
+
+def load_content(source):
+    """
+    Obtain the raw content of a search result that holds a handle. Content held in the search result itself is returned as is
+    """
+    if 'content_ref' not in source:
+        return source['content']
+    return _store.get(source['content_ref'])
+
+
+def stored_sources(sources):
+    """
+    Keep the search results whose content can still be read
+
+    Args:
+        sources: The list of search results, containing the raw content or a 'content_ref' handle
+
+    Return:
+        The search results whose content is held in the result or in the content store, and the number of the others
+    """
+    stored = [s for s in sources if 'content_ref' not in s or s['content_ref'] in _store]
+    return stored, len(sources) - len(stored)
+
+
+def release_contents(sources):
+    """
+    Release the content of search results that will not be read again
+    """
+    for s in sources:
+        if 'content_ref' in s:
+            _store.release(s['content_ref'])
+
+
+def select_contents(sources, select):
+    """
+    Apply a selection that reads the content of search results to results that hold handles. The content of dropped results is released,
+    and the content of every result if the selection fails
+
+    Args:
+        sources: The list of search results, containing a 'content_ref' handle
+        select: A function that takes the search results with their content and returns the kept ones
+
+    Return:
+        The kept search results, with handles, in the order returned by the selection
+    """
+    loaded = [{**s, 'content': load_content(s)} for s in sources]
+    handles = {id(s): source for s, source in zip(loaded, sources)}
+    try:
+        kept = [handles[id(s)] for s in select(loaded)]
+    except BaseException:
+        release_contents(sources)
+        raise
+    kept_ids = {id(source) for source in kept}
+    release_contents([source for source in sources if id(source) not in kept_ids])
+    return kept
@@ -0,0 +1,115 @@
+"""Deduplication of search results before they are sent to the summarize node.
+
+Sources are dropped when their URL was already seen in this round, when an earlier round
+already summarized them, or when their content is a near-duplicate of a source that is kept.
+Near-duplicates are detected with MinHash signatures over word shingles.
+"""
+
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ref_src")
+
+_NUM_PERMUTATIONS = 64
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0)
+# coefficients of the hash functions (a * x + b) % prime, fixed so signatures are reproducible
+_A = _rng.integers(1, 1 << 32, size=_NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, size=_NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_url(url):
+    """
+    Normalizes a URL so different spellings of the same page compare equal
+
+    Args:
+        url: The URL of a search result
+
+    Return:
+        The URL with a lowercase host without "www.", no fragment, no trailing slash, and no tracking parameters
+    """
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urlunsplit(("", host, parts.path.rstrip("/"), urlencode(query), ""))
+
+
+def shingles(text, size=5):
+    """
+    Converts text into the set of hashed word n-grams (shingles) used to compare content
+
+    Args:
+        text: The content of a search result
+        size: The number of words in each shingle
+
+    Return:
+        A numpy array of unique 32-bit shingle hashes
+    """
+    words = text.lower().split()
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    hashes = {zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def minhash_signature(text):
+    """
+    Computes the MinHash signature of the text, where the fraction of equal positions between two signatures estimates the Jaccard similarity of their shingles
+
+    Args:
+        text: The content of a search result
+
+    Return:
+        A numpy array with one minimum hash per permutation
+    """
+    values = shingles(text)
+    # the products stay below 2^64 because both factors are below 2^32
+    hashed = (values[:, None] * _A[None, :] + _B[None, :]) % np.uint64(_PRIME)
+    return hashed.min(axis=0)
+
+
+def deduplicate_sources(sources, seen_urls=(), threshold=0.9):
+    """
+    Removes search results that would be summarized more than once
+
+    Args:
+        sources: The list of search results, containing the query, title, url, and raw content
+        seen_urls: The normalized URLs of sources that were already summarized in earlier rounds
+        threshold: The estimated content similarity at or above which a source is dropped as a near-duplicate of an earlier source. Values above 1 disable near-duplicate detection
+
+    Return:
+        The list of sources to summarize in their original order, and a dictionary counting the dropped sources by reason
+    """
+    seen_urls = set(seen_urls)
+    round_urls = set()
+    signatures = []
+    kept = []
+    stats = {"duplicate_urls": 0, "previously_summarized": 0, "near_duplicates": 0}
+
+    for source in sources:
+        url = normalize_url(source['url'])
+        if url in seen_urls:
+            stats["previously_summarized"] += 1
+            continue
+        if url in round_urls:
+            stats["duplicate_urls"] += 1
+            continue
+
+        if threshold <= 1:
+            signature = minhash_signature(source['content'])
+            if any(np.mean(signature == other) >= threshold for other in signatures):
+                stats["near_duplicates"] += 1
+                continue
+            signatures.append(signature)
+
+        round_urls.add(url)
+        kept.append(source)
+
+    return kept, stats
@@ -0,0 +1,137 @@
+"""Adaptive research depth and the run deadline.
+
+With adaptive_depth, the breadth of each round follows the complexity of its topic, which the LLM rates
+along with the search queries, and follow-up rounds stop once the notes of a round add little content that
+earlier notes did not already cover. Independently of it, max_run_tokens and the deadline limit the
+follow-up rounds: a round only starts if the rounds so far suggest it fits in the remaining budget.
+
+The deadline counts from the start of the run, and the last deadline_report_share of it is kept for the
+final report. Every research stage is cut short when its share runs out, and the final report keeps what
+was written by the deadline, so a run always ends on time.
+"""
+
+import asyncio
+import math
+import time
+
+import numpy as np
+
+from agent.dedupe import shingles
+
+
+def research_time_left(started_at, configurable):
+    """
+    The number of seconds left for the research stages of the run, before the time kept for the final report
+
+    Return:
+        The number of seconds, which is negative once the time is up, or None without a deadline
+    """
+    if not configurable.deadline or not started_at:
+        return None
+    research_time = configurable.deadline * (1 - configurable.deadline_report_share)
+    return started_at + research_time - time.time()
+
+
+def report_time_left(started_at, configurable):
+    """
+    The number of seconds left until the deadline of the run, or None without a deadline
+    """
+    if not configurable.deadline or not started_at:
+        return None
+    return started_at + configurable.deadline - time.time()
+
+
+async def within(awaitable, seconds, default=None):
+    """
+    Await a result for at most the given number of seconds
+
+    Args:
+        awaitable: The coroutine or task to await
+        seconds: The number of seconds, or None to wait for as long as it takes
+        default: The value returned if the time runs out
+
+    Return:
+        The result, or the default if the time ran out. The awaitable is cancelled in that case
+    """
+    if seconds is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, max(0.0, seconds))
+    except asyncio.TimeoutError:
+        return default
+
+
+def query_breadth(complexity, configurable):
+    """
+    The breadth of a research round for the complexity of its topic
+
+    Args:
+        complexity: The complexity rated during query generation, from 1 (a simple question) to 3 (a broad topic). 0 if it was not rated
+        configurable: The configuration, whose num_queries and num_results_per_query are the breadth of the most complex topics
+
+    Return:
+        The number of queries, and the number of results per query
+    """
+    if not configurable.adaptive_depth or not complexity:
+        return configurable.num_queries, configurable.num_results_per_query
+    share = min(max(complexity, 1), 3) / 3
+    return (
+        max(1, math.ceil(configurable.num_queries * share)),
+        max(1, math.ceil(configurable.num_results_per_query * share)),
+    )
+
+
+def note_novelty(new_notes, notes):
+    """
+    Estimates how much new content a round of notes adds to the notes collected before it
+
+    Args:
+        new_notes: The notes of the latest round
+        notes: The notes of the earlier rounds
+
+    Return:
+        The fraction of the word 3-grams of the new notes that do not appear in the earlier notes, between 0 and 1.
+        0 if the round added no notes
+    """
+    if not new_notes:
+        return 0.0
+    new = np.unique(np.concatenate([shingles(n.text, size=3) for n in new_notes]))
+    if not notes:
+        return 1.0
+    seen = np.unique(np.concatenate([shingles(n.text, size=3) for n in notes]))
+    return len(np.setdiff1d(new, seen, assume_unique=True)) / len(new)
+
+
+def stop_reason(state, configurable):
+    """
+    Decides whether the research should stop before another follow-up round
+
+    The time and tokens of the next round are estimated as the average of the rounds so far.
+
+    Args:
+        state: The state after the summaries of the latest round
+        configurable: The configuration with the budgets and the adaptive depth settings
+
+    Return:
+        "deadline", "token_budget" or "low_novelty" if the research should stop, or an empty string
+    """
+    num_rounds = state.get('num_followup_attempts', 0) + 1
+
+    time_left = research_time_left(state.get('started_at'), configurable)
+    if time_left is not None:
+        elapsed = configurable.deadline * (1 - configurable.deadline_report_share) - time_left
+        if time_left < elapsed / num_rounds:
+            return "deadline"
+
+    if configurable.max_run_tokens:
+        llm = state.get('metrics', {}).get('total', {}).get('llm', {})
+        tokens = llm.get('input_tokens', 0) + llm.get('output_tokens', 0)
+        if tokens + tokens / num_rounds > configurable.max_run_tokens:
+            return "token_budget"
+
+    if configurable.adaptive_depth and num_rounds > 1:
+        num_judged = state.get('num_judged_notes', 0)
+        if note_novelty(state['notes'][num_judged:], state['notes'][:num_judged]) < configurable.min_novelty:
+            return "low_novelty"
+
+    return ""
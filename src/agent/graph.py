@@ -1,43 +1,99 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import asyncio
 import json
-from pydantic import BaseModel, Field
+import time
+from functools import lru_cache
+from typing import Any, Dict, List
 
-from langgraph.graph import END, START, StateGraph
-from langgraph.runtime import Runtime
 from langchain_core.messages import (
     AIMessage,
     HumanMessage,
     SystemMessage,
+    message_chunk_to_message,
 )
 from langchain_core.runnables import RunnableConfig
-from langgraph.types import Command, Send, Overwrite
+from langgraph.config import get_stream_writer
+from langgraph.graph import END, START, StateGraph
+from langgraph.runtime import Runtime
+from langgraph.types import Command, Overwrite, Send
+from pydantic import BaseModel, Field
 
+from agent.cache import (
+    get_cache,
+    get_summary_cache,
+    summary_cache_key,
+)
+from agent.checkpoint import get_checkpointer
+from agent.chunking import (
+    count_tokens,
+    select_relevant_chunks,
+    split_into_chunks,
+    trim_lines,
+)
+from agent.clustering import cluster_notes
+from agent.config import (
+    Configuration,
+)
+from agent.content import (
+    load_content,
+    release_contents,
+    select_contents,
+    store_contents,
+    stored_sources,
+)
+from agent.dedupe import deduplicate_sources, normalize_url
+from agent.depth import (
+    query_breadth,
+    report_time_left,
+    research_time_left,
+    stop_reason,
+    within,
+)
+from agent.metrics import instrument_node
+from agent.prompts import (
+    batch_notes_prompt,
+    clarification_prompt,
+    compress_notes_prompt,
+    followup_digest_prompt,
+    followup_prompt,
+    merge_notes_prompt,
+    notes_prompt,
+    query_complexity_prompt,
+    query_generation_prompt,
+    report_generation_prompt,
+)
+from agent.ranking import select_relevant_sources
+from agent.ratelimit import get_rate_limiter
+from agent.search import get_search_backend
+from agent.singleflight import get_single_flight
 from agent.state import (
     InputState,
+    Note,
     State,
 )
-
 from agent.utils import (
-    call_llm,
-    get_current_date,
+    acall_llm,
+    astream_llm,
     format_clarification_messages,
-    get_search_results,
     format_research_notes,
+    get_all_search_results,
+    get_current_date,
 )
 
-from agent.prompts import (
-    clarification_prompt,
-    query_generation_prompt,
-    notes_prompt,
-    followup_prompt,
-    report_generation_prompt,
-)
+PASSAGE_TOKENS = 256 # Size of the passages compared when only the most relevant passages of each search result are kept
 
-from agent.config import (
-    Configuration,
-)
+
+def get_llm_limiter(configurable):
+    """
+    Obtain the rate limiter shared by all LLM calls with the limits in the configuration
+    """
+    return get_rate_limiter(
+        configurable.max_concurrent_llm_calls,
+        configurable.requests_per_minute,
+        configurable.tokens_per_minute,
+        configurable.max_rate_limit_retries,
+    )
 
 
 # The structured output from the LLM in the clarification node
@@ -49,12 +105,143 @@ class ClarificationOutput(BaseModel):
 class QueryGenerationOutput(BaseModel):
     search_queries: List[str] = Field(description="A list of strings, where each string is a search query")
 
+# The structured output from the LLM in the query_generation node with adaptive_depth
+class RatedQueryGenerationOutput(QueryGenerationOutput):
+    complexity: int = Field(description="The complexity of the user request, from 1 (simple) to 3 (broad)")
+
+# The structured output from the LLM in the summarize_batch node
+class SourceNotes(BaseModel):
+    source_id: int = Field(description="The id of the source the notes are about")
+    notes: str = Field(description="The notes on the source in point form")
+
+class BatchNotesOutput(BaseModel):
+    sources: List[SourceNotes] = Field(description="The notes of each source")
+
 # The structured output from the LLM in the followup node
 class FollowupOutput(BaseModel):
     needs_followup: bool = Field(description="True if the information is insufficient. False if the information is enough for writing a report about the topic")
     follow_up_question: str = Field(description="A question that would most improve the quality of the research")
 
 
+class DigestedFollowupOutput(FollowupOutput):
+    digest: str = Field(description="A condensed digest of all information collected so far, combining the previous digest with the new information")
+
+
+async def generate_queries(topic, clarification_messages, configurable):
+    """
+    Generates search queries for the research topic or follow-up question with an LLM.
+    With adaptive_depth, the LLM also rates the complexity of the topic, and simpler topics keep fewer queries
+    
+    Args:
+        topic: The research topic, or the follow-up question in a follow-up round
+        clarification_messages: The list of clarification questions and answers
+        configurable: The configuration with the model and the number of queries
+        
+    Returns:
+        The list of at most num_queries search queries, and the complexity of the topic from 1 to 3 (0 if not rated)
+    """
+    # format the LLM prompt with the required information
+    prompt = query_generation_prompt.format(
+        num_queries=configurable.num_queries,
+        date=get_current_date(),
+        user_prompt=topic,
+        messages=format_clarification_messages(clarification_messages)
+    )
+    
+    if not configurable.adaptive_depth:
+        # call the LLM to obtain the structured output
+        response = await acall_llm(configurable.model, prompt, structure=QueryGenerationOutput, limiter=get_llm_limiter(configurable))
+        return response.search_queries[:configurable.num_queries], 0
+    
+    # the rating comes with the queries, so choosing the breadth costs no extra call
+    prompt += query_complexity_prompt
+    response = await acall_llm(configurable.model, prompt, structure=RatedQueryGenerationOutput, limiter=get_llm_limiter(configurable))
+    complexity = min(max(response.complexity, 1), 3)
+    num_queries, _ = query_breadth(complexity, configurable)
+    return response.search_queries[:num_queries], complexity
+
+
+async def run_searches(queries, notes, configurable, complexity=0, started_at=0.0):
+    """
+    Runs the search queries concurrently and combines the search results in the order of the queries
+    
+    Args:
+        queries: The list of search queries
+        notes: The notes of earlier rounds, whose pages are skipped
+        configurable: The configuration with the search settings
+        complexity: The complexity of the topic of the round, which sets the number of results per query with adaptive_depth
+        started_at: The start time of the run, from which the deadline counts
+        
+    Returns:
+        The list of search results, containing the query, title, url, and a handle to the raw content in the content store
+    """
+    cache = None
+    if configurable.search_cache:
+        cache = get_cache(configurable.search_cache_path, configurable.search_cache_ttl, configurable.search_cache_max_entries)
+    
+    # searches that would run past the time for research return no results
+    time_left = research_time_left(started_at, configurable)
+    deadline = None if time_left is None else time.time() + time_left
+    
+    # opening a local index reads its metadata and may build it, so keep it off the event loop and within the deadline.
+    # A build that runs past the deadline still finishes in its thread, for the next runs
+    backend = await within(asyncio.to_thread(
+        get_search_backend, configurable.search_backend, configurable.local_index_path, configurable.local_documents_path
+    ), time_left)
+    if backend is None:
+        return []
+    
+    _, num_results = query_breadth(complexity, configurable)
+    search_results = await get_all_search_results(
+        queries,
+        num_results,
+        max_concurrency=configurable.search_concurrency,
+        timeout=configurable.search_timeout,
+        cache=cache,
+        refresh=configurable.search_cache_refresh,
+        # follow-up rounds skip the pages that earlier rounds already summarized
+        exclude_urls={normalize_url(n.url) for n in notes},
+        backend=backend,
+        coalesce=configurable.coalesce_requests,
+        deadline=deadline,
+    )
+    
+    # keep the page content out of the state, and so out of the Send payloads and checkpoints
+    return store_contents(search_results)
+
+
+async def speculate(topic, clarification_messages, notes, configurable, started_at=0.0):
+    """
+    Generates the search queries, and optionally runs the first search round, while the clarification check is still running
+    
+    Returns:
+        The state updates of the query_generation node, and of the search_results_extraction node if speculative_search is enabled,
+        with "prefetched" naming the last stage that was run
+    """
+    queries, complexity = await generate_queries(topic, clarification_messages, configurable)
+    update = {
+        "queries": queries,
+        "complexity": complexity,
+        "needs_followup": False,
+        "follow_up_question": "",
+        "prefetched": "queries",
+    }
+    if configurable.speculative_search:
+        update["search_results"] = await run_searches(queries, notes, configurable, complexity, started_at)
+        update["prefetched"] = "search_results"
+    return update
+
+
+def discard_speculation(speculation):
+    """
+    Cancels a speculation task, and releases the content of its search results if it already finished
+    """
+    if speculation.done() and not speculation.cancelled() and speculation.exception() is None:
+        release_contents(speculation.result().get("search_results", []))
+    speculation.cancel()
+
+
+@instrument_node
 async def clarification(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
     LangGraph node that analyzes the research topic and clarification messages to determine if the research topic is clear enough. 
@@ -69,19 +256,28 @@ async def clarification(state: State, config: RunnableConfig) -> Dict[str, Any]:
             topic: The research topic obtained from the messages
             needs_clarification: Determines whether to end with a clarifying question or proceed to generate search queries
             clarification_messages: The updated list of clarification questions and answers obtained from the messages
+            prefetched: The last stage that ran speculatively with the clarification check ("queries" or "search_results"), along with its state updates
+            run_stats: Cleared at the start of a new run, and counts whether speculative queries were used or discarded
+            started_at: The time the run started, since every message from the user starts the clock of the deadline again
     """
-    print('---- clarification')
     
     configurable = Configuration.from_runnable_config(config)
+    started_at = time.time()
     
     new_clarification_messages = [] 
     
-    if 'topic' not in state or not state['topic']:
+    run_stats = {}
+    new_run = 'topic' not in state or not state['topic']
+    if new_run:
         topic = state['messages'][-1].text # If the topic isn't set, the latest message is the research topic
     else:
         new_clarification_messages.append(state['messages'][-1]) # the latest message is the answer to the previous clarification question
         topic = state['topic']
     
+    def stats_update():
+        # a new run starts with empty run statistics
+        return Overwrite(run_stats) if new_run else run_stats
+    
     # check if the number of clarification attempts exceeds the maximum number of retries
     if len(state['clarification_messages'])+1 >= configurable.max_clarification_retries * 2:
         # indicate that no more clarification is needed
@@ -90,11 +286,17 @@ async def clarification(state: State, config: RunnableConfig) -> Dict[str, Any]:
                 'clarification_messages': new_clarification_messages,
                 "topic": topic, 
                 'needs_clarification': False,
+                "prefetched": "",
+                "run_stats": stats_update(),
+                "started_at": started_at,
             }
         else:
             return {
                 "topic": topic, 
                 'needs_clarification': False,
+                "prefetched": "",
+                "run_stats": stats_update(),
+                "started_at": started_at,
             }
     
     # convert the list of clarification messages into a single string
@@ -107,10 +309,31 @@ async def clarification(state: State, config: RunnableConfig) -> Dict[str, Any]:
         messages=clarification_messages
     )
     
-    # call the LLM to obtain the structured output
-    response = call_llm(configurable.model, prompt, structure=ClarificationOutput)
+    # start generating queries while the clarification check runs, since most topics need no clarification
+    speculation = None
+    if configurable.speculative_queries:
+        speculation = asyncio.create_task(speculate(
+            topic, state['clarification_messages'] + new_clarification_messages, state.get('notes') or [], configurable, started_at
+        ))
+    
+    # call the LLM to obtain the structured output. Past the time for research, the topic is taken as it is
+    time_left = research_time_left(started_at, configurable)
+    try:
+        response = await within(
+            acall_llm(configurable.model, prompt, structure=ClarificationOutput, limiter=get_llm_limiter(configurable)),
+            time_left,
+            default=ClarificationOutput(needs_clarification=False, clarification_question=""),
+        )
+    except BaseException:
+        if speculation is not None:
+            discard_speculation(speculation)
+        raise
     
     if response.needs_clarification:
+        # the speculative queries are for a topic that is about to change, so discard them
+        if speculation is not None:
+            discard_speculation(speculation)
+            run_stats["discarded_speculations"] = 1
         # append the clarification question to the messages, and the list of clarification messages
         new_clarification_messages.append(AIMessage(content=response.clarification_question))
         # indicate that clarification is needed
@@ -119,24 +342,43 @@ async def clarification(state: State, config: RunnableConfig) -> Dict[str, Any]:
             'clarification_messages': new_clarification_messages,
             "topic": topic, 
             'needs_clarification': True,
+            "prefetched": "",
+            "run_stats": stats_update(),
+            "started_at": started_at,
         }
+    
+    prefetched = {"prefetched": ""}
+    if speculation is not None:
+        prefetched = await within(speculation, research_time_left(started_at, configurable), default=prefetched)
+        run_stats["used_speculations"] = int(prefetched["prefetched"] != "")
 
     # indicate that no clarification is needed
     return {
+        **prefetched,
         "topic": topic, 
-        'needs_clarification': False
+        'needs_clarification': False,
+        "run_stats": stats_update(),
+        "started_at": started_at,
     }
 
 def route_clarification(
     state: State, config: RunnableConfig
 ):
     """
-    Determines whether to end with a clarifying question or proceed to generate search queries
-    Returns True if clarification is needed
+    Determines whether to end with a clarifying question or proceed to generate search queries.
+    Stages that already ran speculatively during the clarification check are skipped
     """
-    return 'needs_clarification' in state and state['needs_clarification']
+    if 'needs_clarification' in state and state['needs_clarification']:
+        return END
+    prefetched = state.get('prefetched')
+    if prefetched == 'search_results':
+        return "deduplicate"
+    if prefetched == 'queries':
+        return "search_results_extraction"
+    return "query_generation"
     
 
+@instrument_node
 async def query_generation(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
     LangGraph node that generates a list of search queries based on the research topic or the follow-up question
@@ -150,38 +392,46 @@ async def query_generation(state: State, config: RunnableConfig) -> Dict[str, An
     Returns:
         Dictionary with the state updates:
             queries: List of generated search queries
+            complexity: The complexity of the topic of the round with adaptive_depth, which sets the breadth of the searches
             needs_followup: Reset to False after follow-up is processed
+            topic: The research topic, if the run starts here because the graph has no clarification node
+            run_stats: Cleared at the start of a new run, if the run starts here
+            started_at: The time the run started, if the run starts here
     """
-    print('---- query_generation')
     
     configurable = Configuration.from_runnable_config(config)
     
-    
-    topic = state['topic']
+    update = {}
+    if 'topic' not in state or not state['topic']:
+        # without a clarification node the run starts here, and the latest message is the research topic
+        update = {
+            "topic": state['messages'][-1].text,
+            "run_stats": Overwrite({}), # a new run starts with empty run statistics
+            "started_at": time.time(),
+        }
+    topic = update.get('topic') or state['topic']
+    started_at = update.get('started_at') or state.get('started_at')
     
     # set the follow-up question as the query generation topic if follow-up is needed
     if 'needs_followup' in state and state['needs_followup']:
         topic = state['follow_up_question']
     
-    # format the LLM prompt with the required information
-    prompt = query_generation_prompt.format(
-        num_queries=configurable.num_queries,
-        date=get_current_date(),
-        user_prompt=topic,
-        messages=format_clarification_messages(state['clarification_messages'])
+    # past the time for research, the round has no queries and the run goes on to the report
+    queries, complexity = await within(
+        generate_queries(topic, state.get('clarification_messages') or [], configurable),
+        research_time_left(started_at, configurable),
+        default=([], 0),
     )
     
-    # call the LLM to obtain the structured output
-    response = call_llm(configurable.model, prompt, structure=QueryGenerationOutput)
-    
-    queries = response.search_queries
-    
     return {
-        "queries": queries[:configurable.num_queries],
+        **update,
+        "queries": queries,
+        "complexity": complexity,
         "needs_followup": False,
         "follow_up_question": "",
     }
 
+@instrument_node
 async def search_results_extraction(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
     LangGraph node that calls the search API with the search queries to obtain a list of raw content from each source
@@ -192,32 +442,226 @@ async def search_results_extraction(state: State, config: RunnableConfig) -> Dic
         
     Returns:
         Dictionary with the state updates:
-            search_results: List of search results aggregated from all of the queries, containing the title, url, and raw content
+            search_results: List of search results aggregated from all of the queries, containing the title, url, and a handle to the raw content in the content store
     """
-    print('---- search_results_extraction')
     
     configurable = Configuration.from_runnable_config(config)
     
-    # for each search query, add the search results to the list of all the search results
-    search_results = []
-    for query in state['queries']:
-        search_results.extend(get_search_results(query, configurable.num_results_per_query))
+    search_results = await run_searches(
+        state['queries'], state.get('notes') or [], configurable, state.get('complexity') or 0, state.get('started_at') or 0.0
+    )
     
     return {
         "search_results": search_results,
     }
 
-def assign_workers(state: State):
+@instrument_node
+async def deduplicate(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
-    Assign a summarize node to each search result
+    LangGraph node that removes search results that would be summarized more than once:
+    repeated URLs, URLs already summarized in earlier rounds, and near-duplicate content
+    
+    Args:
+        state: Current agent state containing user messages
+        config: Runtime configuration with model settings and preferences
+        
+    Returns:
+        Dictionary with the state updates:
+            search_results: The search results to summarize
+            run_stats: Counts the summarize calls avoided for each reason, and the search results whose content is no longer stored
     """
+    
+    configurable = Configuration.from_runnable_config(config)
+    
+    seen_urls = {normalize_url(n.url) for n in state['notes']}
+    stats = {}
+    
+    def select(sources):
+        kept, counts = deduplicate_sources(sources, seen_urls, configurable.near_duplicate_threshold)
+        stats.update(counts)
+        return kept
+    
+    search_results, missing = stored_sources(state['search_results'])
+    search_results = select_contents(search_results, select)
+    
+    return {
+        "search_results": search_results,
+        "run_stats": {
+            "duplicate_urls": stats["duplicate_urls"],
+            "previously_summarized": stats["previously_summarized"],
+            "near_duplicates": stats["near_duplicates"],
+            "summaries_avoided": sum(stats.values()),
+            "missing_contents": missing,
+        },
+    }
 
-    # run the summarize nodes in parallel for each search result
-    return [Send("summarize", {
-        "source": s, 
-        "topic": state['topic'],
-    }) for s in state["search_results"]]
+@instrument_node
+async def rank_sources(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    LangGraph node that ranks the search results by relevance to the research topic and search queries with BM25,
+    keeping only the most relevant results, or only the most relevant passages of each result, before they are summarized
+    
+    Args:
+        state: Current agent state containing user messages
+        config: Runtime configuration with model settings and preferences
+        
+    Returns:
+        Dictionary with the state updates:
+            search_results: The relevant search results to summarize
+            run_stats: Counts the summarize calls avoided for irrelevant results, and the search results whose content is no longer stored
+    """
+    
+    configurable = Configuration.from_runnable_config(config)
+    
+    search_results, missing = stored_sources(state['search_results'])
+    num_sources = len(search_results)
+    query = '\n'.join([state['topic']] + list(state['queries']))
+    
+    if configurable.max_sources or configurable.relevance_threshold > 0:
+        search_results = select_contents(
+            search_results,
+            lambda sources: select_relevant_sources(sources, query, configurable.max_sources, configurable.relevance_threshold),
+        )
+    
+    if configurable.relevant_passages:
+        # the passages replace the whole page in the content store
+        try:
+            passages = [{
+                **s,
+                'content': '\n'.join(select_relevant_chunks(
+                    split_into_chunks(load_content(s), PASSAGE_TOKENS, configurable.model),
+                    query,
+                    configurable.relevant_passages,
+                )),
+            } for s in search_results]
+        finally:
+            release_contents(search_results)
+        search_results = store_contents(passages)
+    
+    return {
+        "search_results": search_results,
+        "run_stats": {
+            "irrelevant_sources": num_sources - len(search_results),
+            "missing_contents": missing,
+        },
+    }
+
+def pack_sources(sources, configurable):
+    """
+    Packs short search results into batches that are summarized in a single LLM call
+    
+    Search results longer than half of max_source_tokens are summarized on their own. The others are packed in order,
+    and a new batch starts when the next search result would exceed max_source_tokens or batch_max_sources
+    
+    Args:
+        sources: The list of search results
+        configurable: The configuration with the model and the batch limits
+        
+    Returns:
+        The list of batches, each a list of search results. Batches of one search result are summarized on their own
+    """
+    budget = configurable.max_source_tokens
+    batches = []
+    batch, batch_tokens = [], 0
+    for source in sources:
+        if not stored_sources([source])[0]:
+            # summarized on its own, where it is left out
+            batches.append([source])
+            continue
+        tokens = count_tokens(load_content(source), configurable.model)
+        if tokens > budget // 2:
+            batches.append([source])
+            continue
+        if batch and (batch_tokens + tokens > budget or len(batch) >= configurable.batch_max_sources):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(source)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def assign_workers(state: State, config: RunnableConfig):
+    """
+    Assign a summarize node to each search result, or go straight to followup if there is nothing to summarize.
+    In batch mode, short search results are packed into summarize_batch nodes instead
+    """
+    
+    if not state["search_results"]:
+        return "followup"
+    
+    configurable = Configuration.from_runnable_config(config)
+    
+    if configurable.summarize_mode == 'batch':
+        batches = pack_sources(state["search_results"], configurable)
+    else:
+        batches = [[s] for s in state["search_results"]]
+
+    # run the summarize nodes in parallel for each search result or batch
+    return [
+        Send("summarize", {"source": batch[0], "topic": state['topic'], "started_at": state.get('started_at') or 0.0}) if len(batch) == 1
+        else Send("summarize_batch", {"sources": batch, "topic": state['topic'], "started_at": state.get('started_at') or 0.0})
+        for batch in batches
+    ]
 
+async def summarize_content(content, topic, configurable):
+    """
+    Summarizes the raw content of a search result in point-form. Content over the token budget is split into chunks:
+    with the map_reduce strategy the most relevant chunks are summarized in parallel and merged,
+    with the truncate strategy only the most relevant parts that fit in the budget are summarized.
+    
+    Args:
+        content: The raw content of the search result
+        topic: The research topic, used to rank the chunks by relevance
+        configurable: The configuration with the model and the token budget
+        
+    Returns:
+        The summary in point-form, and the number of chunks the content was split into
+    """
+    model = configurable.model
+    budget = configurable.max_source_tokens
+    limiter = get_llm_limiter(configurable)
+    
+    if count_tokens(content, model) <= budget:
+        response = await acall_llm(model, notes_prompt.format(search_result=content), limiter=limiter)
+        return response.text, 1
+    
+    if configurable.chunk_strategy == 'truncate':
+        # keep the most relevant smaller chunks that together fit in the budget
+        chunks = split_into_chunks(content, max(1, budget // configurable.max_source_chunks), model)
+        content = '\n'.join(select_relevant_chunks(chunks, topic, configurable.max_source_chunks))
+        response = await acall_llm(model, notes_prompt.format(search_result=content), limiter=limiter)
+        return response.text, 1
+    
+    chunks = split_into_chunks(content, budget, model)
+    chunks = select_relevant_chunks(chunks, topic, configurable.max_source_chunks)
+    
+    # summarize the chunks in parallel, then merge the partial notes
+    responses = await asyncio.gather(*[
+        acall_llm(model, notes_prompt.format(search_result=chunk), limiter=limiter) for chunk in chunks
+    ])
+    if len(responses) == 1:
+        return responses[0].text, 1
+    response = await acall_llm(model, merge_notes_prompt.format(notes='\n\n'.join(r.text for r in responses)), limiter=limiter)
+    return response.text, len(chunks)
+
+
+def summary_key(content, prompt, configurable, topic):
+    """
+    Computes the summary cache key of the content for the model, the summary prompt and the token budget.
+    Content over the token budget is summarized from the chunks most relevant to the topic, so its key includes the topic
+    """
+    parts = [
+        prompt,
+        merge_notes_prompt,
+        f"{configurable.chunk_strategy}:{configurable.max_source_tokens}:{configurable.max_source_chunks}",
+    ]
+    if count_tokens(content, configurable.model) > configurable.max_source_tokens:
+        parts.append(f"topic:{topic}")
+    return summary_cache_key(configurable.model, '\n'.join(parts), content)
+
+
+@instrument_node
 async def summarize(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
     LangGraph node that converts the raw content of a search result into a summary in point-form.
@@ -229,31 +673,160 @@ async def summarize(state: State, config: RunnableConfig) -> Dict[str, Any]:
     Returns:
         Dictionary with the state updates:
             notes: The summary for the current search result in point-form, along with the corresponding title and url
+            run_stats: Counts whether the summary came from the summary cache or a call in flight, how many chunks were summarized,
+                and whether the search result was left out because the time for research ran out or its content is no longer stored
     """
-    print('---- summarize')
     
     configurable = Configuration.from_runnable_config(config)
     
     source = state['source']
+    if not stored_sources([source])[0]:
+        # the handle was restored from a checkpoint, and the page is no longer stored in this process
+        return {"run_stats": {"missing_contents": 1}}
     
-    # format the LLM prompt with the required information
-    prompt = notes_prompt.format(
-        search_result=source['content']
-    )
+    try:
+        content = load_content(source)
+        
+        # reuse the summary if the same content was already summarized with the same model, prompts and token budget
+        key = summary_key(content, notes_prompt, configurable, state['topic'])
+        cache = None
+        notes = None
+        if configurable.summary_cache:
+            cache = get_summary_cache(configurable.summary_cache_size, configurable.summary_cache_path, configurable.summary_cache_max_entries)
+            notes = await cache.aget(key)
+        cached = notes is not None
+        
+        num_chunks = 0
+        coalesced = False
+        if not cached:
+            called = []
+            
+            async def summarize_and_cache():
+                called.append(True)
+                # call the LLM to obtain a summary in point-form from the raw content of the search result
+                notes, num_chunks = await summarize_content(content, state['topic'], configurable)
+                if cache is not None:
+                    await cache.aset(key, notes)
+                return notes, num_chunks
+            
+            # concurrent runs that summarize the same page share the call that is already in flight
+            summarizing = get_single_flight("summarize").acall(key, summarize_and_cache) if configurable.coalesce_requests else summarize_and_cache()
+            summary = await within(summarizing, research_time_left(state.get('started_at'), configurable))
+            
+            if summary is None:
+                # past the time for research, the search result is left out of the notes
+                return {"run_stats": {"deadline_skipped_sources": 1}}
+            notes, num_chunks = summary
+            coalesced = configurable.coalesce_requests and not called
+    finally:
+        # the page is not read again once it is summarized, or if summarizing it failed
+        release_contents([source])
     
-    # call the LLM to obtain a summary in point-form from the raw content of the search result
-    response = call_llm(configurable.model, prompt)
+    return {
+        "notes": [Note.from_summary(source['title'], source['url'], notes)],
+        "run_stats": {
+            "summary_cache_hits": int(cached),
+            "summary_cache_misses": int(cache is not None and not cached),
+            "chunked_sources": int(num_chunks > 1),
+            "summarized_chunks": num_chunks if not coalesced else 0,
+            "coalesced_summaries": int(coalesced),
+        },
+    }
+
+
+@instrument_node
+async def summarize_batch(state: State, config: RunnableConfig) -> Dict[str, Any]:
+    """
+    LangGraph node that summarizes a batch of short search results in a single LLM call, with separate notes for each search result.
+    Search results that the output leaves out are summarized on their own.
+    
+    Args:
+        state: Current agent state containing user messages
+        config: Runtime configuration with model settings and preferences
+        
+    Returns:
+        Dictionary with the state updates:
+            notes: The summary of each search result in the batch in point-form, along with the corresponding title and url
+            run_stats: Counts the batch calls, the search results they covered, the summary cache hits and misses, the search results summarized on their own,
+                and the search results left out because the time for research ran out or their content is no longer stored
+    """
+    
+    configurable = Configuration.from_runnable_config(config)
     
+    sources, num_missing = stored_sources(state['sources'])
+    if not sources:
+        return {"run_stats": {"missing_contents": num_missing}}
+    
+    try:
+        contents = [load_content(s) for s in sources]
+        
+        # reuse the summaries of content that was already summarized in a batch with the same model, prompts and token budget
+        cache = None
+        summaries = [None] * len(sources)
+        if configurable.summary_cache:
+            cache = get_summary_cache(configurable.summary_cache_size, configurable.summary_cache_path, configurable.summary_cache_max_entries)
+            keys = [summary_key(content, batch_notes_prompt, configurable, state['topic']) for content in contents]
+            summaries = [await cache.aget(key) for key in keys]
+        pending = [i for i, summary in enumerate(summaries) if summary is None]
+        batched = []
+        missing = []
+        
+        async def summarize_pending():
+            if pending:
+                # number the search results in the prompt, so the notes can be matched back to them
+                search_results = '\n\n'.join(
+                    f'<source id="{n}">\n{sources[i]["title"]}\n{contents[i]}\n</source>' for n, i in enumerate(pending, 1)
+                )
+                response = await acall_llm(
+                    configurable.model,
+                    batch_notes_prompt.format(search_results=search_results),
+                    structure=BatchNotesOutput,
+                    limiter=get_llm_limiter(configurable),
+                )
+                notes_by_id = {s.source_id: s.notes for s in response.sources if s.notes.strip()}
+                for n, i in enumerate(pending, 1):
+                    summaries[i] = notes_by_id.get(n)
+                    if summaries[i] is not None:
+                        batched.append(i)
+                        if cache is not None:
+                            await cache.aset(keys[i], summaries[i])
+        
+            missing.extend(i for i, summary in enumerate(summaries) if summary is None)
+            responses = await asyncio.gather(*[summarize_content(contents[i], state['topic'], configurable) for i in missing])
+            for i, (notes, _) in zip(missing, responses):
+                summaries[i] = notes
+        
+        # past the time for research, the search results without a summary are left out of the notes
+        await within(summarize_pending(), research_time_left(state.get('started_at'), configurable))
+    finally:
+        # the pages are not read again once they are summarized, or if summarizing them failed
+        release_contents(sources)
+    
+    summarized = [(s, summary) for s, summary in zip(sources, summaries) if summary is not None]
     return {
-        "notes": [{'title': source['title'], 'url': source['url'], 'notes': response.text}],
+        "notes": [Note.from_summary(s['title'], s['url'], summary) for s, summary in summarized],
+        "run_stats": {
+            "summary_batches": int(bool(pending)),
+            "batched_sources": len(batched),
+            "unbatched_sources": sum(summaries[i] is not None for i in missing),
+            "summary_cache_hits": len(sources) - len(pending),
+            "summary_cache_misses": len(pending) if cache is not None else 0,
+            "deadline_skipped_sources": len(sources) - len(summarized),
+            "missing_contents": num_missing,
+        },
     }
 
 
+@instrument_node
 async def followup(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
     LangGraph node that determines if the summarized search results contain enough information to write a report on the research topic.
     If there's not enough information, return a follow-up question
     
+    Each round only sends the notes added since the previous round, along with a condensed digest of the notes judged before,
+    so the cost of a round depends on the new material rather than on all the notes collected so far.
+    The last round that can be judged does not update the digest, since no later round reads it
+    
     Args:
         state: Current agent state containing user messages
         config: Runtime configuration with model settings and preferences
@@ -263,8 +836,10 @@ async def followup(state: State, config: RunnableConfig) -> Dict[str, Any]:
             needs_followup: Determines whether to restart the research process with a follow-up question or proceed to generate the final report
             follow_up_question: A single question to fill knowledge gaps in the current information
             num_followup_attempts: Counts the number of follow-up attempts
+            research_digest: The condensed digest of all notes judged so far, unless this is the last round
+            num_judged_notes: The number of notes covered by the digest, unless this is the last round
+            run_stats: Counts why the research stopped before the maximum number of follow-up rounds, if it did
     """
-    print('---- followup')
     
     configurable = Configuration.from_runnable_config(config)
     
@@ -274,29 +849,56 @@ async def followup(state: State, config: RunnableConfig) -> Dict[str, Any]:
             "needs_followup": False,
         }
     
-    notes = format_research_notes(state['notes'])
+    # stop without judging the notes if another round would not fit in the budgets, or the latest round added little new content
+    reason = stop_reason(state, configurable)
+    if reason:
+        return {
+            "needs_followup": False,
+            "run_stats": {f"stopped_by_{reason}": 1},
+        }
+    
+    # only the notes added since the previous round are sent in full
+    num_judged = state.get('num_judged_notes', 0)
+    new_notes = format_research_notes(state['notes'][num_judged:])
     
     # format the LLM prompt with the required information
     prompt = followup_prompt.format(
         user_prompt=state['topic'],
-        summary=notes,
+        digest=state.get('research_digest') or 'None',
+        summary=new_notes,
     )
     
+    # the digest is only read by the next round, which the last round does not have
+    num_followup = state.get('num_followup_attempts', 0)
+    structure = FollowupOutput
+    if num_followup + 1 < configurable.max_followup_retries:
+        prompt += followup_digest_prompt
+        structure = DigestedFollowupOutput
+    
     # call the LLM to obtain the structured output
-    response = call_llm(configurable.model, prompt, structure=FollowupOutput)
+    response = await within(
+        acall_llm(configurable.model, prompt, structure=structure, limiter=get_llm_limiter(configurable)),
+        research_time_left(state.get('started_at'), configurable),
+    )
+    if response is None:
+        return {
+            "needs_followup": False,
+            "run_stats": {"stopped_by_deadline": 1},
+        }
     
-    # obtain and increment the number of follow-up attempts
-    num_followup = 0
-    if 'num_followup_attempts' in state:
-        num_followup = state['num_followup_attempts']
+    # increment the number of follow-up attempts
     if response.needs_followup:
         num_followup += 1
     
-    return {
+    update = {
         "needs_followup": response.needs_followup,
         "follow_up_question": response.follow_up_question,
         "num_followup_attempts": num_followup,
     }
+    if structure is DigestedFollowupOutput:
+        update["research_digest"] = response.digest
+        update["num_judged_notes"] = len(state['notes'])
+    return update
     
 def route_followup(
     state: State, config: RunnableConfig
@@ -308,9 +910,68 @@ def route_followup(
     return 'needs_followup' in state and state['needs_followup']
     
     
+async def compress_notes(notes, topic, configurable):
+    """
+    Fits the research notes in the token budget of the final report. Notes over the budget are grouped by subtopic,
+    and the groups are merged in parallel into section digests of at most an equal share of the budget that keep the source of every point.
+    Groups too large for a single call are merged in batches first, and the partial digests are merged again.
+    A digest over its share of the budget is merged once more with a lower word limit, then trimmed by whole points.
+    
+    Args:
+        notes: The list of research notes for each source
+        topic: The research topic
+        configurable: The configuration with the model and the report budget
+        
+    Returns:
+        The research notes for the final report, and the number of section digests (0 if the notes fit in the budget)
+    """
+    model = configurable.model
+    budget = configurable.report_notes_budget
+    formatted = format_research_notes(notes)
+    if not budget or count_tokens(formatted, model) <= budget:
+        return formatted, 0
+    
+    limiter = get_llm_limiter(configurable)
+    groups = cluster_notes(notes, configurable.max_note_sections)
+    section_tokens = max(1, budget // len(groups))
+    
+    async def merge(text, max_tokens=section_tokens):
+        prompt = compress_notes_prompt.format(user_prompt=topic, max_words=max(1, max_tokens * 3 // 4), notes=text)
+        response = await acall_llm(model, prompt, limiter=limiter)
+        return response.text
+    
+    async def compress_group(group):
+        # split the group into batches of notes that fit in a single call
+        batches = [[]]
+        batch_tokens = 0
+        for i in group:
+            tokens = count_tokens(f'{notes[i].title} ({notes[i].url}):\n{notes[i].text}', model)
+            if batches[-1] and batch_tokens + tokens > configurable.max_source_tokens:
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(notes[i])
+            batch_tokens += tokens
+        
+        digests = await asyncio.gather(*[merge(format_research_notes(batch)) for batch in batches])
+        digest = digests[0] if len(digests) == 1 else await merge('\n\n'.join(digests))
+        
+        # a digest over its share of the budget is merged again with a word limit lowered by the overrun,
+        # and only then trimmed by whole points, so every point that is kept still names its source
+        tokens = count_tokens(digest, model)
+        if tokens > section_tokens:
+            digest = await merge(digest, section_tokens * section_tokens // tokens)
+        if count_tokens(digest, model) > section_tokens:
+            digest = trim_lines(digest, section_tokens, model)
+        return digest
+    
+    digests = await asyncio.gather(*[compress_group(group) for group in groups])
+    return ''.join(f'\n{digest}\n' for digest in digests), len(groups)
+
+
+@instrument_node
 async def final_report(state: State, config: RunnableConfig) -> Dict[str, Any]:
     """
-    LangGraph node that generates the final report using the summarized search results
+    LangGraph node that generates the final report using the summarized search results. The report is streamed token by token while it is generated
     
     Args:
         state: Current agent state containing user messages
@@ -325,12 +986,32 @@ async def final_report(state: State, config: RunnableConfig) -> Dict[str, Any]:
             notes: Clears the list of research notes
             clarification_messages: Clears the list of clarification messages
             num_followup_attempts: Reset to 0
+            research_digest: Clears the digest of the research notes
+            num_judged_notes: Reset to 0
+            run_stats: Counts the notes merged into section digests to fit the report budget, and whether the report was cut short at the deadline
     """
-    print('---- final_report')
     
     configurable = Configuration.from_runnable_config(config)
     
-    notes = format_research_notes(state['notes'])
+    # notes over the report budget are merged into section digests, taking at most half of the time left until the deadline
+    time_left = report_time_left(state.get('started_at'), configurable)
+    compressed = await within(
+        compress_notes(state['notes'], state['topic'], configurable),
+        None if time_left is None else time_left / 2,
+    )
+    if compressed is not None:
+        notes, num_sections = compressed
+    else:
+        # without the time to merge them, the report gets the whole notes that fit in the budget
+        kept = state['notes']
+        if configurable.report_notes_budget:
+            kept, tokens = [], 0
+            for note in state['notes']:
+                tokens += count_tokens(format_research_notes([note]), configurable.model)
+                if tokens > configurable.report_notes_budget:
+                    break
+                kept.append(note)
+        notes, num_sections = format_research_notes(kept), 0
     
     # format the LLM prompt with the required information
     prompt = report_generation_prompt.format(
@@ -338,39 +1019,133 @@ async def final_report(state: State, config: RunnableConfig) -> Dict[str, Any]:
         research_notes=notes,
     )
     
-    # call the LLM to obtain the final report
-    response = call_llm(configurable.model, prompt)
+    # stream the final report from the LLM so it can be shown as it is written,
+    # both through the "messages" stream mode and as "final_report" events in the "custom" stream mode
+    writer = get_stream_writer()
+    chunks = []
+    
+    async def stream_report():
+        async for chunk in astream_llm(configurable.model, prompt, limiter=get_llm_limiter(configurable)):
+            if chunk.text:
+                writer({"final_report": chunk.text})
+            chunks.append(chunk)
+        return True
+    
+    # at the deadline, the report ends with what was written so far
+    truncated = not await within(stream_report(), report_time_left(state.get('started_at'), configurable), default=False)
+    response = AIMessage(content="") if not chunks else message_chunk_to_message(sum(chunks[1:], chunks[0]))
     
     # return the final output and clear the intermediate fields
     return {
         "messages": [response],
         "final_report": response.text,
-        "research_notes": format_research_notes(state['notes']),
+        "research_notes": notes,
         "topic": "",
         "notes": Overwrite([]),
         "clarification_messages": Overwrite([]),
         "num_followup_attempts": 0,
+        "research_digest": "",
+        "num_judged_notes": 0,
+        "run_stats": {
+            "compressed_notes": len(state['notes']) if num_sections else 0,
+            "note_sections": num_sections,
+            "truncated_reports": int(truncated),
+        },
     }
 
 
-# Define the graph
-graph_builder = StateGraph(State, input=InputState, config_schema=Configuration)
-
-# add all nodes in the graph
-graph_builder.add_node(clarification)
-graph_builder.add_node(query_generation)
-graph_builder.add_node(search_results_extraction)
-graph_builder.add_node(summarize)
-graph_builder.add_node(followup)
-graph_builder.add_node(final_report)
-  
-# add the edges between the nodes  
-graph_builder.add_edge("__start__", "clarification")
-graph_builder.add_conditional_edges("clarification", route_clarification, {True: END, False: "query_generation"})
-graph_builder.add_edge("query_generation", "search_results_extraction")
-graph_builder.add_conditional_edges("search_results_extraction", assign_workers, ["summarize"])
-graph_builder.add_edge("summarize", "followup")
-graph_builder.add_conditional_edges("followup", route_followup, {True: "query_generation", False: "final_report"})
-graph_builder.add_edge("final_report", END)
+def build_graph(configurable=None):
+    """
+    Builds the agent graph, leaving out the stages that the configuration disables
+    
+    Without clarification retries, the clarification node would never call the LLM, so the run starts at query_generation.
+    Without follow-up retries, the followup node would never call the LLM, so the summaries go straight to final_report.
+    Outside of batch mode, search results are never packed, so the summarize_batch node is left out.
+    
+    Args:
+        configurable: The configuration that decides which stages are included. All stages are included if not provided,
+            so they can be enabled per run with the runtime configuration
+        
+    Returns:
+        The uncompiled state graph
+    """
+    with_clarification = configurable is None or configurable.max_clarification_retries > 0
+    with_followup = configurable is None or configurable.max_followup_retries > 0
+    with_batches = configurable is None or configurable.summarize_mode == 'batch'
+    
+    builder = StateGraph(State, input=InputState, config_schema=Configuration)
     
+    # add all nodes in the graph
+    if with_clarification:
+        builder.add_node(clarification)
+    builder.add_node(query_generation)
+    builder.add_node(search_results_extraction)
+    builder.add_node(deduplicate)
+    builder.add_node(rank_sources)
+    builder.add_node(summarize)
+    if with_batches:
+        builder.add_node(summarize_batch)
+    if with_followup:
+        builder.add_node(followup)
+    builder.add_node(final_report)
+    
+    # add the edges between the nodes
+    if with_clarification:
+        builder.add_edge("__start__", "clarification")
+        builder.add_conditional_edges("clarification", route_clarification, [END, "query_generation", "search_results_extraction", "deduplicate"])
+    else:
+        builder.add_edge("__start__", "query_generation")
+    builder.add_edge("query_generation", "search_results_extraction")
+    builder.add_edge("search_results_extraction", "deduplicate")
+    builder.add_edge("deduplicate", "rank_sources")
+    after_summaries = "followup" if with_followup else "final_report"
+    summarizers = ["summarize", "summarize_batch"] if with_batches else ["summarize"]
+    builder.add_conditional_edges("rank_sources", assign_workers, {**{node: node for node in summarizers}, "followup": after_summaries})
+    for node in summarizers:
+        builder.add_edge(node, after_summaries)
+    if with_followup:
+        builder.add_conditional_edges("followup", route_followup, {True: "query_generation", False: "final_report"})
+    builder.add_edge("final_report", END)
+    
+    return builder
+
+
+@lru_cache(maxsize=32)
+def _compiled_graph(with_clarification, with_followup, with_batches=False, checkpointer=None):
+    configurable = Configuration(
+        max_clarification_retries=int(with_clarification),
+        max_followup_retries=int(with_followup),
+        summarize_mode='batch' if with_batches else 'per_source',
+    )
+    return build_graph(configurable).compile(checkpointer=checkpointer, name="Deep Research Agent")
+
+
+def make_graph(config: RunnableConfig = None):
+    """
+    Graph factory that returns the compiled graph for the configuration, without the stages it disables.
+    If checkpoint_path is set, the graph stores the state of each thread in that SQLite file.
+    Compiled graphs are cached, so each variant is only compiled once
+    
+    Args:
+        config: The runnable config of the run
+        
+    Returns:
+        The compiled graph
+    """
+    configurable = Configuration.from_runnable_config(config)
+    # keyed by the checkpointer itself, so a checkpoint file that was closed and reopened gets a new graph
+    checkpointer = None
+    if configurable.checkpoint_path:
+        checkpointer = get_checkpointer(configurable.checkpoint_path, configurable.checkpoint_ttl)
+    return _compiled_graph(
+        configurable.max_clarification_retries > 0,
+        configurable.max_followup_retries > 0,
+        configurable.summarize_mode == 'batch',
+        checkpointer,
+    )
+
+
+# Define the graph with every stage, configurable per run
+graph_builder = build_graph()
+
 graph = graph_builder.compile(name="Deep Research Agent")
@@ -0,0 +1,201 @@
+"""Per-node and per-LLM-call latency, token and cost instrumentation.
+
+Each graph node is wrapped with instrument_node, which times the node and collects the LLM calls it
+makes (recorded by acall_llm and astream_llm through a context variable). The measurements are:
+
+- returned in the node's state update under "metrics", where they are aggregated for the run
+- written to the "agent.metrics" logger and, if a path is configured, appended to a JSON lines file from a worker thread
+
+Aggregated run metrics can be rendered in the Prometheus text format with format_prometheus.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from langgraph.types import Overwrite
+
+from agent.config import Configuration
+
+logger = logging.getLogger(__name__)
+
+# USD per million input and output tokens, used to estimate the cost of a run
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+_llm_calls = ContextVar("llm_calls", default=None) # LLM calls made by the node that is running
+_sink_lock = threading.Lock()
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    """
+    Estimates the cost of an LLM call in USD, or 0 for models without a known price
+    """
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def usage_of(message):
+    """
+    Obtain the input and output token counts reported for an AI message, or zeros if it has no usage metadata
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+
+def record_llm_call(model, wall_time, queue_time=0.0, time_to_first_token=None, input_tokens=0, output_tokens=0):
+    """
+    Record an LLM call made by the node that is running. Calls made outside an instrumented node are ignored
+
+    Args:
+        model: The name of the model
+        wall_time: The number of seconds from the call to the complete response, including the queue time
+        queue_time: The number of seconds the call waited for the rate limiter
+        time_to_first_token: The number of seconds until the first token arrived. Defaults to the wall time for calls that are not streamed
+        input_tokens: The number of prompt tokens
+        output_tokens: The number of completion tokens
+    """
+    calls = _llm_calls.get()
+    if calls is None:
+        return
+    calls.append({
+        "model": model,
+        "wall_time": wall_time,
+        "queue_time": queue_time,
+        "time_to_first_token": wall_time if time_to_first_token is None else time_to_first_token,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost": estimate_cost(model, input_tokens, output_tokens),
+    })
+
+
+def merge_metrics(current, update):
+    """
+    Combine two metrics dictionaries: nested dictionaries are merged, values of keys starting with "max_" keep the maximum, and other numbers are summed.
+    Used as the reducer for the metrics in the state
+    """
+    merged = dict(current or {})
+    for key, value in (update or {}).items():
+        if key not in merged:
+            merged[key] = value
+        elif isinstance(value, dict):
+            merged[key] = merge_metrics(merged[key], value)
+        elif key.startswith("max_"):
+            merged[key] = max(merged[key], value)
+        else:
+            merged[key] = merged[key] + value
+    return merged
+
+
+def summarize_node(node, wall_time, calls):
+    """
+    Aggregate the timing of a node and its LLM calls into the metrics stored in the state
+    """
+    llm = {
+        "calls": len(calls),
+        "wall_time": sum(c["wall_time"] for c in calls),
+        "max_wall_time": max((c["wall_time"] for c in calls), default=0.0),
+        "queue_time": sum(c["queue_time"] for c in calls),
+        "max_queue_time": max((c["queue_time"] for c in calls), default=0.0),
+        "max_time_to_first_token": max((c["time_to_first_token"] for c in calls), default=0.0),
+        "input_tokens": sum(c["input_tokens"] for c in calls),
+        "output_tokens": sum(c["output_tokens"] for c in calls),
+        "cost": sum(c["cost"] for c in calls),
+    }
+    return {
+        "nodes": {
+            node: {"runs": 1, "wall_time": wall_time, "max_wall_time": wall_time, "llm": llm},
+        },
+        "total": {"llm": llm},
+    }
+
+
+def write_metrics(record, path=None):
+    """
+    Send a metrics record to the "agent.metrics" logger and append it to a JSON lines file if a path is provided
+    """
+    line = json.dumps(record)
+    logger.info(line)
+    if path:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _sink_lock, open(path, "a") as f:
+            f.write(line + "\n")
+
+
+def instrument_node(node):
+    """
+    Decorator for graph nodes that measures the node and its LLM calls and adds the measurements to its state update under "metrics"
+
+    Args:
+        node: The async node function, called with the state and the runnable config
+
+    Return:
+        The wrapped node function, with the same name
+    """
+    @functools.wraps(node)
+    async def wrapper(state, config):
+        calls = []
+        token = _llm_calls.set(calls)
+        start = time.perf_counter()
+        try:
+            update = await node(state, config)
+        finally:
+            _llm_calls.reset(token)
+        wall_time = time.perf_counter() - start
+
+        metrics = summarize_node(node.__name__, wall_time, calls)
+        record = {"node": node.__name__, "wall_time": wall_time, "llm_calls": calls}
+        path = Configuration.from_runnable_config(config).metrics_path
+        if path:
+            # the file is appended in a worker thread, so the event loop does not wait for the disk
+            await asyncio.to_thread(write_metrics, record, path)
+        else:
+            write_metrics(record)
+
+        update = dict(update or {})
+        # a node that starts a new run clears the run statistics, so the metrics start over as well
+        if isinstance(update.get("run_stats"), Overwrite):
+            update["metrics"] = Overwrite(metrics)
+        else:
+            update["metrics"] = metrics
+        return update
+
+    return wrapper
+
+
+def format_prometheus(metrics, prefix="deep_research"):
+    """
+    Render the metrics of a run in the Prometheus text exposition format
+
+    Args:
+        metrics: The metrics stored in the state of a run
+        prefix: The prefix of every metric name
+
+    Return:
+        One "name{labels} value" line for each node and LLM measurement
+    """
+    lines = []
+    for node, values in sorted(metrics.get("nodes", {}).items()):
+        labels = f'{{node="{node}"}}'
+        lines.append(f"{prefix}_node_runs_total{labels} {values['runs']}")
+        lines.append(f"{prefix}_node_wall_seconds_total{labels} {values['wall_time']:.6f}")
+        lines.append(f"{prefix}_node_wall_seconds_max{labels} {values['max_wall_time']:.6f}")
+        llm = values["llm"]
+        lines.append(f"{prefix}_llm_calls_total{labels} {llm['calls']}")
+        lines.append(f"{prefix}_llm_queue_seconds_total{labels} {llm['queue_time']:.6f}")
+        lines.append(f"{prefix}_llm_time_to_first_token_seconds_max{labels} {llm['max_time_to_first_token']:.6f}")
+        lines.append(f'{prefix}_llm_tokens_total{{node="{node}",type="input"}} {llm["input_tokens"]}')
+        lines.append(f'{prefix}_llm_tokens_total{{node="{node}",type="output"}} {llm["output_tokens"]}')
+        lines.append(f"{prefix}_llm_cost_usd_total{labels} {llm['cost']:.8f}")
+    return "\n".join(lines) + "\n"
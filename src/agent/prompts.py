@@ -79,6 +79,18 @@ The results MUST only contain {num_queries} queries.
 Respond with JSON only. Do not include any additional text.
 """
 
+query_complexity_prompt="""
+Order the queries from the most to the least important, and rate the complexity of the user request in a "complexity" field of the JSON:
+- 1: a simple or factual question that one or two authoritative sources answer
+- 2: a question that needs several sources or perspectives
+- 3: a broad, open-ended or multi-faceted topic that needs comprehensive coverage
+
+{{
+  "search_queries": ["query 1", "...", "query N"],
+  "complexity": 1, 2 or 3
+}}
+"""
+
 notes_prompt="""
 You are a research assistant synthesizing information from a web source. Your task is to generate a concise notes from the provided content.
 
@@ -99,6 +111,67 @@ Content:
 {search_result}
 """
 
+batch_notes_prompt="""
+You are a research assistant synthesizing information from several web sources. Your task is to generate concise notes for each source separately.
+
+Requirements:
+- Write notes for every source, identified by the id of its source tag
+- Base the notes of each source strictly on the content of that source
+- Highlight relevant information from the content
+- Include as much detail as possible
+- Do NOT introduce external knowledge or assumptions
+- Extract factual claims, key arguments, and important statistics
+- The notes should be short, concise, and focused
+- Summarize each source into 5 to 10 bullet points
+
+Formatting:
+- Start the notes of each source directly, without preamble or titles. Do not use XML tags in the notes.
+- Write in point form
+
+Sources:
+{search_results}
+"""
+
+merge_notes_prompt="""
+You are a research assistant combining notes taken from consecutive parts of the same web source. Your task is to merge them into a single set of concise notes.
+
+Requirements:
+- Keep every distinct fact, claim, and statistic from the partial notes
+- Remove repeated points
+- Base all notes strictly on the provided partial notes
+- Do NOT introduce external knowledge or assumptions
+- The notes should be short, concise, and focused
+- Summarize the partial notes into 5 to 10 bullet points
+
+Formatting:
+- Start directly with the notes, without preamble or titles. Do not use XML tags in the output.
+- Write in point form
+
+Partial notes:
+{notes}
+"""
+
+compress_notes_prompt="""
+You are a research assistant condensing the research notes about one subtopic of a research topic into a short section digest for the writer of a report.
+
+Research topic:
+"{user_prompt}"
+
+Requirements:
+- Keep the most important facts, claims, and statistics, and drop repeated or minor points
+- Keep the source of every point: end each point with the title and url of its source in parentheses, exactly as they appear in the notes
+- Base the digest strictly on the provided notes
+- Do NOT introduce external knowledge or assumptions
+- Use at most {max_words} words
+
+Formatting:
+- Start with one line naming the subtopic, followed by the points. Do not use XML tags in the output.
+- Write in point form
+
+Notes:
+{notes}
+"""
+
 followup_prompt="""
 You are a research assistant reviewing information collected about a topic.
 
@@ -131,10 +204,24 @@ Topic:
 "{user_prompt}"
 
 
-Information collected:
+Digest of the information reviewed in earlier rounds:
+"{digest}"
+
+New information collected:
 "{summary}"
 """
 
+followup_digest_prompt="""
+Also update the digest of the information collected so far with the new information, in a "digest" field of the JSON.
+Keep the digest concise: the key facts, figures, and open questions in point form, without repeating points
+
+{{
+  "needs_followup": true,
+  "follow_up_question": "<single best question>",
+  "digest": "<updated digest of all information collected so far>"
+}}
+"""
+
 report_generation_prompt="""
 You are a research assistant writing a final report for a user. Your task is to produce a clear, well-structured research report that answers the user topic using ONLY the collected research notes provided below.
 
@@ -0,0 +1,91 @@
+"""Cheap local relevance ranking of search results with BM25, used before paying for LLM summaries."""
+
+import re
+from collections import Counter
+
+import numpy as np
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when where which who why will with".split()
+)
+
+
+def _stem(term):
+    """
+    Strips common English suffixes so inflections of a word ("bleached", "bleaching") share a term
+    """
+    for suffix in ("ing", "ed", "s"):
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase, lightly stemmed word terms without common stopwords
+
+    Args:
+        text: The text to split
+
+    Return:
+        The list of terms in their original order
+    """
+    return [_stem(t) for t in re.findall(r"\w+", text.lower()) if t not in _STOPWORDS]
+
+
+def bm25_scores(documents, query, k1=1.5, b=0.75):
+    """
+    Scores each document against the query with Okapi BM25
+
+    Args:
+        documents: The list of document texts
+        query: The query text
+        k1: Controls how quickly repeated occurrences of a term stop adding to the score
+        b: Controls how strongly long documents are penalized
+
+    Return:
+        A numpy array with the score of each document
+    """
+    terms = sorted(set(tokenize(query)))
+    if not documents or not terms:
+        return np.zeros(len(documents))
+
+    index = {term: i for i, term in enumerate(terms)}
+    # term frequency matrix restricted to the query terms: documents x terms
+    tf = np.zeros((len(documents), len(terms)))
+    lengths = np.zeros(len(documents))
+    for row, document in enumerate(documents):
+        tokens = tokenize(document)
+        lengths[row] = len(tokens)
+        for term, count in Counter(t for t in tokens if t in index).items():
+            tf[row, index[term]] = count
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(documents) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def select_relevant_sources(sources, query, max_sources=0, threshold=0.0):
+    """
+    Keeps the search results that are most relevant to the query
+
+    Args:
+        sources: The list of search results, containing the query, title, url, and raw content
+        query: The research topic and search queries the results should be relevant to
+        max_sources: The maximum number of search results to keep. All results are kept if 0
+        threshold: The minimum score relative to the best result, between 0 and 1, for a result to be kept
+
+    Return:
+        The kept search results in their original order
+    """
+    if not sources:
+        return []
+    scores = bm25_scores([s['title'] + '\n' + s['content'] for s in sources], query)
+    best = scores.max()
+    relative = scores / best if best > 0 else np.ones(len(sources))
+
+    keep = [i for i in range(len(sources)) if relative[i] >= threshold]
+    if max_sources:
+        keep = sorted(sorted(keep, key=lambda i: -scores[i])[:max_sources])
+    return [sources[i] for i in keep]
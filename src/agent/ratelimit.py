@@ -0,0 +1,161 @@
+"""Shared scheduling of LLM calls: a concurrency limit, request and token rate limits, and backoff on rate limit errors.
+
+Every LLM call in the graph goes through the same limiter, so the burst of summarize calls from the
+fan-out, and the calls of concurrent runs in the same process, queue up instead of hitting the
+provider's limits all at once.
+"""
+
+import asyncio
+import random
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to a per-minute capacity.
+    """
+
+    def __init__(self, per_minute):
+        """
+        Args:
+            per_minute: The number of units (requests or tokens) available per minute
+        """
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount):
+        """
+        Wait until the bucket holds the amount, then take it. Amounts above the capacity take the whole bucket
+        """
+        amount = min(amount, self.capacity)
+        # waiters are served one at a time, in order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+
+class RateLimiter:
+    """
+    Limits the number of concurrent LLM calls and the requests and tokens sent per minute, and pauses every caller after a rate limit error.
+    """
+
+    def __init__(self, max_concurrency=0, requests_per_minute=0, tokens_per_minute=0, max_retries=5):
+        """
+        Args:
+            max_concurrency: The maximum number of calls running at the same time. Unlimited if 0
+            requests_per_minute: The maximum number of calls started per minute. Unlimited if 0
+            tokens_per_minute: The maximum number of prompt tokens sent per minute. Unlimited if 0
+            max_retries: The maximum number of times a call is retried after a rate limit error
+        """
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self.calls = 0
+        self.queued_calls = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.rate_limit_errors = 0
+
+    @asynccontextmanager
+    async def limit(self, tokens=0):
+        """
+        Wait for a free slot and for enough request and token capacity, then hold the slot while the call runs
+
+        Args:
+            tokens: The estimated number of tokens sent by the call
+        """
+        start = time.monotonic()
+        if self._semaphore is not None:
+            await self._semaphore.acquire()
+        try:
+            while time.monotonic() < self._paused_until:
+                await asyncio.sleep(self._paused_until - time.monotonic())
+            if self._requests is not None:
+                await self._requests.acquire(1)
+            if self._tokens is not None and tokens:
+                await self._tokens.acquire(tokens)
+
+            wait = time.monotonic() - start
+            self.calls += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait > 0.001:
+                self.queued_calls += 1
+            yield wait
+        finally:
+            if self._semaphore is not None:
+                self._semaphore.release()
+
+    def backoff(self, attempt, error=None):
+        """
+        Record a rate limit error and pause every caller of this limiter
+
+        Args:
+            attempt: The number of times the call was already retried
+            error: The rate limit error, whose Retry-After header is honored if present
+
+        Return:
+            The number of seconds the caller should wait before retrying
+        """
+        self.rate_limit_errors += 1
+        delay = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = float(response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                delay = None
+        if delay is None:
+            # exponential backoff with jitter, capped at one minute
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    @property
+    def stats(self):
+        """
+        The number of calls, how many of them had to wait, the total and longest wait in seconds, and the number of rate limit errors
+        """
+        return {
+            "calls": self.calls,
+            "queued_calls": self.queued_calls,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+            "rate_limit_errors": self.rate_limit_errors,
+        }
+
+
+_limiters = weakref.WeakKeyDictionary() # event loop -> {limits -> RateLimiter}
+
+
+def get_rate_limiter(max_concurrency=0, requests_per_minute=0, tokens_per_minute=0, max_retries=5):
+    """
+    Obtain the limiter shared by every LLM call with the same limits on the running event loop
+
+    Args:
+        max_concurrency: The maximum number of calls running at the same time. Unlimited if 0
+        requests_per_minute: The maximum number of calls started per minute. Unlimited if 0
+        tokens_per_minute: The maximum number of prompt tokens sent per minute. Unlimited if 0
+        max_retries: The maximum number of times a call is retried after a rate limit error
+
+    Return:
+        The rate limiter
+    """
+    key = (max_concurrency, requests_per_minute, tokens_per_minute, max_retries)
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    if key not in limiters:
+        limiters[key] = RateLimiter(*key)
+    return limiters[key]
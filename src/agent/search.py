@@ -0,0 +1,342 @@
+"""Search backends that return the pages the agent summarizes.
+
+A backend has a `name`, used to keep its entries apart in the search cache, and a
+`search(query, max_results)` method that returns a list of {'title', 'url', 'content'} results.
+Two backends are available, selected with the `search_backend` configuration value:
+
+- TavilySearch calls the Tavily API with the shared client from agent.clients
+- LocalIndexSearch runs BM25 over an inverted index of a directory of local documents
+
+The local index is stored as numpy arrays in a directory and memory-mapped when it is opened, so
+startup does not depend on the size of the corpus and only the postings of the query terms are read.
+It is built on first use, and rebuilt when the documents change: a process that keeps the index open
+checks the documents again every FINGERPRINT_INTERVAL seconds. It can be built ahead of time with:
+
+    python -m agent.search path/to/documents .cache/index
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from agent.clients import get_search_client
+from agent.ranking import tokenize
+
+DOCUMENT_SUFFIXES = (".txt", ".md", ".markdown", ".rst", ".html", ".htm")
+MAX_TERM_LENGTH = 64 # Longer terms (hashes, encoded data) are not indexed, since they would widen every stored term
+INDEX_VERSION = 2
+ARRAYS = ("terms", "offsets", "postings", "frequencies", "lengths")
+FINGERPRINT_INTERVAL = 10.0 # Minimum number of seconds between two checks of an open index for changed documents
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_backends = {}
+
+
+class TavilySearch:
+    """
+    Searches the web with the Tavily API
+    """
+
+    name = "tavily"
+
+    def search(self, query, max_results):
+        """
+        Args:
+            query: The search query
+            max_results: The maximum number of results to return
+
+        Return:
+            A list of results with the title, url, and raw content of the page. Results without raw content are dropped
+        """
+        response = get_search_client().search(
+            query=query,
+            max_results=max_results,
+            include_raw_content="text"
+        )
+        return [{
+            'title': r['title'],
+            'url': r['url'],
+            'content': r['raw_content']
+        } for r in response['results'] if r['raw_content']]
+
+
+class LocalIndexSearch:
+    """
+    Searches a directory of local text, Markdown and HTML documents with BM25 over an on-disk inverted index.
+
+    The index directory holds the sorted vocabulary, the offset of each term's postings, the document ids and term
+    frequencies of the postings, the length of each document, and a JSON file with the document paths and titles.
+    The arrays are memory-mapped read-only, so a single instance can be shared by the search worker threads.
+    """
+
+    def __init__(self, index_path, documents_path=None, k1=1.5, b=0.75):
+        """
+        Args:
+            index_path: The directory of the index
+            documents_path: The directory of the documents. If provided, the index is built when it is missing and rebuilt when
+                documents were added, removed or modified since it was built
+            k1: Controls how quickly repeated occurrences of a term stop adding to the score
+            b: Controls how strongly long documents are penalized
+        """
+        self.index_path = str(index_path)
+        self.name = f"local:{os.path.abspath(self.index_path)}"
+        self.k1 = k1
+        self.b = b
+
+        if documents_path:
+            fingerprint = documents_fingerprint(documents_path)
+            metadata = read_index_metadata(index_path)
+            if metadata.get("fingerprint") != fingerprint or metadata.get("version") != INDEX_VERSION:
+                build_index(documents_path, index_path)
+
+        # the metadata names the build of its arrays. A rebuild that finishes in between removes the arrays of
+        # older builds, so read the metadata of the new build and try again
+        for attempt in range(3):
+            metadata = read_index_metadata(index_path)
+            if metadata.get("version") != INDEX_VERSION:
+                raise FileNotFoundError(f"No search index in {index_path}. Set local_documents_path to build one")
+            try:
+                arrays = [
+                    np.load(os.path.join(index_path, f"{array}.{metadata['build']}.npy"), mmap_mode="r") for array in ARRAYS
+                ]
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+
+        self.fingerprint = metadata.get("fingerprint")
+        self.checked_at = time.monotonic()
+        self.documents_path = metadata["documents_path"]
+        self.documents = metadata["documents"]
+        self.average_length = metadata["average_length"]
+        self.terms, self.offsets, self.postings, self.frequencies, self.lengths = arrays
+
+    def scores(self, query):
+        """
+        Scores every document against the query with Okapi BM25, reading only the postings of the query terms
+
+        Return:
+            A numpy array with the score of each document
+        """
+        scores = np.zeros(len(self.documents))
+        for term in set(tokenize(query)):
+            i = int(np.searchsorted(self.terms, term))
+            if i == len(self.terms) or self.terms[i] != term:
+                continue
+            start, end = self.offsets[i], self.offsets[i + 1]
+            documents = self.postings[start:end]
+            tf = self.frequencies[start:end].astype(float)
+            idf = math.log1p((len(self.documents) - len(documents) + 0.5) / (len(documents) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[documents] / max(self.average_length, 1))
+            scores[documents] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, max_results):
+        """
+        Args:
+            query: The search query
+            max_results: The maximum number of results to return
+
+        Return:
+            A list of the best matching documents, most relevant first, with the title, file url, and text of the document
+        """
+        scores = self.scores(query)
+        # partial sort: only the best max_results documents are ordered
+        best = np.argpartition(-scores, max_results - 1)[:max_results] if 0 < max_results < len(scores) else np.arange(len(scores))
+        best = sorted((i for i in best if scores[i] > 0), key=lambda i: (-scores[i], i))
+
+        results = []
+        for i in best:
+            path = Path(self.documents_path, self.documents[i]["path"])
+            try:
+                content = read_document(path)
+            except OSError:
+                # removed since the index was built
+                continue
+            results.append({'title': self.documents[i]["title"], 'url': path.as_uri(), 'content': content})
+        return results
+
+
+def get_search_backend(name="tavily", index_path=None, documents_path=None):
+    """
+    Obtain the shared search backend, opening (and if needed building) a local index only once per process.
+    An open index is checked for changed documents at most every FINGERPRINT_INTERVAL seconds, and replaced by a rebuilt one if they changed
+
+    Args:
+        name: "tavily" or "local"
+        index_path: The directory of the local index
+        documents_path: The directory of the documents indexed by the local backend
+
+    Return:
+        The search backend
+    """
+    if name == "tavily":
+        return TavilySearch()
+    if name != "local":
+        raise ValueError(f"Unknown search backend: {name}")
+
+    key = (os.path.abspath(index_path), os.path.abspath(documents_path) if documents_path else None)
+    with _lock:
+        backend = _backends.get(key)
+        if backend is not None and documents_path and time.monotonic() - backend.checked_at > FINGERPRINT_INTERVAL:
+            backend.checked_at = time.monotonic()
+            if documents_fingerprint(documents_path) != backend.fingerprint:
+                backend = None
+        if backend is None:
+            backend = _backends[key] = LocalIndexSearch(index_path, documents_path)
+        return backend
+
+
+def close_search_backends():
+    """
+    Forget the opened local indexes, so they are reopened (and rebuilt if the documents changed) on the next search
+    """
+    with _lock:
+        _backends.clear()
+
+
+def read_document(path):
+    """
+    Read a document as plain text. Tags, scripts and styles are removed from HTML documents
+    """
+    text = Path(path).read_text(encoding="utf-8", errors="ignore")
+    if Path(path).suffix.lower() in (".html", ".htm"):
+        text = re.sub(r"(?is)<(script|style)\b.*?</\1>", " ", text)
+        text = re.sub(r"<[^>]+>", " ", text)
+        text = re.sub(r"[ \t]+", " ", text)
+    return text.strip()
+
+
+def _title_of(path, text):
+    """
+    Use the HTML title or the first line of a document as its title, or the file name if the document is empty
+    """
+    if Path(path).suffix.lower() in (".html", ".htm"):
+        match = re.search(r"(?is)<title>(.*?)</title>", Path(path).read_text(encoding="utf-8", errors="ignore"))
+        if match and match.group(1).strip():
+            return match.group(1).strip()[:200]
+    for line in text.splitlines():
+        line = line.strip().lstrip("#").strip()
+        if line:
+            return line[:200]
+    return Path(path).stem
+
+
+def _document_paths(documents_path):
+    return sorted(
+        p for p in Path(documents_path).rglob("*")
+        if p.is_file() and p.suffix.lower() in DOCUMENT_SUFFIXES
+    )
+
+
+def documents_fingerprint(documents_path):
+    """
+    Hash the relative path, size and modification time of every document, so a changed corpus is detected without reading it
+    """
+    digest = hashlib.sha256(os.path.abspath(documents_path).encode())
+    for path in _document_paths(documents_path):
+        stat = path.stat()
+        digest.update(f"\0{path.relative_to(documents_path)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+def read_index_metadata(index_path):
+    """
+    Read the metadata of an index, or an empty dictionary if there is no index in the directory
+    """
+    try:
+        with open(os.path.join(index_path, "index.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_index(documents_path, index_path):
+    """
+    Build the inverted index of a directory of documents
+
+    Each build writes its arrays to new files named after the build, then replaces the metadata file, which names the
+    build, in a single atomic step. A process opening the index while it is rebuilt therefore reads either the old
+    metadata with the old arrays or the new metadata with the new arrays. The arrays of the build before the replaced
+    one are removed, so readers that just opened the replaced build can still load its arrays
+
+    Args:
+        documents_path: The directory of text, Markdown and HTML documents, searched recursively
+        index_path: The directory where the index is stored. It is created if missing
+
+    Return:
+        The number of indexed documents
+    """
+    os.makedirs(index_path, exist_ok=True)
+    fingerprint = documents_fingerprint(documents_path)
+
+    documents = []
+    lengths = []
+    postings = {}
+    for path in _document_paths(documents_path):
+        text = read_document(path)
+        terms = [t for t in tokenize(text) if len(t) <= MAX_TERM_LENGTH]
+        for term, count in Counter(terms).items():
+            postings.setdefault(term, []).append((len(documents), count))
+        documents.append({"path": str(path.relative_to(documents_path)), "title": _title_of(path, text)})
+        lengths.append(len(terms))
+
+    vocabulary = sorted(postings)
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in vocabulary])
+    entries = [entry for term in vocabulary for entry in postings[term]]
+    arrays = {
+        "terms": np.array(vocabulary, dtype=f"U{max(map(len, vocabulary), default=1)}"),
+        "offsets": offsets,
+        "postings": np.array([d for d, _ in entries], dtype=np.int32),
+        "frequencies": np.array([c for _, c in entries], dtype=np.int32),
+        "lengths": np.array(lengths, dtype=np.int32),
+    }
+    build = uuid.uuid4().hex
+    for array, values in arrays.items():
+        np.save(os.path.join(index_path, f"{array}.{build}.npy"), values)
+
+    previous = read_index_metadata(index_path).get("build")
+    metadata = {
+        "version": INDEX_VERSION,
+        "build": build,
+        "fingerprint": fingerprint,
+        "documents_path": os.path.abspath(documents_path),
+        "documents": documents,
+        "average_length": float(np.mean(lengths)) if lengths else 0.0,
+    }
+    temporary = os.path.join(index_path, f"index.{os.getpid()}.tmp.json")
+    with open(temporary, "w") as f:
+        json.dump(metadata, f)
+    os.replace(temporary, os.path.join(index_path, "index.json"))
+
+    for path in Path(index_path).glob("*.npy"):
+        if path.stem.split(".")[-1] not in (build, previous):
+            path.unlink(missing_ok=True)
+    return len(documents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local search index of a directory of documents")
+    parser.add_argument("documents", help="Directory of text, Markdown and HTML documents")
+    parser.add_argument("index", nargs="?", default=".cache/index", help="Directory where the index is stored")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.info("Indexed %d documents in %s", build_index(args.documents, args.index), args.index)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Coalescing of identical calls that are in flight at the same time.
+
+When concurrent runs research overlapping topics, they issue the same search queries and summarize
+the same pages. The caches only help once the first call has finished, so a SingleFlight shares the
+call that is already running instead: the first caller for a key runs it, and callers that arrive
+before it finishes wait for the same result, or the same exception.
+"""
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time, across the threads and runs of the process.
+
+    call() is for synchronous functions, such as search backends running in worker threads, and
+    acall() is for coroutines, such as LLM calls. Async calls run in their own task, so a caller that
+    is cancelled does not cancel the call for the others.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def call(self, key, function):
+        """
+        Args:
+            key: The hashable key of the call, such as a hash of the request
+            function: The function that makes the call, without arguments
+
+        Return:
+            The result of the call that was in flight for the key, or of a new call if there was none
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = function()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def acall(self, key, function):
+        """
+        Args:
+            key: The hashable key of the call, such as a hash of the request
+            function: The coroutine function that makes the call, without arguments
+
+        Return:
+            The result of the call that was in flight for the key, or of a new call if there was none
+        """
+        loop = asyncio.get_running_loop()
+        # tasks can only be awaited from their own event loop
+        key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(key)
+            if task is None or task.get_loop() is not loop:
+                task = self._tasks[key] = loop.create_task(function())
+                task.add_done_callback(lambda t: self._forget(key, t))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    @property
+    def stats(self):
+        """
+        The number of calls made and the number of calls that shared a call in flight
+        """
+        return {"calls": self.calls, "coalesced": self.coalesced}
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name):
+    """
+    Obtain the process-wide SingleFlight for a kind of call, such as "search" or "summarize"
+    """
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight()
+        return _flights[name]
+
+
+def clear_single_flights():
+    """
+    Drop the SingleFlights of the process and their counters. Calls in flight still complete for their callers
+    """
+    with _flights_lock:
+        _flights.clear()
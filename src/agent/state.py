@@ -2,10 +2,36 @@ from __future__ import annotations
 
 import operator
 from dataclasses import dataclass, field
-from typing_extensions import Annotated
 
 from langgraph.graph import MessagesState
-from typing_extensions import TypedDict
+from typing_extensions import Annotated, TypedDict
+
+from agent.metrics import merge_metrics
+
+
+def add_counts(current: dict, update: dict) -> dict:
+    """Sum the counters in two dictionaries, used as the reducer for run statistics."""
+    merged = dict(current or {})
+    for key, value in (update or {}).items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+@dataclass(frozen=True, slots=True)
+class Note:
+    """Point-form notes summarized from one search result.
+
+    Notes are immutable, so a list of notes can be formatted once and the result reused.
+    """
+
+    title: str # Title of the search result
+    url: str # URL of the search result
+    text: str # The notes, without empty lines
+
+    @classmethod
+    def from_summary(cls, title: str, url: str, summary: str) -> Note:
+        """Create a note from an LLM summary, removing its empty lines."""
+        return cls(title, url, '\n'.join(line for line in summary.splitlines() if line.strip()))
 
 
 @dataclass
@@ -28,13 +54,20 @@ class State(MessagesState):
     topic: str = field(default=None)  # Research topic obtained from the input message
     clarification_messages: Annotated[list, operator.add] = field(default_factory=list) # List of clarification questions and answers
     needs_clarification: bool = field(default=False) # True if the research topic is unclear
+    started_at: float = field(default=0.0) # Time the current run started, in seconds since the epoch, from which the deadline counts
+    prefetched: str = field(default=None) # The last stage ("queries" or "search_results") that already ran speculatively during the clarification check
     queries: list = field(default=list) # List of search queries generated based on the research topic and clarification messages
-    search_results: list = field(default=list) # The search results for each query, containing the title, url, and raw content
+    complexity: int = field(default=0) # Complexity of the topic of the current round rated during query generation with adaptive_depth, from 1 to 3. 0 if not rated
+    search_results: list = field(default=list) # The search results for each query, containing the title, url, and a handle to the raw content in the content store (see agent.content)
     source: dict = field(default_factory=dict) # An individual search result to send to the summarizer node
-    notes: Annotated[list, operator.add] = field(default_factory=list) # summaries of each search result in point form
+    sources: list = field(default_factory=list) # A batch of search results to send to the batch summarizer node
+    notes: Annotated[list[Note], operator.add] = field(default_factory=list) # Note for each summarized search result
     needs_followup: bool = field(default=False) # True if the summary notes are insufficient for writing a report on the research topic
     follow_up_question: str = field(default=None) # A follow-up question to fill knowledge gaps with additional research on the topic
     num_followup_attempts: int = field(default=0) # Counts the number of times the agent followed up on insufficient information
+    research_digest: str = field(default=None) # Condensed digest of the notes judged by the followup node in earlier rounds
+    num_judged_notes: int = field(default=0) # Number of notes covered by the research digest, so each followup round only reads the new notes
     final_report: str = field(default=None) # The final report to be outputted
     research_notes: str = field(default=None) # The research notes used to generate the final report
-    
\ No newline at end of file
+    run_stats: Annotated[dict, add_counts] = field(default_factory=dict) # Counters for the current run, such as summary cache hits and misses
+    metrics: Annotated[dict, merge_metrics] = field(default_factory=dict) # Latency, token and cost metrics of the current run, per node and in total
@@ -1,11 +1,24 @@
 
-import os
-from datetime import datetime
+import asyncio
+import contextlib
 import json
+import logging
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import openai
 
-from langchain_openai import ChatOpenAI
+from agent.chunking import count_tokens
+from agent.clients import get_llm
+from agent.dedupe import normalize_url
+from agent.metrics import record_llm_call, usage_of
+from agent.search import TavilySearch
+from agent.singleflight import get_single_flight
 
-from tavily import TavilyClient
+logger = logging.getLogger(__name__)
+
+MAX_SEARCH_RESULTS = 20 # The most results the search API returns for a single query
 
 
 def get_current_date():
@@ -49,64 +62,216 @@ def call_llm(model, prompt, structure=None):
         The response from the LLM, either a structured object or an unstructured AI message
     """
     
-    llm = ChatOpenAI(
-        model=model,
-        # stream_usage=True,
-        # temperature=None,
-        # max_tokens=None,
-        # timeout=None,
-        # reasoning_effort="low",
-        # max_retries=2,
-        api_key=os.getenv("OPENAI_API_KEY"),
-        # base_url="...",
-        # organization="...",
-        # other params...
-    )
+    llm = get_llm(model, structure)
+    
+    start = time.perf_counter()
+    response = llm.invoke(prompt) # return structured output if a structure is provided, otherwise text output
+    
+    return _finish_llm_call(model, response, structure, time.perf_counter() - start)
+
+
+async def acall_llm(model, prompt, structure=None, limiter=None):
+    """
+    Calls the OpenAI api with the given prompt without blocking the event loop and returns the LLM output
+    
+    Args:
+        model: The name of the OpenAI GPT model to use
+        prompt: The prompt to input into the LLM
+        structure: The class that defines the fields of the structured output. If not provided, the output would be unstructured text
+        limiter: The rate limiter that schedules the call and retries it after rate limit errors. If not provided, the call starts immediately
+        
+    Return:
+        The response from the LLM, either a structured object or an unstructured AI message
+    """
+    
+    llm = get_llm(model, structure)
+    start = time.perf_counter()
+    
+    if limiter is None:
+        response = await llm.ainvoke(prompt) # return structured output if a structure is provided, otherwise text output
+        return _finish_llm_call(model, response, structure, time.perf_counter() - start)
     
+    tokens = count_tokens(prompt, model)
+    queue_time = 0.0
+    attempt = 0
+    while True:
+        async with limiter.limit(tokens) as wait:
+            queue_time += wait
+            try:
+                response = await llm.ainvoke(prompt)
+                return _finish_llm_call(model, response, structure, time.perf_counter() - start, queue_time)
+            except openai.RateLimitError as e:
+                if attempt >= limiter.max_retries:
+                    raise
+                # pause the limiter; the next attempt waits in limiter.limit() until the pause is over
+                limiter.backoff(attempt, e)
+        attempt += 1
+
+
+def _finish_llm_call(model, response, structure, wall_time, queue_time=0.0):
+    """
+    Records the timing and token usage of an LLM call and unwraps structured output
+    
+    Return:
+        The structured object if a structure is provided, otherwise the AI message
+    """
+    message = response
     if structure:
-        response = llm.with_structured_output(structure).invoke(prompt) # return structured output
-    else:
-        response = llm.invoke(prompt) # return text output
-            
+        if response.get('parsing_error'):
+            raise response['parsing_error']
+        message, response = response['raw'], response['parsed']
+    
+    input_tokens, output_tokens = usage_of(message)
+    record_llm_call(model, wall_time, queue_time, input_tokens=input_tokens, output_tokens=output_tokens)
+    
     return response
 
 
-def get_search_results(query, max_results):
+async def astream_llm(model, prompt, limiter=None):
+    """
+    Calls the OpenAI api with the given prompt and yields the unstructured text output as it is generated
+    
+    Args:
+        model: The name of the OpenAI GPT model to use
+        prompt: The prompt to input into the LLM
+        limiter: The rate limiter that schedules the call and retries it after rate limit errors that occur before the first chunk
+        
+    Return:
+        An async iterator of AI message chunks. Adding the chunks together gives the complete response
+    """
+    
+    llm = get_llm(model)
+    start = time.perf_counter()
+    queue_time = 0.0
+    first_token = None
+    input_tokens = output_tokens = 0
+    
+    attempt = 0
+    while True:
+        started = False
+        async with (limiter.limit(count_tokens(prompt, model)) if limiter else contextlib.nullcontext(0.0)) as wait:
+            queue_time += wait
+            try:
+                async for chunk in llm.astream(prompt):
+                    started = True
+                    if first_token is None and chunk.text:
+                        first_token = time.perf_counter() - start
+                    chunk_input_tokens, chunk_output_tokens = usage_of(chunk)
+                    input_tokens += chunk_input_tokens
+                    output_tokens += chunk_output_tokens
+                    yield chunk
+                break
+            except openai.RateLimitError as e:
+                if limiter is None or started or attempt >= limiter.max_retries:
+                    raise
+                limiter.backoff(attempt, e)
+        attempt += 1
+    
+    record_llm_call(model, time.perf_counter() - start, queue_time, first_token, input_tokens, output_tokens)
+
+
+def normalize_query(query):
     """
-    Calls the search API with the query to return the title, url, and raw content of the results
+    Normalizes a search query so near-identical queries share a cache entry
+    
+    Args:
+        query: The search query
+        
+    Return:
+        The query in lowercase with collapsed whitespace and without surrounding quotes or punctuation
+    """
+    return ' '.join(query.lower().split()).strip(' \'"?.!,;:')
+
+
+def get_search_results(query, max_results, cache=None, refresh=False, exclude_urls=(), backend=None, coalesce=False):
+    """
+    Calls the search backend with the query to return the title, url, and raw content of the results
     
     Args:
         query: The search query
         max_results: The maximum number of results to return
+        cache: The search cache to read and store results. If not provided, the search API is always called
+        refresh: Ignore the cached results and store fresh results from the search API
+        exclude_urls: Normalized URLs of pages that were already covered. Their results are skipped in favor of further results
+        backend: The search backend. Defaults to the Tavily API
+        coalesce: Share the search API call with identical calls that are already in flight, from this or other runs
         
     Return:
         A list of search results for the query, containing the title, url, and raw content
     """
     
-    client = TavilyClient(os.getenv("TAVILY_API_KEY"))
+    # obtain more than max_results results from the search API, and enough extra results to replace the covered pages
+    num_requested = max_results*2
+    if exclude_urls:
+        num_requested = max(num_requested, min(MAX_SEARCH_RESULTS, num_requested + len(exclude_urls)))
+    
+    backend = backend or TavilySearch()
+    key = json.dumps([backend.name, normalize_query(query), num_requested])
+    results = None
+    if cache is not None and not refresh:
+        results = cache.get(key)
+    
+    if results is None:
+        def fetch():
+            # keep every result, so results can still be skipped after caching
+            results = backend.search(query, num_requested)
+            if cache is not None:
+                cache.set(key, results)
+            return results
+        
+        results = get_single_flight("search").call(key, fetch) if coalesce else fetch()
+    
+    # obtain only max_results results that were not already covered
+    if exclude_urls:
+        results = [r for r in results if normalize_url(r['url']) not in exclude_urls]
+    
+    return [{**r, 'query': query} for r in results[:max_results]]
+
+
+async def get_all_search_results(queries, max_results, max_concurrency=5, timeout=None, cache=None, refresh=False, exclude_urls=(), backend=None, coalesce=False, deadline=None):
+    """
+    Calls the search API with each query concurrently and combines the results in the order of the queries
+    
+    Args:
+        queries: The list of search queries
+        max_results: The maximum number of results to return for each query
+        max_concurrency: The maximum number of queries to run at the same time
+        timeout: The maximum number of seconds to wait for a single query. Queries that time out return no results
+        cache: The search cache to read and store results
+        refresh: Ignore the cached results and store fresh results from the search API
+        exclude_urls: Normalized URLs of pages that were already covered, which are skipped
+        backend: The search backend. Defaults to the Tavily API
+        coalesce: Share each search API call with identical calls that are already in flight
+        deadline: The time, in seconds since the epoch, by which every query must finish, including the time it waits for its turn. Queries that miss it return no results
+        
+    Return:
+        A list of search results for all of the queries, containing the query, title, url, and raw content
+    """
+    
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
     
-    # obtain more than max_results results from the search API
-    response = client.search(
-        query=query,
-        max_results=max_results*2,
-        include_raw_content="text"
-    )
+    async def search(query):
+        async with semaphore:
+            query_timeout = timeout
+            if deadline is not None:
+                query_timeout = max(0.0, deadline - time.time()) if timeout is None else max(0.0, min(timeout, deadline - time.time()))
+            try:
+                # the search backends are synchronous, so run them in a worker thread to keep the event loop free
+                return await asyncio.wait_for(asyncio.to_thread(get_search_results, query, max_results, cache, refresh, exclude_urls, backend, coalesce), query_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Search query timed out after %ss: %s", query_timeout, query)
+                return []
     
-    # obtain only max_results results where the raw content is available
-    results = [r for r in response['results'] if r['raw_content']]
-    results = results[:max_results]
+    # gather keeps the results in the same order as the queries regardless of which finishes first
+    results = await asyncio.gather(*[search(query) for query in queries])
     
-    return [{
-        'query': query, 
-        'title': r['title'], 
-        'url': r['url'], 
-        'content': r['raw_content']
-    } for r in results]
+    return [r for query_results in results for r in query_results]
 
 
 def format_research_notes(notes):
     """
     Converts the notes for each source into a single string where each section starts with the title and url.
+    The result is memoized, so formatting the same notes again (for example in the followup and final_report nodes) is free.
     
     Args:
         notes: The list of research notes for each source, with the corresponding title and url
@@ -114,15 +279,14 @@ def format_research_notes(notes):
     Returns:
         A single string where each section starts with the title and url
     """
-    result = ""
-    for source in notes:
-        # clean up empty lines
-        content = source['notes']
-        lines = content.splitlines()
-        content = '\n'.join([line for line in lines if line.strip()])
-    
-        # add the notes in the format:
-        # [title] ([url]): 
-        # [content]
-        result += '\n'+source['title']+' ('+source['url']+'):'+'\n'+content+'\n'
-    return result
+    return _format_notes(tuple(notes))
+
+
+@lru_cache(maxsize=16)
+def _format_notes(notes):
+    """
+    Formats a tuple of notes with a single join, in the format:
+    [title] ([url]):
+    [notes]
+    """
+    return ''.join([f'\n{note.title} ({note.url}):\n{note.text}\n' for note in notes])
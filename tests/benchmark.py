@@ -0,0 +1,217 @@
+"""Offline latency and throughput benchmark of the compiled graph.
+
+Runs the agent against the local stand-ins for the chat model and search API in tests/stubs.py, so no
+network access or API keys are needed. Model and search latencies and page sizes are drawn from
+seeded normal distributions, and the benchmark sweeps the number of queries, the number of results
+per query and the number of concurrent runs.
+
+Usage:
+    python tests/benchmark.py --num-queries 1 3 --results-per-query 2 4 --concurrency 1 8
+
+With --checkpoint-path, every run is stored in the SQLite checkpointer, and the benchmark also reports the
+serialized checkpoint size per run and the time spent writing per checkpoint.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import tracemalloc
+import uuid
+from itertools import product
+from unittest.mock import patch
+
+import numpy as np
+from stubs import FakeChatModel, StubTavilyClient, batch_notes
+
+import agent.clients
+from agent.cache import close_caches
+from agent.checkpoint import close_checkpointers, get_checkpointer
+from agent.clients import close_clients
+from agent.graph import make_graph
+
+
+def sampler(mean, spread, seed, minimum=0.0):
+    """
+    Create a function that draws values from a normal distribution, clipped at the minimum
+
+    Args:
+        mean: The mean of the distribution
+        spread: The standard deviation of the distribution. Every value equals the mean if 0
+        seed: The seed of the random number generator, so runs are reproducible
+        minimum: The smallest value returned
+
+    Return:
+        A function that ignores its arguments and returns the next value
+    """
+    rng = random.Random(seed)
+    return lambda *args: max(minimum, rng.gauss(mean, spread) if spread else mean)
+
+
+def make_stubs(llm_latency=0.05, llm_spread=0.0, token_latency=0.0, search_latency=0.1, search_spread=0.0,
+               content_words=500, content_spread=0, seed=0):
+    """
+    Create the chat model and search client used by the benchmark
+
+    The generated search queries contain the run's topic, so concurrent runs search for, and summarize, different pages
+
+    Return:
+        The FakeChatModel and the StubTavilyClient
+    """
+    llm = FakeChatModel(
+        delay=sampler(llm_latency, llm_spread, seed),
+        token_delay=token_latency,
+        structured={
+            "QueryGenerationOutput": lambda prompt: {
+                "search_queries": [f"{_topic_of(prompt)} query {i}" for i in range(10)],
+            },
+            "BatchNotesOutput": batch_notes,
+        },
+    )
+    search = StubTavilyClient(
+        delay=sampler(search_latency, search_spread, seed + 1),
+        content_words=lambda *args, size=sampler(content_words, content_spread, seed + 2, minimum=1): int(size()),
+    )
+    return llm, search
+
+
+def _topic_of(prompt):
+    match = re.search(r"benchmark topic \d+", prompt)
+    return match.group(0) if match else "benchmark topic"
+
+
+async def run_point(llm, num_queries, results_per_query, concurrency, repeat=1, first_topic=0, checkpoint_path=''):
+    """
+    Run the graph `repeat` times with `concurrency` concurrent runs each time, every run on a new topic and thread
+
+    Return:
+        The latency in seconds and the number of LLM calls of every run
+    """
+    config = {"configurable": {"num_queries": num_queries, "num_results_per_query": results_per_query, "checkpoint_path": checkpoint_path}}
+    graph = make_graph(config)
+
+    async def run(topic):
+        run_config = {"configurable": {**config["configurable"], "thread_id": str(uuid.uuid4())}}
+        start = time.perf_counter()
+        state = await graph.ainvoke({"messages": [{"role": "user", "content": f"benchmark topic {topic}"}]}, run_config)
+        return time.perf_counter() - start, state["metrics"]["total"]["llm"]["calls"]
+
+    results = []
+    for i in range(repeat):
+        topics = range(first_topic + i * concurrency, first_topic + (i + 1) * concurrency)
+        results += await asyncio.gather(*(run(topic) for topic in topics))
+    return results
+
+
+async def run_benchmark(num_queries=(3,), results_per_query=(2,), concurrency=(1,), repeat=3, checkpoint_path='', **stub_options):
+    """
+    Sweep every combination of the settings and measure each one
+
+    Args:
+        num_queries: The values of num_queries to run
+        results_per_query: The values of num_results_per_query to run
+        concurrency: The numbers of concurrent runs
+        repeat: The number of times each combination is run
+        checkpoint_path: The SQLite file that stores the checkpoints of every run. Runs are not checkpointed if empty
+        stub_options: The latency and size distributions passed to make_stubs
+
+    Return:
+        One dictionary per combination with the p50 and p95 run latency in seconds, the throughput in runs per second,
+        the mean number of LLM calls per run, and the peak traced memory in MB. With a checkpoint path, also the serialized
+        checkpoint KB per run and the milliseconds spent writing per checkpoint
+    """
+    rows = []
+    first_topic = 0
+    for nq, nr, c in product(num_queries, results_per_query, concurrency):
+        llm, search = make_stubs(**stub_options)
+        close_clients()
+        close_caches()
+        close_checkpointers()
+        with patch.object(agent.clients, "ChatOpenAI", lambda **kwargs: llm), \
+                patch.object(agent.clients, "TavilyClient", lambda *args, **kwargs: search):
+            tracemalloc.start()
+            start = time.perf_counter()
+            try:
+                results = await run_point(llm, nq, nr, c, repeat, first_topic, checkpoint_path)
+            finally:
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                checkpoints = get_checkpointer(checkpoint_path).stats if checkpoint_path else None
+                close_clients()
+                close_caches()
+                close_checkpointers()
+        first_topic += repeat * c
+
+        latencies = np.array([latency for latency, _ in results])
+        row = {
+            "num_queries": nq,
+            "results_per_query": nr,
+            "concurrency": c,
+            "runs": len(results),
+            "p50": float(np.percentile(latencies, 50)),
+            "p95": float(np.percentile(latencies, 95)),
+            "throughput": len(results) / elapsed,
+            "llm_calls": float(np.mean([calls for _, calls in results])),
+            "peak_memory_mb": peak / 2**20,
+        }
+        if checkpoints:
+            row["checkpoint_kb"] = checkpoints["bytes_written"] / len(results) / 1024
+            row["checkpoint_ms"] = 1000 * checkpoints["write_time"] / max(1, checkpoints["checkpoints"])
+        rows.append(row)
+    return rows
+
+
+def format_table(rows):
+    """
+    Format the benchmark results as a text table
+    """
+    checkpointed = any("checkpoint_kb" in r for r in rows)
+    header = f"{'queries':>7} {'results':>7} {'concur':>6} {'runs':>5} {'p50 s':>7} {'p95 s':>7} {'runs/s':>7} {'llm/run':>7} {'peak MB':>8}"
+    if checkpointed:
+        header += f" {'ckpt KB':>8} {'ckpt ms':>7}"
+    lines = [header, "-" * len(header)]
+    for r in rows:
+        line = (
+            f"{r['num_queries']:>7} {r['results_per_query']:>7} {r['concurrency']:>6} {r['runs']:>5} "
+            f"{r['p50']:>7.3f} {r['p95']:>7.3f} {r['throughput']:>7.2f} {r['llm_calls']:>7.1f} {r['peak_memory_mb']:>8.1f}"
+        )
+        if checkpointed:
+            line += f" {r.get('checkpoint_kb', 0.0):>8.1f} {r.get('checkpoint_ms', 0.0):>7.3f}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-queries", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--results-per-query", type=int, nargs="+", default=[2])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--repeat", type=int, default=3, help="Number of times each combination is run")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Mean seconds before the model responds")
+    parser.add_argument("--llm-spread", type=float, default=0.02, help="Standard deviation of the model latency")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument("--search-latency", type=float, default=0.1, help="Mean seconds per search request")
+    parser.add_argument("--search-spread", type=float, default=0.05, help="Standard deviation of the search latency")
+    parser.add_argument("--content-words", type=int, default=500, help="Mean number of words per search result")
+    parser.add_argument("--content-spread", type=int, default=200, help="Standard deviation of the words per search result")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--checkpoint-path", default="", help="Store every run in this SQLite checkpoint file and report the checkpoint size and write time")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run_benchmark(
+        args.num_queries, args.results_per_query, args.concurrency, args.repeat, args.checkpoint_path,
+        llm_latency=args.llm_latency, llm_spread=args.llm_spread, token_latency=args.token_latency,
+        search_latency=args.search_latency, search_spread=args.search_spread,
+        content_words=args.content_words, content_spread=args.content_spread, seed=args.seed,
+    ))
+    print(format_table(rows))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
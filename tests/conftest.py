@@ -1,6 +1,52 @@
 import pytest
+from stubs import FakeChatModel, StubTavilyClient
 
 
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    """Start and end every test with an empty client registry and no open caches, search indexes, checkpoint files, stored page contents or coalescing counters."""
+    from agent.cache import close_caches
+    from agent.checkpoint import close_checkpointers
+    from agent.clients import close_clients
+    from agent.content import get_content_store
+    from agent.search import close_search_backends
+    from agent.singleflight import clear_single_flights
+
+    close_clients()
+    close_caches()
+    close_search_backends()
+    close_checkpointers()
+    get_content_store().clear()
+    clear_single_flights()
+    yield
+    close_clients()
+    close_caches()
+    close_search_backends()
+    close_checkpointers()
+    get_content_store().clear()
+    clear_single_flights()
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Route every LLM call in the agent to a single local FakeChatModel."""
+    import agent.clients
+
+    llm = FakeChatModel()
+    monkeypatch.setattr(agent.clients, "ChatOpenAI", lambda **kwargs: llm)
+    return llm
+
+
+@pytest.fixture
+def stub_search(monkeypatch):
+    """Route every search API call in the agent to a single local StubTavilyClient."""
+    import agent.clients
+
+    client = StubTavilyClient()
+    monkeypatch.setattr(agent.clients, "TavilyClient", lambda *args, **kwargs: client)
+    return client
@@ -1,11 +1,12 @@
-from langsmith import Client
-from dotenv import load_dotenv
 import asyncio
-from langgraph.checkpoint.memory import MemorySaver
-import uuid
-from pydantic import BaseModel, Field
 import os
+import uuid
+
+from dotenv import load_dotenv
+from evaluate_local import EvaluationScores
 from langchain_openai import ChatOpenAI
+from langgraph.checkpoint.memory import MemorySaver
+from langsmith import Client
 
 from agent.graph import graph_builder
 from agent.prompts import evaluator_prompt
@@ -28,16 +29,9 @@ metadata = {
     "num_queries": 3, # Number of queries to generate
     "num_results_per_query": 2, # Maximum number of results to fetch per query
     "max_followup_retries": 0, # Maximum number of times to followup
+    "summarize_mode": 'per_source', # Set to 'batch' to pack short search results into multi-source summarize calls, for far fewer requests over a whole dataset
 }
 
-class EvaluationScores(BaseModel):
-    grounding_and_accuracy: int = Field(description="Are claims in the report supported by the provided research notes")
-    coverage_and_depth: int = Field(description="Does the report adequately address the core aspects of the user topic")
-    synthesis_and_reasoning: int = Field(description="Are relationships, trends, or trade-offs clearly explained")
-    structure_and_clarity: int = Field(description="Are sections logically ordered and clearly labeled")
-    usefulness_to_user: int = Field(description="Would this report meaningfully help a user understand the topic or make decisions")
-
-
 async def data_generator():
     """
     Limit and offset the number of examples from the dataset
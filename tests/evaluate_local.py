@@ -0,0 +1,215 @@
+"""Local evaluation of the agent on examples from a JSONL file, without LangSmith.
+
+Each line of the examples file holds one example in the same format as the LangSmith dataset:
+{"id": "optional name", "messages": [{"role": "user", "content": "research topic"}, ...]}
+
+The graph is compiled once and the examples run concurrently. Agent outputs and judge scores are
+cached in a SQLite file, keyed by hashes of the example, the configuration and the prompts, so
+running the evaluation again only re-runs the examples whose inputs changed.
+
+Usage:
+    python tests/evaluate_local.py examples.jsonl --concurrency 4 --output results.jsonl
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+
+from dotenv import load_dotenv
+from langgraph.checkpoint.memory import MemorySaver
+from pydantic import BaseModel, Field
+
+from agent import prompts
+from agent.cache import SQLiteCache
+from agent.config import Configuration
+from agent.graph import build_graph
+from agent.prompts import evaluator_prompt
+from agent.utils import acall_llm
+
+# config values
+metadata = {
+    "model": 'gpt-4.1-nano', # The OpenAI model to use
+    "max_clarification_retries": 0, # Maximum number of times to ask for clarification
+    "num_queries": 3, # Number of queries to generate
+    "num_results_per_query": 2, # Maximum number of results to fetch per query
+    "max_followup_retries": 0, # Maximum number of times to followup
+    "summarize_mode": 'per_source', # Set to 'batch' to pack short search results into multi-source summarize calls, for far fewer requests over a whole dataset
+}
+judge_model = "gpt-4.1-nano" # The OpenAI model that scores the reports
+
+
+class EvaluationScores(BaseModel):
+    grounding_and_accuracy: int = Field(description="Are claims in the report supported by the provided research notes")
+    coverage_and_depth: int = Field(description="Does the report adequately address the core aspects of the user topic")
+    synthesis_and_reasoning: int = Field(description="Are relationships, trends, or trade-offs clearly explained")
+    structure_and_clarity: int = Field(description="Are sections logically ordered and clearly labeled")
+    usefulness_to_user: int = Field(description="Would this report meaningfully help a user understand the topic or make decisions")
+
+
+def content_hash(*parts):
+    """
+    Hash JSON-serializable values into a cache key
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def agent_prompts_hash():
+    """
+    Hash the prompts used by the agent, so changing a prompt re-runs every example. The evaluator prompt only affects the scores
+    """
+    texts = {name: value for name, value in vars(prompts).items() if name.endswith("_prompt") and name != "evaluator_prompt"}
+    return content_hash(texts)
+
+
+def load_examples(path):
+    """
+    Read the examples from a JSONL file, naming unnamed examples by their line number
+    """
+    examples = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                example = json.loads(line)
+                example.setdefault("id", str(number))
+                examples.append(example)
+    return examples
+
+
+async def target(graph, example, config):
+    """
+    Run the agent on the research topic of an example, the first message. The later messages are only context for the evaluator
+
+    Return:
+        The final report, the research notes, the latency in seconds and the estimated LLM cost
+    """
+    run_config = {"configurable": {**config, "thread_id": str(uuid.uuid4())}}
+    start = time.perf_counter()
+    final_state = await graph.ainvoke({"messages": [{"role": "user", "content": example["messages"][0]["content"]}]}, run_config)
+    return {
+        "final_report": final_state["final_report"],
+        "research_notes": final_state["research_notes"],
+        "latency": time.perf_counter() - start,
+        "cost": final_state.get("metrics", {}).get("total", {}).get("llm", {}).get("cost", 0.0),
+    }
+
+
+async def evaluator(example, outputs, model=judge_model):
+    """
+    Use an LLM as evaluator to obtain scores between 0 and 1 based on the input messages and the agent outputs
+    """
+    messages = example["messages"]
+    clarification = 'None'
+    if len(messages) > 1:
+        clarification = '\n'.join(m["content"] for m in messages[1:])
+
+    prompt = evaluator_prompt.format(
+        user_prompt=messages[0]["content"],
+        messages=clarification,
+        research_notes=outputs["research_notes"],
+        final_report=outputs["final_report"],
+    )
+    result = await acall_llm(model, prompt, structure=EvaluationScores)
+    return {key: value / 5 for key, value in result.model_dump().items()}
+
+
+async def evaluate(examples, config=None, cache_path=".cache/evaluation.sqlite", concurrency=4, model=judge_model):
+    """
+    Run and score every example, reusing cached agent outputs and scores whose inputs did not change
+
+    Args:
+        examples: The examples, each with an id and the input messages
+        config: The agent configuration. Defaults to the module metadata
+        cache_path: The SQLite file that stores agent outputs and scores. Nothing is cached if empty
+        concurrency: The maximum number of examples evaluated at the same time
+        model: The OpenAI model that scores the reports
+
+    Return:
+        One result per example, in order, with its id, scores, latency, cost and whether the agent output was cached
+    """
+    config = dict(metadata if config is None else config)
+    # compile once, without the stages the configuration disables
+    graph = build_graph(Configuration(**config)).compile(checkpointer=MemorySaver())
+    cache = SQLiteCache(cache_path) if cache_path else None
+    prompts_hash = agent_prompts_hash()
+    judge_hash = content_hash(evaluator_prompt, EvaluationScores.model_json_schema(), model)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(example):
+        async with semaphore:
+            output_key = "output:" + content_hash(example["messages"], config, prompts_hash)
+            outputs = cache.get(output_key) if cache is not None else None
+            cached = outputs is not None
+            if not cached:
+                outputs = await target(graph, example, config)
+                if cache is not None:
+                    cache.set(output_key, outputs)
+
+            scores_key = "scores:" + content_hash(outputs["final_report"], outputs["research_notes"], example["messages"], judge_hash)
+            scores = cache.get(scores_key) if cache is not None else None
+            if scores is None:
+                scores = await evaluator(example, outputs, model)
+                if cache is not None:
+                    cache.set(scores_key, scores)
+
+            return {
+                "id": example["id"],
+                **scores,
+                "mean_score": sum(scores.values()) / len(scores),
+                "latency": outputs["latency"],
+                "cost": outputs["cost"],
+                "cached": cached,
+            }
+
+    try:
+        return await asyncio.gather(*(run(example) for example in examples))
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def format_table(results):
+    """
+    Format the results as a text table with one row per example and a row of averages
+    """
+    keys = list(EvaluationScores.model_fields) + ["mean_score"]
+    header = f"{'example':<20} " + " ".join(f"{key[:10]:>10}" for key in keys) + f" {'latency s':>9} {'cost $':>8} {'cached':>6}"
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r['id'][:20]:<20} " + " ".join(f"{r[key]:>10.2f}" for key in keys)
+            + f" {r['latency']:>9.1f} {r['cost']:>8.4f} {'yes' if r['cached'] else 'no':>6}"
+        )
+    if results:
+        lines.append("-" * len(header))
+        lines.append(
+            f"{'average':<20} " + " ".join(f"{sum(r[key] for r in results) / len(results):>10.2f}" for key in keys)
+            + f" {sum(r['latency'] for r in results) / len(results):>9.1f} {sum(r['cost'] for r in results) / len(results):>8.4f}"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("examples", help="JSONL file with one example per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum number of examples evaluated at the same time")
+    parser.add_argument("--config", type=json.loads, default={}, help="JSON object of configuration values that override the defaults")
+    parser.add_argument("--cache", default=".cache/evaluation.sqlite", help="SQLite file for cached outputs and scores. Use '' to disable")
+    parser.add_argument("--judge-model", default=judge_model)
+    parser.add_argument("--output", help="Write the results to this JSONL file")
+    args = parser.parse_args()
+
+    load_dotenv(".env")
+    results = asyncio.run(evaluate(
+        load_examples(args.examples), {**metadata, **args.config}, args.cache, args.concurrency, args.judge_model,
+    ))
+    print(format_table(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Deterministic local stand-ins for the chat model and search API used by the tests."""
+import asyncio
+import json
+import re
+import time
+import typing
+from typing import Any, Callable, Dict, List, Union
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import Field
+
+
+def _prompt_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return "\n".join(_prompt_text(m) for m in value)
+    return getattr(value, "text", None) or str(getattr(value, "content", value))
+
+
+def _default_value(annotation):
+    origin = typing.get_origin(annotation)
+    if annotation is bool:
+        return False
+    if annotation is int:
+        return 3
+    if annotation is float:
+        return 0.0
+    if annotation is list or origin in (list, List):
+        return [f"stub query {i}" for i in range(10)]
+    return "stub"
+
+
+def batch_notes(prompt: str) -> Dict[str, Any]:
+    """Structured output with notes for every numbered source of a batch summarize prompt."""
+    ids = re.findall(r'<source id="(\d+)">', prompt)
+    return {"sources": [{"source_id": int(i), "notes": f"- A point from source {i}."} for i in ids]}
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that sleeps for `delay` seconds and returns canned text or structured output.
+
+    `delay` may be a callable that takes the prompt, to draw latencies from a distribution.
+    """
+
+    delay: Union[float, Callable[[str], float]] = 0.0
+    token_delay: float = 0.0
+    response: Union[str, Callable[[str], str]] = "- A point from the source."
+    structured: Dict[str, Any] = Field(default_factory=lambda: {"BatchNotesOutput": batch_notes})
+    prompts: List[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _reply(self, messages) -> AIMessage:
+        prompt = _prompt_text(messages)
+        self.prompts.append(prompt)
+        text = self.response(prompt) if callable(self.response) else self.response
+        return AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": len(prompt.split()),
+                "output_tokens": len(text.split()),
+                "total_tokens": len(prompt.split()) + len(text.split()),
+            },
+        )
+
+    def _delay_for(self, value) -> float:
+        return self.delay(_prompt_text(value)) if callable(self.delay) else self.delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay_for(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay_for(messages))
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay_for(messages))
+        message = self._reply(messages)
+        tokens = message.text.split(" ")
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            text = token if i == 0 else " " + token
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=message.usage_metadata))
+
+    def _structured(self, schema, prompt: str):
+        self.prompts.append(prompt)
+        # an override for a schema also applies to the schemas that extend it
+        override = next((self.structured[c.__name__] for c in schema.__mro__ if c.__name__ in self.structured), {})
+        if callable(override):
+            override = override(prompt)
+        values = {
+            name: _default_value(field.annotation)
+            for name, field in schema.model_fields.items()
+        }
+        values.update(override)
+        return schema(**values)
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        def wrap(parsed, prompt):
+            if not include_raw:
+                return parsed
+            content = json.dumps(parsed.model_dump())
+            raw = AIMessage(
+                content=content,
+                usage_metadata={
+                    "input_tokens": len(prompt.split()),
+                    "output_tokens": len(content.split()),
+                    "total_tokens": len(prompt.split()) + len(content.split()),
+                },
+            )
+            return {"raw": raw, "parsed": parsed, "parsing_error": None}
+
+        def invoke(value):
+            time.sleep(self._delay_for(value))
+            prompt = _prompt_text(value)
+            return wrap(self._structured(schema, prompt), prompt)
+
+        async def ainvoke(value):
+            await asyncio.sleep(self._delay_for(value))
+            prompt = _prompt_text(value)
+            return wrap(self._structured(schema, prompt), prompt)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+
+class StubTavilyClient:
+    """Search client that returns `num_results` synthetic pages per query after `delay` seconds.
+
+    `delay` may be a callable that takes the query, and `content_words` a callable that takes the
+    query and result index, to draw latencies and page sizes from a distribution.
+    """
+
+    def __init__(self, delay: Union[float, Callable[[str], float]] = 0.0, num_results: int = 10,
+                 content_words: Union[int, Callable[[str, int], int]] = 200):
+        self.delay = delay
+        self.num_results = num_results
+        self.content_words = content_words
+        self.queries: List[str] = []
+
+    def search(self, query: str, max_results: int = 5, **kwargs) -> Dict[str, Any]:
+        self.queries.append(query)
+        time.sleep(self.delay(query) if callable(self.delay) else self.delay)
+        slug = "-".join(query.lower().split())
+        results = []
+        for i in range(min(max_results, self.num_results)):
+            size = self.content_words(query, i) if callable(self.content_words) else self.content_words
+            words = " ".join(f"{slug}-{i}-word{j}" for j in range(size))
+            results.append({
+                "title": f"{query} result {i}",
+                "url": f"https://example.com/{slug}/{i}",
+                "raw_content": f"Page {i} about {query}. {words}",
+            })
+        return {"query": query, "results": results}
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from agent.content import get_content_store
+from agent.graph import BatchNotesOutput, graph, make_graph
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+def _urls(research_notes):
+    return re.findall(r"\((https://[^)]+)\):", research_notes)
+
+
+def _notes(research_notes):
+    return re.findall(r"\):\n(.*)", research_notes)
+
+
+async def test_batch_mode_packs_short_sources_into_fewer_calls(fake_llm, stub_search) -> None:
+    stub_search.content_words = 50
+    base = {"num_queries": 3, "num_results_per_query": 4}
+
+    expected = await graph.ainvoke(INPUT, {"configurable": base})
+    result = await make_graph({"configurable": {**base, "summarize_mode": "batch"}}).ainvoke(
+        INPUT, {"configurable": {**base, "summarize_mode": "batch", "batch_max_sources": 5}}
+    )
+
+    # 12 sources in batches of 5, 5 and 2
+    assert result["run_stats"]["summary_batches"] == 3
+    assert result["run_stats"]["batched_sources"] == 12
+    assert result["metrics"]["total"]["llm"]["calls"] == expected["metrics"]["total"]["llm"]["calls"] - 12 + 3
+    # every source keeps its own notes, title and url
+    assert _urls(result["research_notes"]) == _urls(expected["research_notes"])
+    assert _notes(result["research_notes"])[:6] == [f"- A point from source {i}." for i in range(1, 6)] + ["- A point from source 1."]
+    assert len(get_content_store()) == 0
+
+
+async def test_long_sources_and_skipped_sources_are_summarized_on_their_own(fake_llm, stub_search) -> None:
+    stub_search.content_words = lambda query, i: 2000 if i == 0 else 50
+    # the model leaves out the second source of each batch
+    fake_llm.structured["BatchNotesOutput"] = lambda prompt: {
+        "sources": [{"source_id": 1, "notes": "- Batched point."}],
+    }
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 3, "summarize_mode": "batch", "max_source_tokens": 1000}}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    assert _notes(result["research_notes"]) == ["- A point from the source.", "- Batched point.", "- A point from the source."]
+    assert result["run_stats"]["summary_batches"] == 1
+    assert result["run_stats"]["unbatched_sources"] == 1
+
+
+async def test_batch_summaries_are_cached(fake_llm, stub_search) -> None:
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 3, "summarize_mode": "batch"}}
+
+    await graph.ainvoke(INPUT, config)
+    result = await graph.ainvoke(INPUT, config)
+
+    assert result["run_stats"]["summary_cache_hits"] == 3
+    assert result["run_stats"].get("summary_batches", 0) == 0
+    assert "summarize_batch" in result["metrics"]["nodes"]
+    assert result["metrics"]["nodes"]["summarize_batch"]["llm"]["calls"] == 0
+
+
+def test_batch_output_schema() -> None:
+    assert BatchNotesOutput(sources=[{"source_id": 1, "notes": "- a"}]).sources[0].source_id == 1
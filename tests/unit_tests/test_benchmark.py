@@ -0,0 +1,28 @@
+import pytest
+from benchmark import format_table, run_benchmark
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_benchmark_sweeps_every_combination() -> None:
+    rows = await run_benchmark(
+        num_queries=(1, 2), results_per_query=(2,), concurrency=(1, 3), repeat=2,
+        llm_latency=0.01, search_latency=0.01, content_words=50,
+    )
+
+    assert [(r["num_queries"], r["concurrency"], r["runs"]) for r in rows] == [(1, 1, 2), (1, 3, 6), (2, 1, 2), (2, 3, 6)]
+    for r in rows:
+        # query generation, one summary per search result, and the final report
+        assert r["llm_calls"] == 1 + r["num_queries"] * r["results_per_query"] + 1
+        assert 0 < r["p50"] <= r["p95"]
+        assert r["throughput"] > 0
+        assert r["peak_memory_mb"] > 0
+    assert len(format_table(rows).splitlines()) == 2 + len(rows)
+
+
+async def test_benchmark_reports_checkpoint_writes(tmp_path) -> None:
+    rows = await run_benchmark(repeat=1, checkpoint_path=str(tmp_path / "checkpoints.sqlite"), llm_latency=0.0, search_latency=0.0)
+
+    assert rows[0]["checkpoint_kb"] > 0
+    assert rows[0]["checkpoint_ms"] > 0
+    assert "ckpt KB" in format_table(rows)
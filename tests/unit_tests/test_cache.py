@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+import agent.cache
+from agent.cache import SQLiteCache, get_cache
+from agent.graph import search_results_extraction
+from agent.utils import get_search_results
+
+pytestmark = pytest.mark.anyio
+
+
+def test_entries_persist_across_instances(tmp_path) -> None:
+    path = str(tmp_path / "cache.sqlite")
+    SQLiteCache(path).set("key", [{"url": "https://example.com"}])
+
+    cache = SQLiteCache(path)
+    assert cache.get("key") == [{"url": "https://example.com"}]
+    assert cache.get("missing") is None
+    assert cache.stats == {"hits": 1, "misses": 1}
+
+
+def test_expired_entries_are_misses(tmp_path) -> None:
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=0.05)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path) -> None:
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.set("a", 1)
+    time.sleep(0.01)
+    cache.set("b", 2)
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_inserts_do_not_count_the_entries(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(agent.cache, "_RECOUNT_INTERVAL", 5)
+    path = str(tmp_path / "cache.sqlite")
+    cache = SQLiteCache(path, max_entries=3)
+    statements = []
+    cache._connection.set_trace_callback(statements.append)
+    for key in "abc":
+        cache.set(key, 1)
+    cache.set("a", 2)
+    assert not any("COUNT" in s for s in statements) and len(cache) == 3
+
+    # entries written by another process are counted at the next recount
+    other = SQLiteCache(path, max_entries=10)
+    other.set("d", 1)
+    other.set("e", 1)
+    cache.set("f", 1)
+    assert len(cache) == 3
+
+
+def test_near_identical_queries_share_cached_results(stub_search, tmp_path) -> None:
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"))
+
+    first = get_search_results("Quantum  computing?", 2, cache=cache)
+    second = get_search_results("quantum computing", 2, cache=cache)
+
+    assert stub_search.queries == ["Quantum  computing?"]
+    assert [r["url"] for r in second] == [r["url"] for r in first]
+    assert second[0]["query"] == "quantum computing"
+
+    get_search_results("quantum computing", 2, cache=cache, refresh=True)
+    assert len(stub_search.queries) == 2
+
+
+async def test_search_cache_switch_on_configuration(stub_search, tmp_path) -> None:
+    path = str(tmp_path / "search.sqlite")
+    state = {"queries": ["a", "b"]}
+
+    await search_results_extraction(state, {"configurable": {}})
+    await search_results_extraction(state, {"configurable": {"search_cache": True, "search_cache_path": path}})
+    await search_results_extraction(state, {"configurable": {"search_cache": True, "search_cache_path": path}})
+    assert len(stub_search.queries) == 4
+    assert get_cache(path).stats == {"hits": 2, "misses": 2}
+
+    await search_results_extraction(state, {"configurable": {
+        "search_cache": True, "search_cache_path": path, "search_cache_refresh": True,
+    }})
+    assert len(stub_search.queries) == 6
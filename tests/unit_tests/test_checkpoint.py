@@ -0,0 +1,99 @@
+import time
+
+import pytest
+
+from agent.checkpoint import SQLiteSaver, close_checkpointers
+from agent.graph import graph, make_graph
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_clarification_thread_resumes_after_a_restart(fake_llm, stub_search, tmp_path) -> None:
+    answers = iter([
+        {"needs_clarification": True, "clarification_question": "Which reefs?"},
+        {"needs_clarification": False, "clarification_question": ""},
+    ])
+    fake_llm.structured["ClarificationOutput"] = lambda prompt: next(answers)
+    config = {"configurable": {
+        "thread_id": "1", "max_clarification_retries": 1, "num_queries": 1, "num_results_per_query": 1,
+        "checkpoint_path": str(tmp_path / "checkpoints.sqlite"),
+    }}
+
+    first = await make_graph(config).ainvoke({"messages": [{"role": "user", "content": "coral reefs"}]}, config)
+    assert first["messages"][-1].text == "Which reefs?"
+
+    # a new process opens the same file
+    close_checkpointers()
+
+    num_prompts = len(fake_llm.prompts)
+    second = await make_graph(config).ainvoke({"messages": [{"role": "user", "content": "The Great Barrier Reef"}]}, config)
+    assert second["final_report"]
+    assert [m.text for m in second["messages"][:3]] == ["coral reefs", "Which reefs?", "The Great Barrier Reef"]
+    # the clarification question and answer restored from the file reach the query generation
+    assert any("Which reefs?" in p and "The Great Barrier Reef" in p for p in fake_llm.prompts[num_prompts:])
+
+
+async def test_transient_fields_are_not_stored_and_writes_stay_with_their_checkpoint(fake_llm, stub_search, tmp_path) -> None:
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"))
+    agent = graph.builder.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "1", "num_queries": 2, "num_results_per_query": 2}}
+
+    state = await agent.ainvoke({"messages": [{"role": "user", "content": "coral reefs"}]}, config)
+    assert state["search_results"]
+
+    stored = await agent.aget_state(config)
+    assert "search_results" not in stored.values and "source" not in stored.values
+    assert stored.values["final_report"] == state["final_report"]
+    assert len(list(saver.list(config))) == len(list(saver.list(None)))
+
+    connection = saver._connection
+    assert connection.execute("SELECT COUNT(*) FROM blobs WHERE channel IN ('search_results', 'source') AND type != 'empty'").fetchone() == (0,)
+    # the writes of earlier checkpoints are kept, so their history can be replayed
+    history = [c async for c in agent.aget_state_history(config)]
+    assert sum(1 for c in history[1:] if saver.get_tuple(c.config).pending_writes) > 1
+    assert saver.stats["checkpoints"] > 0 and saver.stats["bytes_written"] > 0
+    saver.close()
+
+
+async def test_a_run_that_fails_after_the_search_resumes_with_its_results(fake_llm, stub_search, tmp_path) -> None:
+    saver = SQLiteSaver(str(tmp_path / "checkpoints.sqlite"))
+    agent = graph.builder.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "1", "num_queries": 2, "num_results_per_query": 2}}
+    put = saver.put
+    failed = []
+
+    def fail_after_search(config, checkpoint, metadata, new_versions):
+        if "search_results" in new_versions and not failed:
+            failed.append(True)
+            raise RuntimeError("disk full")
+        return put(config, checkpoint, metadata, new_versions)
+
+    saver.put = fail_after_search
+    with pytest.raises(RuntimeError):
+        await agent.ainvoke({"messages": [{"role": "user", "content": "coral reefs"}]}, config, durability="sync")
+    num_queries = len(stub_search.queries)
+
+    state = await agent.ainvoke(None, config)
+
+    # the search task is not run again, and its results are read from its pending writes
+    assert len(stub_search.queries) == num_queries
+    assert state["research_notes"].count("https://example.com/") == 4
+    saver.close()
+
+
+def test_idle_threads_expire(tmp_path) -> None:
+    path = str(tmp_path / "checkpoints.sqlite")
+    saver = SQLiteSaver(path, ttl=60)
+    for thread_id, updated_at in (("old", time.time() - 120), ("new", time.time())):
+        saver._connection.execute("INSERT INTO threads VALUES (?, ?)", (thread_id, updated_at))
+        saver._connection.execute(
+            "INSERT INTO blobs VALUES (?, '', 'messages', '1', 'empty', NULL)", (thread_id,)
+        )
+        saver._connection.execute(
+            "INSERT INTO writes VALUES (?, '', '1', 'task', 0, 'messages', 'empty', NULL, '')", (thread_id,)
+        )
+
+    assert saver.delete_expired() == 1
+    assert saver._connection.execute("SELECT thread_id FROM blobs").fetchall() == [("new",)]
+    assert saver._connection.execute("SELECT thread_id FROM writes").fetchall() == [("new",)]
+    saver.close()
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+
+from agent import chunking
+from agent.chunking import (
+    clear_token_counts,
+    count_tokens,
+    select_relevant_chunks,
+    split_into_chunks,
+)
+from agent.graph import summarize
+from agent.prompts import notes_prompt
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def character_estimate(monkeypatch):
+    """Use the character-based estimate so results do not depend on downloading a tokenizer."""
+    monkeypatch.setattr(chunking, "get_encoding", lambda model: None)
+    clear_token_counts()
+    yield
+    clear_token_counts()
+
+
+def _page(lines):
+    return "\n".join(lines)
+
+
+def test_chunks_stay_within_budget_and_keep_all_lines() -> None:
+    text = _page([f"line {i} " + "x" * 30 for i in range(100)] + ["y" * 500])
+
+    chunks = split_into_chunks(text, 50, "gpt-4.1-nano")
+
+    assert all(count_tokens(c, "gpt-4.1-nano") <= 50 for c in chunks)
+    assert "".join(chunks).replace("\n", "") == text.replace("\n", "")
+
+
+def test_token_counts_are_cached_per_source(monkeypatch) -> None:
+    counted = []
+    monkeypatch.setattr(chunking, "_count_tokens", lambda text, model: counted.append(text) or len(text))
+    text = "some content " * 100
+    count_tokens(text, "gpt-4.1-nano")
+    count_tokens("some content " * 100, "gpt-4.1-nano")
+
+    assert len(counted) == 1
+    # the cache holds the counts, not the texts
+    assert all(not isinstance(part, str) or part == "gpt-4.1-nano" for key in chunking._token_counts for part in key)
+
+
+def test_select_relevant_chunks_keeps_original_order() -> None:
+    chunks = ["solar panels cost", "unrelated cooking", "solar panel efficiency", "sports news"]
+
+    assert select_relevant_chunks(chunks, "solar panel efficiency", 2) == ["solar panels cost", "solar panel efficiency"]
+    assert select_relevant_chunks(chunks, "anything", 10) == chunks
+
+
+async def test_long_sources_are_summarized_in_parallel_and_merged(fake_llm) -> None:
+    fake_llm.delay = 0.2
+    content = _page([f"paragraph {i} about solar power " + "z" * 200 for i in range(20)])
+    state = {"topic": "solar power", "source": {"title": "t", "url": "https://example.com", "content": content}}
+    config = {"configurable": {"max_source_tokens": 400, "max_source_chunks": 3}}
+
+    start = time.perf_counter()
+    update = await summarize(state, config)
+    elapsed = time.perf_counter() - start
+
+    # three chunk summaries in parallel, then one merge
+    assert len(fake_llm.prompts) == 4
+    assert "Partial notes" in fake_llm.prompts[-1]
+    assert update["run_stats"]["summarized_chunks"] == 3
+    assert elapsed < 0.6
+
+
+async def test_truncate_strategy_keeps_relevant_parts_in_one_call(fake_llm) -> None:
+    lines = ["filler text about nothing in particular " * 5] * 30
+    lines[17] = "the key finding about battery recycling rates"
+    state = {"topic": "battery recycling", "source": {"title": "t", "url": "https://example.com", "content": _page(lines)}}
+    config = {"configurable": {"max_source_tokens": 200, "max_source_chunks": 4, "chunk_strategy": "truncate"}}
+
+    await summarize(state, config)
+
+    assert len(fake_llm.prompts) == 1
+    assert "battery recycling rates" in fake_llm.prompts[0]
+    assert count_tokens(fake_llm.prompts[0], "gpt-4.1-nano") < 200 + count_tokens(notes_prompt, "gpt-4.1-nano")
+
+
+async def test_short_sources_use_a_single_call(fake_llm) -> None:
+    state = {"topic": "t", "source": {"title": "t", "url": "https://example.com", "content": "short"}}
+
+    update = await summarize(state, {"configurable": {}})
+
+    assert len(fake_llm.prompts) == 1
+    assert update["run_stats"]["chunked_sources"] == 0
+
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from agent import clients
+from agent.utils import acall_llm
+
+pytestmark = pytest.mark.anyio
+
+
+class _ChatCompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = json.dumps({
+            "id": "chatcmpl-local",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "local",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "hello"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        if self.server.delay:
+            threading.Event().wait(self.server.delay)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _CountingServer(ThreadingHTTPServer):
+    """Local OpenAI stand-in that counts accepted TCP connections."""
+
+    daemon_threads = True
+    connections = 0
+    delay = 0.0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+@pytest.fixture
+def local_openai(monkeypatch):
+    server = _CountingServer(("127.0.0.1", 0), _ChatCompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+async def test_sequential_calls_reuse_one_connection(local_openai) -> None:
+    for _ in range(5):
+        response = await acall_llm("gpt-4.1-nano", "prompt")
+        assert response.text == "hello"
+
+    assert local_openai.connections == 1
+    assert clients.get_llm("gpt-4.1-nano") is clients.get_llm("gpt-4.1-nano")
+
+
+async def test_pool_limit_caps_concurrent_connections(local_openai) -> None:
+    clients.configure_clients(max_connections=2, max_keepalive_connections=2)
+    local_openai.delay = 0.05
+    try:
+        await asyncio.gather(*[acall_llm("gpt-4.1-nano", "prompt") for _ in range(8)])
+        await asyncio.gather(*[acall_llm("gpt-4.1-nano", "prompt") for _ in range(8)])
+    finally:
+        clients.configure_clients(max_connections=100, max_keepalive_connections=20)
+
+    assert local_openai.connections == 2
+
+
+def test_sync_calls_share_the_pool(local_openai) -> None:
+    from agent.utils import call_llm
+
+    for _ in range(3):
+        assert call_llm("gpt-4.1-nano", "prompt").text == "hello"
+
+    assert local_openai.connections == 1
+
+
+async def test_aclose_clients_releases_the_registry(local_openai) -> None:
+    first = clients.get_llm("gpt-4.1-nano")
+    search_client = clients.get_search_client("tvly-test")
+    assert clients.get_search_client("tvly-test") is search_client
+
+    await clients.aclose_clients()
+
+    assert clients.get_llm("gpt-4.1-nano") is not first
+    assert clients.get_search_client("tvly-test") is not search_client
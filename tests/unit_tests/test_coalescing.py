@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.content import get_content_store
+from agent.graph import graph
+from agent.singleflight import SingleFlight, get_single_flight
+from agent.utils import get_search_results
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+def test_concurrent_searches_share_one_call(stub_search) -> None:
+    stub_search.delay = 0.2
+    results = []
+
+    def search():
+        results.append(get_search_results("coral reefs", 2, coalesce=True))
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stub_search.queries == ["coral reefs"]
+    assert all(r == results[0] for r in results) and len(results) == 4
+    assert get_single_flight("search").stats == {"calls": 1, "coalesced": 3}
+
+
+def test_errors_are_shared_and_the_key_is_freed() -> None:
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError("search failed")
+
+    def call():
+        try:
+            flight.call("key", fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    assert flight.call("key", lambda: "fresh") == "fresh"
+    assert flight.stats == {"calls": 2, "coalesced": 1}
+
+
+async def test_a_cancelled_caller_does_not_cancel_the_shared_call() -> None:
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "summary"
+
+    first = asyncio.create_task(flight.acall("key", slow))
+    second = asyncio.create_task(flight.acall("key", slow))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "summary"
+    assert flight.stats == {"calls": 1, "coalesced": 1}
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+async def test_concurrent_runs_on_the_same_topic_share_searches_and_summaries(fake_llm, stub_search, coalesce) -> None:
+    fake_llm.delay = 0.05
+    stub_search.delay = 0.1
+    config = {"configurable": {"num_queries": 2, "summary_cache": False, "coalesce_requests": coalesce}}
+
+    states = await asyncio.gather(graph.ainvoke(INPUT, config), graph.ainvoke(INPUT, config))
+
+    num_queries = len(set(stub_search.queries))
+    summaries = sum(s["run_stats"]["coalesced_summaries"] for s in states)
+    if coalesce:
+        assert len(stub_search.queries) == num_queries
+        assert summaries == 4
+        assert get_single_flight("search").stats["coalesced"] == num_queries
+    else:
+        assert len(stub_search.queries) == 2 * num_queries
+        assert summaries == 0
+    # both runs get notes for every source either way
+    assert states[0]["research_notes"] == states[1]["research_notes"]
+    assert len(get_content_store()) == 0
+
+
+@pytest.mark.parametrize("content_words", [50, 2000])
+async def test_runs_on_different_topics_only_share_summaries_of_whole_pages(fake_llm, stub_search, content_words) -> None:
+    fake_llm.delay = 0.05
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["same"]}
+    stub_search.content_words = content_words
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 2, "summary_cache": False, "max_source_tokens": 1000}}
+    inputs = [{"messages": [{"role": "user", "content": topic}]} for topic in ("coral reefs", "rain forests")]
+
+    states = await asyncio.gather(*[graph.ainvoke(i, config) for i in inputs])
+
+    # long pages are summarized from the chunks most relevant to each topic
+    summaries = sum(s["run_stats"]["coalesced_summaries"] for s in states)
+    assert summaries == (2 if content_words == 50 else 0)
@@ -0,0 +1,102 @@
+import re
+
+import pytest
+
+from agent.chunking import count_tokens, trim_lines
+from agent.clustering import cluster_notes
+from agent.graph import graph
+from agent.state import Note
+
+pytestmark = pytest.mark.anyio
+
+QUERIES = ["coral reef bleaching", "deep sea mining", "solar panel recycling"]
+
+
+def test_notes_are_grouped_by_subtopic() -> None:
+    notes = [
+        Note(f"{query} result {i}", f"https://example.com/{q}/{i}", f"- {query} point {i}")
+        for i in range(3) for q, query in enumerate(QUERIES)
+    ]
+
+    groups = cluster_notes(notes, 3)
+
+    assert groups == [[0, 3, 6], [1, 4, 7], [2, 5, 8]]
+    assert cluster_notes(notes, 1) == [list(range(9))]
+    assert cluster_notes(notes[:2], 5) == [[0], [1]]
+    assert cluster_notes([], 3) == []
+
+
+def _compress(prompt):
+    if "section digest" not in prompt:
+        return "- A point from the source."
+    urls = re.findall(r"\((https://\S+)\):", prompt)
+    return "Subtopic\n" + "\n".join(f"- A key point ({url})" for url in urls)
+
+
+async def test_notes_over_the_budget_are_merged_into_section_digests(fake_llm, stub_search) -> None:
+    fake_llm.response = _compress
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": QUERIES}
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 4, "report_notes_budget": 300, "max_note_sections": 3}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "environment"}]}, config)
+
+    compress_prompts = [p for p in fake_llm.prompts if "section digest" in p]
+    assert len(compress_prompts) == 3
+    for prompt, query in zip(compress_prompts, QUERIES):
+        # each digest covers a single subtopic
+        assert set(re.findall(r"https://example.com/([\w-]+)/", prompt)) == {"-".join(query.split())}
+    # every source is still cited in the notes sent to the report
+    for query in QUERIES:
+        for i in range(4):
+            assert f"https://example.com/{'-'.join(query.split())}/{i}" in result["research_notes"]
+    assert count_tokens(result["research_notes"], "gpt-4.1-nano") <= 300
+    assert result["research_notes"] in fake_llm.prompts[-1]
+    assert result["run_stats"]["compressed_notes"] == 12
+    assert result["run_stats"]["note_sections"] == 3
+
+
+def test_trimming_keeps_whole_lines() -> None:
+    text = "Subtopic\n" + "\n".join(f"- Point {i} ({'https://example.com/' + 'x' * i})" for i in range(20))
+
+    trimmed = trim_lines(text, 60, "gpt-4.1-nano")
+
+    assert count_tokens(trimmed, "gpt-4.1-nano") <= 60
+    assert trimmed.startswith("Subtopic\n- Point 0 (")
+    assert set(trimmed.splitlines()) <= set(text.splitlines())
+
+
+def _overlong_compress(prompt):
+    if "section digest" not in prompt:
+        return "- A point from the source."
+    notes = prompt.split("Notes:")[-1]
+    points = [f"- A key point ({url})" for url in dict.fromkeys(re.findall(r"\((https://[^\s)]+)\)", notes))]
+    if "Subtopic" in notes:
+        # merging the digest again respects the lower limit
+        return "Subtopic\n" + "\n".join(points)
+    # the first digest ignores the word limit and repeats every point
+    return "Subtopic\n" + "\n".join(p for p in points for _ in range(5))
+
+
+async def test_digests_over_their_share_are_merged_again(fake_llm, stub_search) -> None:
+    fake_llm.response = _overlong_compress
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": QUERIES}
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 4, "report_notes_budget": 300, "max_note_sections": 3}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "environment"}]}, config)
+
+    assert len([p for p in fake_llm.prompts if "section digest" in p]) == 6
+    # every source is still cited, by whole points
+    for query in QUERIES:
+        for i in range(4):
+            assert f"- A key point (https://example.com/{'-'.join(query.split())}/{i})" in result["research_notes"].splitlines()
+    assert count_tokens(result["research_notes"], "gpt-4.1-nano") <= 300
+
+
+async def test_notes_within_the_budget_are_sent_unchanged(fake_llm, stub_search) -> None:
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 2, "report_notes_budget": 100000}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    assert not any("section digest" in p for p in fake_llm.prompts)
+    assert result["research_notes"].count("- A point from the source.") == 4
+    assert result["run_stats"]["note_sections"] == 0
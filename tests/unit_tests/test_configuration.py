@@ -1,9 +1,104 @@
+import time
+
+import pytest
 from langgraph.pregel import Pregel
 
+from agent.config import Configuration, _resolve, clear_configuration_cache
 from agent.graph import graph
 
 
+@pytest.fixture(autouse=True)
+def fresh_configuration():
+    clear_configuration_cache()
+    yield
+    clear_configuration_cache()
+
+
 def test_placeholder() -> None:
     # TODO: You can add actual unit tests
     # for your graph and other logic here.
     assert isinstance(graph, Pregel)
+
+
+def test_falsy_values_are_kept() -> None:
+    configurable = Configuration.from_runnable_config(
+        {"configurable": {"num_queries": 0, "summary_cache": False, "relevance_threshold": 0.0, "summary_cache_path": ""}}
+    )
+
+    assert configurable.num_queries == 0
+    assert configurable.summary_cache is False
+    assert Configuration.from_runnable_config({"configurable": {"num_queries": None}}).num_queries == 3
+
+
+def test_environment_overrides_are_converted(monkeypatch) -> None:
+    monkeypatch.setenv("NUM_QUERIES", "5")
+    monkeypatch.setenv("SUMMARY_CACHE", "false")
+    monkeypatch.setenv("SEARCH_TIMEOUT", "2.5")
+    monkeypatch.setenv("CHUNK_STRATEGY", "truncate")
+
+    configurable = Configuration.from_runnable_config({"configurable": {"num_queries": 1}})
+
+    assert configurable.num_queries == 5
+    assert configurable.summary_cache is False
+    assert configurable.search_timeout == 2.5
+    assert configurable.chunk_strategy == "truncate"
+
+
+@pytest.mark.parametrize("name, value", [
+    ("num_queries", "many"),
+    ("num_queries", 2.5),
+    ("num_queries", -1),
+    ("summary_cache", "maybe"),
+    ("chunk_strategy", "summarize"),
+    ("model", 4),
+    ("model", " "),
+    ("min_novelty", 1.5),
+    ("relevance_threshold", "2"),
+    ("deadline_report_share", 1),
+])
+def test_invalid_values_are_rejected(name, value) -> None:
+    with pytest.raises(ValueError, match=name):
+        Configuration.from_runnable_config({"configurable": {name: value}})
+
+
+def test_invalid_environment_overrides_are_rejected(monkeypatch) -> None:
+    monkeypatch.setenv("MAX_SOURCES", "ten")
+
+    with pytest.raises(ValueError, match="max_sources"):
+        Configuration.from_runnable_config()
+
+
+def test_resolution_is_cached_per_configuration() -> None:
+    config = {"configurable": {"num_queries": 2, "thread_id": "1"}}
+
+    first = Configuration.from_runnable_config(config)
+
+    assert Configuration.from_runnable_config({"configurable": {"num_queries": 2, "thread_id": "2"}}) is first
+    assert Configuration.from_runnable_config({"configurable": {"num_queries": 3}}) is not first
+    # values of other settings are left out of the key
+    assert Configuration.from_runnable_config({"configurable": {"num_queries": 2, "tags": ["a"]}}) is first
+
+
+def test_unhashable_values_are_resolved_without_the_cache() -> None:
+    # the fallback still validates the value instead of failing on the cache key
+    with pytest.raises(ValueError, match="num_queries"):
+        Configuration.from_runnable_config({"configurable": {"num_queries": [2]}})
+    with pytest.raises(TypeError):
+        _resolve(Configuration, (("num_queries", [2]),))
+
+
+def test_cached_resolution_is_cheaper_for_a_fan_out() -> None:
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 2, "max_source_tokens": 4000}}
+    values = tuple(config["configurable"].items())
+    calls = 2000
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        _resolve.__wrapped__(Configuration, values)
+    uncached = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(calls):
+        Configuration.from_runnable_config(config)
+    cached = time.perf_counter() - start
+
+    assert cached < uncached / 2
@@ -0,0 +1,114 @@
+import importlib
+import time
+
+import pytest
+from langgraph.checkpoint.memory import InMemorySaver
+
+from agent.content import ContentStore, get_content_store
+from agent.graph import graph
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+def test_content_is_stored_once_until_every_reference_is_released() -> None:
+    store = ContentStore()
+    first = store.put("page text")
+    assert store.put("page text") == first
+    assert len(store) == 1 and store.size == len("page text")
+
+    store.release(first)
+    assert store.get(first) == "page text"
+    store.release(first)
+    with pytest.raises(KeyError):
+        store.get(first)
+
+
+
+def test_texts_expire_even_if_they_are_still_referenced() -> None:
+    store = ContentStore(ttl=0.05, sweep_interval=0.0)
+    old = store.put("abandoned page")
+    time.sleep(0.1)
+    new = store.put("fresh page")
+
+    with pytest.raises(KeyError):
+        store.get(old)
+    assert store.get(new) == "fresh page" and len(store) == 1
+    store.release(old)
+    assert store.get(new) == "fresh page"
+
+async def test_page_content_stays_out_of_the_state(fake_llm, stub_search) -> None:
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["same", "same", "other"]}
+    saver = InMemorySaver()
+    agent = graph.builder.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": "1", "num_queries": 3, "num_results_per_query": 2, "max_sources": 3}}
+
+    state = await agent.ainvoke(INPUT, config)
+
+    assert state["search_results"] and all("content" not in r and "content_ref" in r for r in state["search_results"])
+    assert state["research_notes"].count("https://example.com/") == 3
+    # summarized and dropped results alike released their content
+    assert len(get_content_store()) == 0
+
+    page = stub_search.search("same", 1)["results"][0]["raw_content"]
+    stored = b"".join(v[1] for v in saver.blobs.values()) + b"".join(
+        w[2][1] for writes in saver.writes.values() for w in writes.values()
+    )
+    assert page[:200].encode() not in stored
+
+
+async def test_discarded_speculation_releases_its_content(fake_llm, stub_search) -> None:
+    fake_llm.structured["ClarificationOutput"] = {"needs_clarification": True, "clarification_question": "Which reefs?"}
+    fake_llm.delay = 0.1
+    config = {"configurable": {"max_clarification_retries": 1, "speculative_queries": True, "speculative_search": True}}
+
+    await graph.ainvoke(INPUT, config)
+
+    assert len(get_content_store()) == 0
+
+
+@pytest.mark.parametrize("summarize_mode", ["per_source", "batch"])
+async def test_failed_summaries_release_their_content(fake_llm, stub_search, summarize_mode) -> None:
+    def fail(prompt):
+        if "Page " in prompt:
+            raise RuntimeError("model unavailable")
+        return "- A point from the source."
+
+    fake_llm.response = fail
+    fake_llm.structured["BatchNotesOutput"] = fail
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 2, "summarize_mode": summarize_mode}}
+
+    with pytest.raises(RuntimeError):
+        await graph.ainvoke(INPUT, config)
+
+    assert len(get_content_store()) == 0
+
+
+@pytest.mark.parametrize("node", ["rank_sources", "summarize"])
+async def test_a_run_resumed_in_a_new_process_skips_pages_it_no_longer_holds(fake_llm, stub_search, node) -> None:
+    agent = graph.builder.compile(checkpointer=InMemorySaver(), interrupt_before=[node])
+    config = {"configurable": {"thread_id": "1", "num_queries": 2, "num_results_per_query": 2}}
+
+    await agent.ainvoke(INPUT, config)
+    # the handles in the checkpoint outlive the content store of the process that wrote them
+    get_content_store().clear()
+    state = await agent.ainvoke(None, config)
+
+    assert state["final_report"]
+    assert state["run_stats"]["missing_contents"] == 4
+    assert "https://example.com/" not in state["research_notes"]
+
+
+async def test_a_node_that_fails_after_the_search_releases_its_pages(fake_llm, stub_search, monkeypatch) -> None:
+    def fail(*args):
+        raise RuntimeError("deduplication failed")
+
+    # the agent package exports the compiled graph under the name of its module
+    monkeypatch.setattr(importlib.import_module("agent.graph"), "deduplicate_sources", fail)
+
+    with pytest.raises(RuntimeError):
+        await graph.ainvoke(INPUT, {"configurable": {"num_queries": 2, "num_results_per_query": 2}})
+
+    assert len(stub_search.queries) == 2
+    assert len(get_content_store()) == 0
@@ -0,0 +1,63 @@
+import pytest
+
+from agent.dedupe import deduplicate_sources, normalize_url
+from agent.graph import graph
+
+pytestmark = pytest.mark.anyio
+
+
+def _source(url, content):
+    return {"query": "q", "title": url, "url": url, "content": content}
+
+
+def test_normalize_url_ignores_cosmetic_differences() -> None:
+    assert normalize_url("https://www.Example.com/page/?utm_source=x&b=2&a=1#top") == normalize_url(
+        "http://example.com/page?a=1&b=2"
+    )
+    assert normalize_url("https://example.com/page?id=1") != normalize_url("https://example.com/page?id=2")
+
+
+def test_deduplicate_sources_drops_each_kind_of_repeat() -> None:
+    text = " ".join(f"word{i}" for i in range(400))
+    sources = [
+        _source("https://example.com/a", text),
+        _source("https://example.com/a/", "different content"),
+        _source("https://example.com/mirror", text.replace("word200", "changed")),
+        _source("https://example.com/seen", "seen content"),
+        _source("https://example.com/b", " ".join(f"other{i}" for i in range(400))),
+    ]
+
+    kept, stats = deduplicate_sources(sources, seen_urls={normalize_url("https://example.com/seen")})
+
+    assert [s["url"] for s in kept] == ["https://example.com/a", "https://example.com/b"]
+    assert stats == {"duplicate_urls": 1, "previously_summarized": 1, "near_duplicates": 1}
+
+    kept, stats = deduplicate_sources(sources, threshold=1.1)
+    assert stats["near_duplicates"] == 0
+    assert len(kept) == 4
+
+
+async def test_repeated_queries_are_summarized_once(fake_llm, stub_search) -> None:
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["same", "same", "other"]}
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 2}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    assert result["run_stats"]["summaries_avoided"] == 2
+    assert result["run_stats"]["summary_cache_misses"] == 4
+    assert result["research_notes"].count("https://example.com/same/0") == 1
+
+
+async def test_followup_round_skips_already_summarized_sources(fake_llm, stub_search) -> None:
+    rounds = iter([True, False])
+    fake_llm.structured["FollowupOutput"] = lambda prompt: {"needs_followup": next(rounds)}
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["same"]}
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 2, "max_followup_retries": 1}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    # the repeated query skips the two pages of the first round and returns the next two
+    assert result["run_stats"]["previously_summarized"] == 0
+    assert result["run_stats"]["summary_cache_misses"] == 4
+    assert [f"https://example.com/same/{i}" in result["research_notes"] for i in range(5)] == [True] * 4 + [False]
+    assert result["final_report"] == fake_llm.response
@@ -0,0 +1,153 @@
+import re
+import time
+
+import pytest
+
+import agent.search
+from agent.chunking import count_tokens
+from agent.config import Configuration
+from agent.depth import note_novelty, query_breadth
+from agent.graph import graph
+from agent.state import Note
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+def _page_notes(prompt):
+    """Notes that differ for every page, so each round adds new content."""
+    page = re.search(r"Page \d+ about [^.]+", prompt)
+    return f"- {page.group(0)} has a distinct finding." if page else "- A point from the source."
+
+
+def test_breadth_follows_the_rated_complexity() -> None:
+    configurable = Configuration(adaptive_depth=True, num_queries=4, num_results_per_query=3)
+
+    assert query_breadth(1, configurable) == (2, 1)
+    assert query_breadth(3, configurable) == (4, 3)
+    assert query_breadth(0, configurable) == (4, 3)
+    assert query_breadth(1, Configuration(num_queries=4, num_results_per_query=3)) == (4, 3)
+
+
+def test_novelty_is_the_share_of_new_content() -> None:
+    old = [Note("a", "https://a", "- coral reefs host a quarter of marine species")]
+
+    assert note_novelty([Note("b", "https://b", "- coral reefs host a quarter of marine species")], old) == 0.0
+    assert note_novelty([Note("b", "https://b", "- bleaching events doubled since the eighties")], old) == 1.0
+    assert note_novelty([], old) == 0.0
+
+
+async def test_simple_topics_get_fewer_searches(fake_llm, stub_search) -> None:
+    fake_llm.structured["RatedQueryGenerationOutput"] = {"search_queries": ["a", "b", "c"], "complexity": 1}
+    config = {"configurable": {"adaptive_depth": True, "num_queries": 3, "num_results_per_query": 2}}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    assert stub_search.queries == ["a"]
+    assert result["research_notes"].count("https://example.com/") == 1
+    assert any('"complexity"' in p for p in fake_llm.prompts)
+
+
+@pytest.mark.parametrize("novel", [True, False])
+async def test_followup_stops_once_rounds_add_little_new_content(fake_llm, stub_search, novel) -> None:
+    judged = []
+
+    def followup(prompt):
+        judged.append(prompt)
+        return {"needs_followup": True, "follow_up_question": "What else?"}
+
+    if novel:
+        fake_llm.response = _page_notes
+    fake_llm.structured["FollowupOutput"] = followup
+    fake_llm.structured["RatedQueryGenerationOutput"] = {"search_queries": ["same"], "complexity": 3}
+    config = {"configurable": {"adaptive_depth": True, "num_queries": 1, "num_results_per_query": 2, "max_followup_retries": 3}}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    if novel:
+        assert len(judged) == 3
+        assert "stopped_by_low_novelty" not in result["run_stats"]
+    else:
+        # the second round repeats the notes of the first, so it is not judged and no third round starts
+        assert len(judged) == 1
+        assert result["run_stats"]["stopped_by_low_novelty"] == 1
+        assert result["research_notes"].count("https://example.com/") == 4
+
+
+async def test_followup_stops_at_the_token_budget(fake_llm, stub_search) -> None:
+    judged = []
+    fake_llm.structured["FollowupOutput"] = lambda prompt: judged.append(prompt) or {"needs_followup": True}
+    config = {"configurable": {"max_followup_retries": 3, "max_run_tokens": 100}}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    # the first round already used more than half of the budget, so a second one would not fit
+    assert result["run_stats"]["stopped_by_token_budget"] == 1
+    assert judged == []
+
+
+async def test_the_run_ends_by_the_deadline(fake_llm, stub_search) -> None:
+    fake_llm.delay = 0.2
+    stub_search.delay = 0.1
+    fake_llm.structured["FollowupOutput"] = {"needs_followup": True, "follow_up_question": "What else?"}
+    config = {"configurable": {"max_followup_retries": 5, "deadline": 1.5}}
+
+    start = time.perf_counter()
+    result = await graph.ainvoke(INPUT, config)
+
+    assert time.perf_counter() - start < 1.5
+    assert result["final_report"]
+    assert result["run_stats"]["stopped_by_deadline"] == 1
+
+
+async def test_slow_stages_are_cut_short_at_the_deadline(fake_llm, stub_search) -> None:
+    # summaries never finish in time, and the report is written one word every 50ms
+    fake_llm.delay = lambda prompt: 5.0 if "Page " in prompt else 0.0
+    fake_llm.token_delay = 0.05
+    fake_llm.response = " ".join(["word"] * 100)
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 2, "deadline": 1.0}}
+
+    start = time.perf_counter()
+    result = await graph.ainvoke(INPUT, config)
+
+    assert time.perf_counter() - start < 1.2
+    assert result["run_stats"]["deadline_skipped_sources"] == 4
+    assert result["run_stats"]["truncated_reports"] == 1
+    assert 0 < len(result["final_report"].split()) < 100
+
+
+async def test_notes_are_cut_to_whole_notes_without_the_time_to_merge_them(fake_llm, stub_search) -> None:
+    # merging the notes into section digests never finishes in time
+    fake_llm.delay = lambda prompt: 5.0 if "section digest" in prompt else 0.0
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 4, "report_notes_budget": 60, "deadline": 1.0}}
+
+    start = time.perf_counter()
+    result = await graph.ainvoke(INPUT, config)
+
+    assert time.perf_counter() - start < 1.2
+    notes = result["research_notes"]
+    assert 0 < notes.count("https://example.com/") < 8
+    # every source left in the notes keeps its points
+    assert notes.count("https://example.com/") == notes.count("- A point from the source.")
+    assert count_tokens(notes, "gpt-4.1-nano") <= 60
+    assert result["run_stats"]["note_sections"] == 0
+
+
+async def test_building_the_local_index_is_cut_short_at_the_deadline(fake_llm, tmp_path, monkeypatch) -> None:
+    (tmp_path / "documents").mkdir()
+    (tmp_path / "documents" / "reefs.md").write_text("Coral reefs host a quarter of marine species.")
+    build_index = agent.search.build_index
+    monkeypatch.setattr(agent.search, "build_index", lambda *args: time.sleep(1.5) or build_index(*args))
+    config = {"configurable": {
+        "search_backend": "local",
+        "local_documents_path": str(tmp_path / "documents"),
+        "local_index_path": str(tmp_path / "index"),
+        "deadline": 1.0,
+    }}
+
+    start = time.perf_counter()
+    result = await graph.ainvoke(INPUT, config)
+
+    assert time.perf_counter() - start < 1.2
+    assert result["final_report"] and result["research_notes"] == ""
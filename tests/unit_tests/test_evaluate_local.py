@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from evaluate_local import evaluate, format_table, load_examples
+
+pytestmark = pytest.mark.anyio
+
+CONFIG = {"num_queries": 1, "num_results_per_query": 1}
+
+
+@pytest.fixture
+def examples(tmp_path):
+    path = tmp_path / "examples.jsonl"
+    path.write_text(
+        json.dumps({"id": "reefs", "messages": [{"role": "user", "content": "coral reefs"}]}) + "\n\n"
+        + json.dumps({"messages": [{"role": "user", "content": "deep sea vents"}]}) + "\n"
+    )
+    return load_examples(path)
+
+
+async def test_results_are_cached_until_the_inputs_change(fake_llm, stub_search, examples, tmp_path) -> None:
+    cache_path = str(tmp_path / "evaluation.sqlite")
+
+    first = await evaluate(examples, CONFIG, cache_path, concurrency=2)
+    calls = len(fake_llm.prompts)
+    second = await evaluate(examples, CONFIG, cache_path, concurrency=2)
+
+    assert [r["id"] for r in first] == ["reefs", "3"]
+    assert [r["cached"] for r in first] == [False, False]
+    assert [r["cached"] for r in second] == [True, True]
+    assert len(fake_llm.prompts) == calls
+    assert second[0]["grounding_and_accuracy"] == first[0]["grounding_and_accuracy"] == 0.6
+    assert second[0]["latency"] == first[0]["latency"]
+
+    changed = await evaluate(examples, {**CONFIG, "num_queries": 2}, cache_path, concurrency=2)
+    assert [r["cached"] for r in changed] == [False, False]
+    assert len(fake_llm.prompts) > calls
+
+
+async def test_examples_run_concurrently(fake_llm, stub_search, examples) -> None:
+    fake_llm.delay = 0.2
+
+    results = await evaluate(examples, CONFIG, cache_path="", concurrency=2)
+    sequential = await evaluate(examples, CONFIG, cache_path="", concurrency=1)
+
+    assert sum(r["latency"] for r in results) > 0
+    assert max(r["latency"] for r in results) < sum(r["latency"] for r in sequential)
+    assert len(format_table(results).splitlines()) == 2 + len(results) + 2
+
+
+async def test_clarification_messages_reach_only_the_evaluator(fake_llm, stub_search) -> None:
+    example = {"id": "reefs", "messages": [
+        {"role": "user", "content": "coral reefs"},
+        {"role": "assistant", "content": "Which reefs?"},
+        {"role": "user", "content": "The Great Barrier Reef"},
+    ]}
+
+    results = await evaluate([example], CONFIG, cache_path="")
+
+    assert results[0]["mean_score"] == 0.6
+    # the agent researches the topic, and only the judge, which is called last, sees the whole exchange
+    *agent_prompts, judge_prompt = fake_llm.prompts
+    assert "coral reefs" in agent_prompts[0]
+    assert not any("The Great Barrier Reef" in p for p in agent_prompts)
+    assert "Which reefs?\nThe Great Barrier Reef" in judge_prompt
@@ -0,0 +1,40 @@
+import pytest
+
+from agent.dedupe import normalize_url
+from agent.graph import graph
+from agent.utils import get_search_results
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_each_followup_round_reads_only_new_notes(fake_llm, stub_search) -> None:
+    rounds = iter([True, True, False])
+    followup_prompts = []
+
+    def followup(prompt):
+        followup_prompts.append(prompt)
+        return {"needs_followup": next(rounds), "digest": f"digest after round {len(followup_prompts)}"}
+
+    fake_llm.structured["FollowupOutput"] = followup
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["same"]}
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 2, "max_followup_retries": 3}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    assert len(followup_prompts) == 3
+    for i, prompt in enumerate(followup_prompts):
+        urls = {f"https://example.com/same/{j}" for j in range(6) if f"https://example.com/same/{j}" in prompt}
+        # every round sends the two new pages in full and the earlier pages only through the digest
+        assert urls == {f"https://example.com/same/{2 * i}", f"https://example.com/same/{2 * i + 1}"}
+        assert (f"digest after round {i}" in prompt) == (i > 0)
+    # no round follows the last one, so it does not update the digest
+    assert ['"digest"' in p for p in followup_prompts] == [True, True, False]
+    assert result["research_notes"].count("https://example.com/same/") == 6
+    assert result["research_digest"] == ""
+    assert result["num_judged_notes"] == 0
+
+
+def test_search_skips_covered_urls(stub_search) -> None:
+    results = get_search_results("query", 2, exclude_urls={normalize_url("https://www.example.com/query/0/")})
+
+    assert [r["url"] for r in results] == ["https://example.com/query/1", "https://example.com/query/2"]
@@ -0,0 +1,60 @@
+import pytest
+
+from agent.graph import graph, make_graph
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+def test_disabled_stages_are_left_out_of_the_graph() -> None:
+    default = make_graph()
+    full = make_graph({"configurable": {"max_clarification_retries": 1, "max_followup_retries": 1, "summarize_mode": "batch"}})
+
+    assert "clarification" not in default.nodes
+    assert "followup" not in default.nodes
+    assert "summarize_batch" not in default.nodes
+    assert {"clarification", "followup", "summarize_batch"} <= set(full.nodes)
+    assert set(full.nodes) == set(graph.nodes)
+    # variants are compiled once
+    assert make_graph({"configurable": {"num_queries": 5}}) is default
+
+
+async def test_default_variant_produces_the_same_report(fake_llm, stub_search) -> None:
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 2}}
+
+    expected = await graph.ainvoke(INPUT, config)
+    result = await make_graph(config).ainvoke(INPUT, config)
+
+    assert result["final_report"] == expected["final_report"]
+    assert result["research_notes"] == expected["research_notes"]
+    assert result["topic"] == ""
+    assert set(result["metrics"]["nodes"]) == set(expected["metrics"]["nodes"]) - {"clarification", "followup"}
+
+
+async def test_default_variant_reduces_per_run_overhead(fake_llm, stub_search) -> None:
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 1, "summary_cache": False}}
+    variant = make_graph(config)
+
+    async def node_runs(agent):
+        calls = len(fake_llm.prompts)
+        updates = [u async for u in agent.astream(INPUT, config, stream_mode="updates")]
+        return [node for update in updates for node in update], len(fake_llm.prompts) - calls
+
+    full, full_calls = await node_runs(graph)
+    reduced, reduced_calls = await node_runs(variant)
+
+    # the variant skips the steps of the stages that would do nothing, and makes the same LLM calls
+    assert set(full) - set(reduced) == {"clarification", "followup"}
+    assert len(reduced) == len(full) - 2
+    assert reduced_calls == full_calls
+
+
+async def test_search_without_results_goes_to_the_report(fake_llm, stub_search) -> None:
+    stub_search.num_results = 0
+    config = {"configurable": {"num_queries": 1}}
+
+    result = await make_graph(config).ainvoke(INPUT, config)
+
+    assert result["final_report"] == fake_llm.response
+    assert "summarize" not in result["metrics"]["nodes"]
@@ -0,0 +1,84 @@
+import json
+import threading
+
+import pytest
+
+import agent.metrics
+from agent.graph import graph
+from agent.metrics import format_prometheus, merge_metrics
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+async def test_run_records_node_and_llm_metrics(fake_llm, stub_search, tmp_path) -> None:
+    fake_llm.delay = 0.05
+    path = tmp_path / "metrics.jsonl"
+    config = {"configurable": {"num_queries": 2, "num_results_per_query": 2, "metrics_path": str(path)}}
+
+    state = await graph.ainvoke(INPUT, config)
+    metrics = state["metrics"]
+
+    nodes = metrics["nodes"]
+    assert {"clarification", "query_generation", "search_results_extraction", "summarize", "followup", "final_report"} <= set(nodes)
+    assert nodes["summarize"]["runs"] == 4
+    assert nodes["summarize"]["llm"]["calls"] == 4
+    assert nodes["summarize"]["wall_time"] >= 4 * 0.05
+    assert nodes["summarize"]["max_wall_time"] < nodes["summarize"]["wall_time"]
+    assert nodes["final_report"]["llm"]["output_tokens"] > 0
+    assert nodes["final_report"]["llm"]["max_time_to_first_token"] > 0
+    assert nodes["search_results_extraction"]["llm"]["calls"] == 0
+
+    total = metrics["total"]["llm"]
+    assert total["calls"] == sum(n["llm"]["calls"] for n in nodes.values())
+    assert total["input_tokens"] == sum(n["llm"]["input_tokens"] for n in nodes.values())
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(records) == sum(n["runs"] for n in nodes.values())
+    assert {r["node"] for r in records} == set(nodes)
+    assert all(c["output_tokens"] > 0 for r in records for c in r["llm_calls"])
+
+
+async def test_metrics_files_are_written_off_the_event_loop(fake_llm, stub_search, tmp_path, monkeypatch) -> None:
+    threads = []
+    write = agent.metrics.write_metrics
+    monkeypatch.setattr(agent.metrics, "write_metrics", lambda *args: threads.append(threading.current_thread()) or write(*args))
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 1, "metrics_path": str(tmp_path / "metrics.jsonl")}}
+
+    await graph.ainvoke(INPUT, config)
+
+    assert threads and threading.current_thread() not in threads
+
+
+async def test_metrics_start_over_for_a_new_topic(fake_llm, stub_search) -> None:
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    agent = graph.builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "1", "num_queries": 1, "num_results_per_query": 1}}
+
+    first = await agent.ainvoke(INPUT, config)
+    second = await agent.ainvoke({"messages": [{"role": "user", "content": "deep sea vents"}]}, config)
+
+    assert first["metrics"]["nodes"]["summarize"]["runs"] == 1
+    assert second["metrics"]["nodes"]["summarize"]["runs"] == 1
+
+
+def test_merge_metrics_sums_and_keeps_maximums() -> None:
+    merged = merge_metrics(
+        {"nodes": {"a": {"runs": 1, "wall_time": 1.0, "max_wall_time": 1.0}}},
+        {"nodes": {"a": {"runs": 1, "wall_time": 3.0, "max_wall_time": 3.0}, "b": {"runs": 1}}},
+    )
+    assert merged == {"nodes": {"a": {"runs": 2, "wall_time": 4.0, "max_wall_time": 3.0}, "b": {"runs": 1}}}
+
+
+def test_format_prometheus() -> None:
+    llm = {
+        "calls": 2, "wall_time": 1.5, "max_wall_time": 1.0, "queue_time": 0.25, "max_queue_time": 0.25,
+        "max_time_to_first_token": 0.5, "input_tokens": 100, "output_tokens": 20, "cost": 0.001,
+    }
+    text = format_prometheus({"nodes": {"summarize": {"runs": 2, "wall_time": 1.5, "max_wall_time": 1.0, "llm": llm}}})
+
+    assert 'deep_research_llm_calls_total{node="summarize"} 2\n' in text
+    assert 'deep_research_llm_tokens_total{node="summarize",type="input"} 100\n' in text
+    assert 'deep_research_node_wall_seconds_max{node="summarize"} 1.000000\n' in text
@@ -0,0 +1,41 @@
+from agent.state import Note
+from agent.utils import _format_notes, format_research_notes
+
+
+def _reference_format(notes):
+    """The original concatenation-based formatting, kept to check the output format."""
+    result = ""
+    for source in notes:
+        content = '\n'.join([line for line in source['notes'].splitlines() if line.strip()])
+        result += '\n' + source['title'] + ' (' + source['url'] + '):' + '\n' + content + '\n'
+    return result
+
+
+def _summaries(n):
+    return [
+        {"title": f"Title {i}", "url": f"https://example.com/{i}", "notes": f"- point one of {i}\n\n- point two of {i}\n  \n"}
+        for i in range(n)
+    ]
+
+
+def test_notes_are_cleaned_once_and_formatted_like_before() -> None:
+    summaries = _summaries(3)
+    notes = [Note.from_summary(s["title"], s["url"], s["notes"]) for s in summaries]
+
+    assert notes[0].text == "- point one of 0\n- point two of 0"
+    assert format_research_notes(notes) == _reference_format(summaries)
+    assert format_research_notes([]) == ""
+
+
+def test_formatting_thousands_of_notes_is_memoized() -> None:
+    notes = [Note.from_summary(s["title"], s["url"], s["notes"]) for s in _summaries(5000)]
+    _format_notes.cache_clear()
+
+    first = format_research_notes(notes)
+    second = format_research_notes(list(notes))
+
+    assert first.count("https://example.com/") == 5000
+    # the same notes, even in a new list, reuse the formatted string
+    assert second is first
+    assert _format_notes.cache_info().hits == 1 and _format_notes.cache_info().misses == 1
+    assert format_research_notes(notes[:-1]) != first
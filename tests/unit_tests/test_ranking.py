@@ -0,0 +1,105 @@
+import random
+import time
+
+import pytest
+
+from agent.content import load_content, store_contents
+from agent.graph import graph, rank_sources
+from agent.ranking import bm25_scores, select_relevant_sources
+
+pytestmark = pytest.mark.anyio
+
+TOPIC = "How does rising ocean temperature cause coral reef bleaching?"
+QUERIES = ["coral bleaching ocean temperature", "coral reef heat stress zooxanthellae"]
+
+RELEVANT = [
+    "Coral bleaching happens when corals under heat stress expel the zooxanthellae algae living in their tissue.",
+    "Marine heatwaves raised ocean temperature above the bleaching threshold on the Great Barrier Reef in 2016 and 2017.",
+    "Reef monitoring shows that a sea temperature rise of 1C above the summer maximum for four weeks causes coral bleaching.",
+    "Without their symbiotic algae, bleached corals lose their color and most of their energy supply, and many die.",
+    "Scientists link the frequency of mass coral bleaching events to warming ocean temperature driven by climate change.",
+]
+
+DISTRACTOR_TOPICS = [
+    "sourdough bread recipe flour yeast oven baking",
+    "football league match goal striker transfer season",
+    "smartphone camera battery screen processor review",
+    "stock market index earnings investors interest rates",
+    "mountain hiking trail boots backpack camping",
+    "electric car charging range battery price",
+    "guitar chords practice lessons songs beginners",
+    "garden tomato soil watering compost seeds",
+    "airline flight delays luggage airport travel",
+]
+
+
+def _corpus(num_distractors, words=60, seed=0):
+    rng = random.Random(seed)
+    sources = []
+    for i, text in enumerate(RELEVANT):
+        sources.append({"title": f"Coral article {i}", "url": f"https://reef.example/{i}", "content": text})
+    for i in range(num_distractors):
+        vocabulary = DISTRACTOR_TOPICS[i % len(DISTRACTOR_TOPICS)].split()
+        text = " ".join(rng.choice(vocabulary) for _ in range(words))
+        # some distractors mention the topic in passing
+        if i % 4 == 0:
+            text += " the ocean view was beautiful"
+        sources.append({"title": f"Article {i}", "url": f"https://other.example/{i}", "content": text})
+    rng.shuffle(sources)
+    return sources
+
+
+def test_top_k_recall_on_fixed_corpus() -> None:
+    sources = _corpus(45)
+    query = "\n".join([TOPIC] + QUERIES)
+
+    kept = select_relevant_sources(sources, query, max_sources=len(RELEVANT))
+
+    recall = sum(s["url"].startswith("https://reef.example/") for s in kept) / len(RELEVANT)
+    assert recall == 1.0
+    # results keep their original relative order
+    positions = [sources.index(s) for s in kept]
+    assert positions == sorted(positions)
+
+
+def test_threshold_drops_unrelated_sources() -> None:
+    sources = _corpus(20)
+
+    kept = select_relevant_sources(sources, "\n".join([TOPIC] + QUERIES), threshold=0.2)
+
+    assert {s["url"] for s in kept} == {f"https://reef.example/{i}" for i in range(len(RELEVANT))}
+
+
+def test_ranking_latency_on_large_corpus() -> None:
+    sources = _corpus(300, words=2000)
+
+    start = time.perf_counter()
+    bm25_scores([s["content"] for s in sources], "\n".join([TOPIC] + QUERIES))
+    elapsed = time.perf_counter() - start
+
+    # ~600k words; ranking must stay far cheaper than a single LLM summary
+    assert elapsed < 2.0
+
+
+async def test_rank_sources_node_keeps_relevant_passages() -> None:
+    source = {
+        "query": QUERIES[0], "title": "Long page", "url": "https://reef.example/long",
+        "content": "\n".join(["unrelated navigation menu text " * 40] * 10 + [RELEVANT[0]] + ["footer links " * 80] * 5),
+    }
+    state = {"topic": TOPIC, "queries": QUERIES, "search_results": store_contents([source])}
+
+    update = await rank_sources(state, {"configurable": {"relevant_passages": 1}})
+
+    content = load_content(update["search_results"][0])
+    assert RELEVANT[0] in content
+    assert "footer links" not in content
+    assert len(content) < len(source["content"]) / 4
+
+
+async def test_graph_summarizes_only_top_sources(fake_llm, stub_search) -> None:
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 2, "max_sources": 2}}
+
+    result = await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    assert result["run_stats"]["irrelevant_sources"] == 4
+    assert result["run_stats"]["summary_cache_misses"] == 2
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+from agent.graph import graph
+from agent.ratelimit import RateLimiter, TokenBucket, get_rate_limiter
+from agent.utils import acall_llm
+
+pytestmark = pytest.mark.anyio
+
+
+def _rate_limit_error(retry_after="0.1"):
+    response = httpx.Response(
+        429, request=httpx.Request("POST", "http://localhost/v1/chat/completions"), headers={"retry-after": retry_after}
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+async def test_concurrency_limit_queues_calls(fake_llm) -> None:
+    fake_llm.delay = 0.1
+    limiter = RateLimiter(max_concurrency=2)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[acall_llm("gpt-4.1-nano", "prompt", limiter=limiter) for _ in range(6)])
+    elapsed = time.perf_counter() - start
+
+    assert 0.28 < elapsed < 0.6
+    assert limiter.stats["calls"] == 6
+    assert limiter.stats["queued_calls"] == 4
+    assert limiter.stats["max_wait"] > 0.15
+
+
+async def test_token_bucket_waits_for_refill() -> None:
+    bucket = TokenBucket(600) # refills 10 units per second
+
+    start = time.perf_counter()
+    await bucket.acquire(600)
+    await bucket.acquire(3)
+    elapsed = time.perf_counter() - start
+
+    assert 0.25 < elapsed < 0.5
+
+
+async def test_requests_per_minute_limit() -> None:
+    limiter = RateLimiter(requests_per_minute=600)
+    limiter._requests.level = 0
+
+    start = time.perf_counter()
+    for _ in range(3):
+        async with limiter.limit():
+            pass
+    elapsed = time.perf_counter() - start
+
+    assert 0.25 < elapsed < 0.5
+
+
+async def test_rate_limit_errors_are_retried_with_backoff(fake_llm) -> None:
+    errors = [_rate_limit_error(), _rate_limit_error()]
+
+    def respond(prompt):
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    fake_llm.response = respond
+    limiter = RateLimiter(max_concurrency=4)
+
+    start = time.perf_counter()
+    response = await acall_llm("gpt-4.1-nano", "prompt", limiter=limiter)
+    elapsed = time.perf_counter() - start
+
+    assert response.text == "ok"
+    assert limiter.stats["rate_limit_errors"] == 2
+    # each retry honors the 0.1s Retry-After header
+    assert elapsed >= 0.2
+
+
+async def test_rate_limit_error_is_raised_after_max_retries(fake_llm) -> None:
+    def respond(prompt):
+        raise _rate_limit_error("0")
+
+    fake_llm.response = respond
+
+    with pytest.raises(openai.RateLimitError):
+        await acall_llm("gpt-4.1-nano", "prompt", limiter=RateLimiter(max_retries=2))
+
+
+async def test_graph_llm_calls_share_the_configured_limiter(fake_llm, stub_search) -> None:
+    fake_llm.delay = 0.1
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 2, "max_concurrent_llm_calls": 2}}
+
+    await graph.ainvoke({"messages": [{"role": "user", "content": "topic"}]}, config)
+
+    stats = get_rate_limiter(2, 0, 0, 5).stats
+    # query generation, six summaries and the final report
+    assert stats["calls"] == 8
+    assert stats["queued_calls"] >= 4
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from agent.graph import search_results_extraction
+from agent.utils import get_all_search_results
+
+pytestmark = pytest.mark.anyio
+
+QUERIES = [f"query {i}" for i in range(6)]
+
+
+async def test_queries_run_concurrently_in_query_order(stub_search) -> None:
+    # later queries finish first, but the results stay in query order
+    stub_search.delay = lambda query: 0.3 - 0.04 * int(query.split()[-1])
+
+    start = time.perf_counter()
+    results = await get_all_search_results(QUERIES, 2, max_concurrency=6)
+    elapsed = time.perf_counter() - start
+
+    assert [r["query"] for r in results] == [q for q in QUERIES for _ in range(2)]
+    # sequential search would take ~1.2s
+    assert elapsed < 0.6
+
+
+async def test_concurrency_cap_limits_parallel_queries(stub_search) -> None:
+    stub_search.delay = 0.2
+
+    start = time.perf_counter()
+    await get_all_search_results(QUERIES, 2, max_concurrency=2)
+    elapsed = time.perf_counter() - start
+
+    # three waves of two queries
+    assert 0.55 < elapsed < 1.0
+
+
+async def test_slow_queries_time_out_without_results(stub_search) -> None:
+    stub_search.delay = lambda query: 1.0 if query == "query 1" else 0.0
+
+    start = time.perf_counter()
+    results = await get_all_search_results(QUERIES[:3], 1, timeout=0.2)
+    elapsed = time.perf_counter() - start
+
+    assert [r["query"] for r in results] == ["query 0", "query 2"]
+    assert elapsed < 0.6
+
+
+async def test_search_results_extraction_uses_configured_concurrency(stub_search) -> None:
+    stub_search.delay = 0.2
+    config = {"configurable": {"num_results_per_query": 1, "search_concurrency": 6}}
+
+    start = time.perf_counter()
+    update = await search_results_extraction({"queries": QUERIES}, config)
+    elapsed = time.perf_counter() - start
+
+    assert [r["query"] for r in update["search_results"]] == QUERIES
+    assert elapsed < 0.5
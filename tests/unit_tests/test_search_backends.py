@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+
+import agent.search
+from agent.graph import graph
+from agent.search import (
+    LocalIndexSearch,
+    build_index,
+    get_search_backend,
+    read_index_metadata,
+)
+from agent.utils import get_search_results
+
+DOCUMENTS = {
+    "reefs.md": "# Coral reefs\nCoral bleaching is caused by warming oceans. Bleached corals lose their algae.",
+    "vents/deep.txt": "Deep sea vents\nHydrothermal vents support life without sunlight.",
+    "forests.html": "<html><title>Kelp forests</title><style>p {}</style><p>Kelp forests shelter fish near coral reefs.</p></html>",
+    "notes.bin": "coral coral coral",
+}
+
+
+@pytest.fixture
+def documents(tmp_path):
+    root = tmp_path / "documents"
+    for name, text in DOCUMENTS.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(text)
+    return root
+
+
+def test_local_index_ranks_documents_with_bm25(documents, tmp_path) -> None:
+    assert build_index(documents, tmp_path / "index") == 3
+    backend = LocalIndexSearch(tmp_path / "index")
+
+    results = backend.search("coral bleaching", 5)
+
+    assert [r["title"] for r in results] == ["Coral reefs", "Kelp forests"]
+    assert results[0]["url"] == (documents / "reefs.md").as_uri()
+    assert results[0]["content"].startswith("# Coral reefs")
+    assert "<p>" not in results[1]["content"] and "p {}" not in results[1]["content"]
+    assert backend.search("coral", 1) == results[:1]
+    assert backend.search("volcanoes", 5) == []
+
+
+def test_local_index_is_memory_mapped_and_rebuilt_when_documents_change(documents, tmp_path) -> None:
+    index = tmp_path / "index"
+    backend = LocalIndexSearch(index, documents)
+    assert isinstance(backend.postings, np.memmap)
+    assert backend.search("kelp", 5)[0]["title"] == "Kelp forests"
+
+    # an unchanged corpus reuses the index
+    mtime = (index / "index.json").stat().st_mtime_ns
+    LocalIndexSearch(index, documents)
+    assert (index / "index.json").stat().st_mtime_ns == mtime
+
+    (documents / "seagrass.txt").write_text("Seagrass meadows store carbon.")
+    assert LocalIndexSearch(index, documents).search("seagrass", 5)[0]["title"] == "Seagrass meadows store carbon."
+
+
+
+def test_an_open_index_is_rebuilt_when_documents_change(documents, tmp_path, monkeypatch) -> None:
+    backend = get_search_backend("local", tmp_path / "index", documents)
+    assert backend.search("seagrass", 5) == []
+
+    (documents / "seagrass.txt").write_text("Seagrass meadows store carbon.")
+    # the documents are only checked again after the interval
+    assert get_search_backend("local", tmp_path / "index", documents) is backend
+
+    monkeypatch.setattr(agent.search, "FINGERPRINT_INTERVAL", 0.0)
+    rebuilt = get_search_backend("local", tmp_path / "index", documents)
+    assert rebuilt.search("seagrass", 5)[0]["title"] == "Seagrass meadows store carbon."
+    assert get_search_backend("local", tmp_path / "index", documents) is rebuilt
+
+def test_a_rebuild_never_mixes_metadata_and_arrays_of_different_builds(documents, tmp_path) -> None:
+    index = tmp_path / "index"
+    build_index(documents, index)
+    opened = LocalIndexSearch(index)
+    first = read_index_metadata(index)["build"]
+
+    (documents / "seagrass.txt").write_text("Seagrass meadows store carbon.")
+    build_index(documents, index)
+    # a reader that read the metadata just before the rebuild can still load the arrays it names
+    assert (index / f"postings.{first}.npy").exists()
+    assert opened.search("coral", 5) and len(opened.lengths) == len(opened.documents) == 3
+
+    build_index(documents, index)
+    assert not (index / f"postings.{first}.npy").exists()
+    assert len(list(index.glob("postings.*.npy"))) == 2
+    reopened = LocalIndexSearch(index)
+    assert len(reopened.lengths) == len(reopened.documents) == 4
+
+
+def test_missing_index_without_documents(tmp_path) -> None:
+    with pytest.raises(FileNotFoundError):
+        get_search_backend("local", tmp_path / "index")
+
+
+def test_search_cache_keeps_backends_apart(documents, tmp_path, stub_search) -> None:
+    from agent.cache import SQLiteCache
+
+    cache = SQLiteCache(str(tmp_path / "search.sqlite"))
+    local = get_search_backend("local", tmp_path / "index", documents)
+
+    web = get_search_results("coral", 1, cache)
+    assert get_search_results("coral", 1, cache, backend=local)[0]["url"].startswith("file://")
+    assert get_search_results("coral", 1, cache) == web
+    cache.close()
+
+
+@pytest.mark.anyio
+async def test_graph_researches_local_documents(fake_llm, documents, tmp_path) -> None:
+    fake_llm.structured["QueryGenerationOutput"] = {"search_queries": ["coral bleaching"]}
+    config = {"configurable": {
+        "search_backend": "local",
+        "local_documents_path": str(documents),
+        "local_index_path": str(tmp_path / "index"),
+        "num_queries": 1,
+    }}
+
+    state = await graph.ainvoke({"messages": [{"role": "user", "content": "coral reefs"}]}, config)
+
+    assert f"Coral reefs ({(documents / 'reefs.md').as_uri()})" in state["research_notes"]
+    assert f"Kelp forests ({(documents / 'forests.html').as_uri()})" in state["research_notes"]
+    assert "Deep sea vents" not in state["research_notes"]
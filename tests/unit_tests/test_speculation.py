@@ -0,0 +1,49 @@
+import pytest
+
+from agent.graph import graph
+
+pytestmark = pytest.mark.anyio
+
+INPUT = {"messages": [{"role": "user", "content": "coral reefs"}]}
+
+
+async def test_speculative_queries_overlap_the_clarification_check(fake_llm, stub_search) -> None:
+    fake_llm.delay = 0.5
+    base = {"num_queries": 1, "num_results_per_query": 1, "max_clarification_retries": 1}
+
+    result = await graph.ainvoke(INPUT, {"configurable": {**base, "speculative_queries": True}})
+    expected = await graph.ainvoke(INPUT, {"configurable": base})
+
+    assert result["final_report"] == expected["final_report"]
+    assert result["queries"] == expected["queries"]
+    assert result["run_stats"]["used_speculations"] == 1
+    assert "query_generation" not in result["metrics"]["nodes"]
+    assert result["metrics"]["nodes"]["clarification"]["llm"]["calls"] == 2
+    # the clarification check and query generation take one delay together instead of two in sequence
+    nodes, sequential = result["metrics"]["nodes"], expected["metrics"]["nodes"]
+    assert nodes["clarification"]["wall_time"] < sequential["clarification"]["wall_time"] + sequential["query_generation"]["wall_time"] - fake_llm.delay / 2
+
+
+async def test_speculative_search_skips_the_first_search_node(fake_llm, stub_search) -> None:
+    config = {"configurable": {
+        "num_queries": 2, "num_results_per_query": 1, "max_clarification_retries": 1,
+        "speculative_queries": True, "speculative_search": True,
+    }}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    assert "search_results_extraction" not in result["metrics"]["nodes"]
+    assert len(stub_search.queries) == 2
+    assert result["research_notes"].count("https://example.com/") == 2
+
+
+async def test_speculation_is_discarded_when_clarification_is_needed(fake_llm, stub_search) -> None:
+    fake_llm.structured["ClarificationOutput"] = {"needs_clarification": True, "clarification_question": "Which reefs?"}
+    config = {"configurable": {"max_clarification_retries": 1, "speculative_queries": True, "speculative_search": True}}
+
+    result = await graph.ainvoke(INPUT, config)
+
+    assert result["messages"][-1].text == "Which reefs?"
+    assert result["run_stats"]["discarded_speculations"] == 1
+    assert not result.get("search_results")
+    assert "search_results_extraction" not in result["metrics"]["nodes"]
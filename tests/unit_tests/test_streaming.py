@@ -0,0 +1,42 @@
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agent.graph import graph
+
+pytestmark = pytest.mark.anyio
+
+REPORT = " ".join(f"word{i}" for i in range(20))
+
+
+async def test_final_report_streams_before_it_completes(fake_llm, stub_search) -> None:
+    fake_llm.delay = 0.1
+    fake_llm.token_delay = 0.05
+    fake_llm.response = REPORT
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 1}}
+
+    start = time.perf_counter()
+    first_token = None
+    custom_text = []
+    message_text = []
+    final_state = None
+    async for mode, payload in graph.astream(
+        {"messages": [{"role": "user", "content": "topic"}]}, config, stream_mode=["custom", "messages", "values"]
+    ):
+        if mode == "custom" and "final_report" in payload:
+            first_token = first_token or time.perf_counter() - start
+            custom_text.append(payload["final_report"])
+        elif mode == "messages" and payload[1]["langgraph_node"] == "final_report":
+            message_text.append(payload[0].text)
+        elif mode == "values":
+            final_state = payload
+    total = time.perf_counter() - start
+
+    assert "".join(custom_text) == REPORT
+    assert "".join(message_text) == REPORT
+    assert final_state["final_report"] == REPORT
+    assert isinstance(final_state["messages"][-1], AIMessage)
+    assert final_state["messages"][-1].text == REPORT
+    # the report takes ~1s to generate, and its first token arrives before most of it is written
+    assert first_token < total - 0.5
@@ -0,0 +1,94 @@
+import threading
+
+import pytest
+
+from agent.cache import SQLiteCache, SummaryCache, summary_cache_key
+from agent.config import Configuration
+from agent.graph import graph, summary_key
+from agent.prompts import notes_prompt
+
+pytestmark = pytest.mark.anyio
+
+
+def test_key_depends_on_model_prompt_and_content() -> None:
+    key = summary_cache_key("gpt-4.1-nano", "Summarize {search_result}", "content")
+
+    assert key == summary_cache_key("gpt-4.1-nano", "Summarize {search_result}", "content")
+    assert key != summary_cache_key("gpt-4.1-mini", "Summarize {search_result}", "content")
+    assert key != summary_cache_key("gpt-4.1-nano", "Summarize briefly {search_result}", "content")
+    assert key != summary_cache_key("gpt-4.1-nano", "Summarize {search_result}", "other content")
+
+
+def test_key_depends_on_the_topic_only_for_chunked_content() -> None:
+    configurable = Configuration(max_source_tokens=50)
+    short, long = "a short page", "a long page " * 100
+
+    # the chunks of a long page are selected by relevance to the topic, so its summary differs per topic
+    assert summary_key(short, notes_prompt, configurable, "reefs") == summary_key(short, notes_prompt, configurable, "forests")
+    assert summary_key(long, notes_prompt, configurable, "reefs") != summary_key(long, notes_prompt, configurable, "forests")
+
+
+def test_memory_tier_is_bounded() -> None:
+    cache = SummaryCache(max_size=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats == {"memory_hits": 2, "persistent_hits": 0, "misses": 1}
+
+
+def test_persistent_tier_survives_a_new_memory_tier(tmp_path) -> None:
+    path = str(tmp_path / "summaries.sqlite")
+    SummaryCache(persistent=SQLiteCache(path)).set("key", "- note")
+
+    cache = SummaryCache(persistent=SQLiteCache(path))
+    assert cache.get("key") == "- note"
+    assert cache.get("key") == "- note"
+    assert cache.stats == {"memory_hits": 1, "persistent_hits": 1, "misses": 0}
+
+
+async def test_the_persistent_tier_is_read_and_written_off_the_event_loop(tmp_path, monkeypatch) -> None:
+    path = str(tmp_path / "summaries.sqlite")
+    threads = []
+    monkeypatch.setattr(SQLiteCache, "get", lambda self, key, get=SQLiteCache.get: threads.append(threading.current_thread()) or get(self, key))
+    monkeypatch.setattr(SQLiteCache, "set", lambda self, key, value, set=SQLiteCache.set: threads.append(threading.current_thread()) or set(self, key, value))
+    await SummaryCache(persistent=SQLiteCache(path)).aset("key", "- note")
+
+    cache = SummaryCache(persistent=SQLiteCache(path))
+    assert await cache.aget("key") == "- note"
+    assert await cache.aget("key") == "- note"
+    assert await cache.aget("missing") is None
+    assert cache.stats == {"memory_hits": 1, "persistent_hits": 1, "misses": 1}
+    assert len(threads) == 3 and threading.main_thread() not in threads
+
+
+async def test_repeated_sources_skip_the_llm(fake_llm, stub_search) -> None:
+    inputs = {"messages": [{"role": "user", "content": "topic"}]}
+    config = {"configurable": {"num_queries": 3, "num_results_per_query": 2}}
+
+    first = await graph.ainvoke(inputs, config)
+    calls = len(fake_llm.prompts)
+    second = await graph.ainvoke(inputs, config)
+
+    assert (first["run_stats"]["summary_cache_hits"], first["run_stats"]["summary_cache_misses"]) == (0, 6)
+    assert (second["run_stats"]["summary_cache_hits"], second["run_stats"]["summary_cache_misses"]) == (6, 0)
+    # only query generation and the final report call the LLM again
+    assert len(fake_llm.prompts) - calls == 2
+    assert second["research_notes"] == first["research_notes"]
+
+
+
+async def test_summary_cache_can_be_disabled(fake_llm, stub_search) -> None:
+    inputs = {"messages": [{"role": "user", "content": "topic"}]}
+    config = {"configurable": {"num_queries": 1, "num_results_per_query": 2, "summary_cache": False}}
+
+    await graph.ainvoke(inputs, config)
+    calls = len(fake_llm.prompts)
+    second = await graph.ainvoke(inputs, config)
+
+    assert second["run_stats"]["summary_cache_hits"] == 0
+    assert second["run_stats"]["summary_cache_misses"] == 0
+    assert len(fake_llm.prompts) - calls == 4